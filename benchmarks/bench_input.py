@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+enjoy.input hot path benchmarks (run with asv, see asv.conf.json).
+
+All devices are fakes (see enjoy.fake) so the suite runs on machines
+without input hardware.
+"""
+
+import time
+import asyncio
+import threading
+
+from enjoy.input import (
+    InputDevice, InputEvent, EventType, Absolute, event_size, read_event,
+    event_stream, async_event_stream, active_keys, capabilities, find_gamepads
+)
+from enjoy.fake import fake_gamepad, fake_keyboard
+from enjoy.stats import LatencyStats, StreamStats
+
+from .common import NB_EVENTS, raw_events
+
+
+class Decode:
+    """Cost of read_event + InputEvent.from_struct (no syscall)"""
+
+    def setup(self):
+        self.data = raw_events()
+        self.chunks = [self.data[i:i + event_size]
+                       for i in range(0, len(self.data), event_size)]
+
+    def time_read_event_from_struct(self):
+        chunks = iter(self.chunks)
+        read = lambda fd, n: next(chunks)
+        for _ in range(NB_EVENTS):
+            InputEvent.from_struct(read_event(None, read=read))
+
+
+class Stream:
+    """event_stream/async_event_stream throughput over a fake device"""
+
+    number = 1
+    repeat = 20
+
+    def setup(self):
+        self.fake = fake_gamepad()
+        self.fake.open()
+        self.fake.emit_raw(raw_events())
+        self.fake.close_source()
+
+    def teardown(self):
+        self.fake.close()
+
+    def time_event_stream(self):
+        for _ in event_stream(self.fake.fileno()):
+            pass
+
+    def time_event_stream_instrumented(self):
+        stream = event_stream(self.fake.fileno(), latency=LatencyStats(),
+                              stats=StreamStats())
+        for _ in stream:
+            pass
+
+    def time_async_event_stream(self):
+        async def consume(fd):
+            async for _ in async_event_stream(fd, maxsize=NB_EVENTS + 1):
+                pass
+        asyncio.run(consume(self.fake.fileno()))
+
+
+class Wait:
+    """event_stream throughput with each wait strategy (events ready)"""
+
+    params = ['select', 'blocking', 'epoll', 'spin']
+    param_names = ['wait']
+    number = 1
+    repeat = 20
+
+    def setup(self, wait):
+        self.fake = fake_gamepad()
+        self.fake.open()
+        self.fake.emit_raw(raw_events())
+        self.fake.close_source()
+
+    def teardown(self, wait):
+        self.fake.close()
+
+    def time_event_stream(self, wait):
+        for _ in event_stream(self.fake.fileno(), wait=wait):
+            pass
+
+
+class WaitLatency:
+    """
+    Latency versus CPU cost of the wait strategies: a thread emits a
+    frame every ms while the stream consumes them
+    """
+
+    params = ['select', 'blocking', 'epoll', 'spin']
+    param_names = ['wait']
+    nb_frames = 500
+
+    def setup(self, wait):
+        fake = fake_gamepad()
+        latency = LatencyStats(clock=time.monotonic_ns)
+
+        def produce():
+            start = time.monotonic_ns()
+            for i in range(self.nb_frames):
+                delay = start + i * 1000000 - time.monotonic_ns()
+                if delay > 0:
+                    time.sleep(delay * 1e-9)
+                fake.emit([(EventType.EV_ABS, Absolute.ABS_X, i % 256)],
+                          timestamp=time.monotonic_ns())
+            fake.close_source()
+
+        with InputDevice(fake) as device:
+            producer = threading.Thread(target=produce)
+            cpu = time.thread_time()
+            producer.start()
+            for _ in event_stream(device.fileno(), latency=latency, wait=wait):
+                pass
+            cpu = time.thread_time() - cpu
+            producer.join()
+        self.latency = latency.delivery
+        self.cpu_per_event = cpu / self.latency.count
+
+    def track_latency_p50(self, wait):
+        return self.latency.percentile(50) * 1e-3
+    track_latency_p50.unit = 'us'
+
+    def track_latency_p99(self, wait):
+        return self.latency.percentile(99) * 1e-3
+    track_latency_p99.unit = 'us'
+
+    def track_cpu_per_event(self, wait):
+        return self.cpu_per_event * 1e6
+    track_cpu_per_event.unit = 'us'
+
+
+class Ioctl:
+    """Decoding of the ioctl based state and capability queries"""
+
+    def setup(self):
+        self.keyboard = InputDevice(fake_keyboard())
+        self.keyboard.open()
+        self.gamepad = InputDevice(fake_gamepad())
+        self.gamepad.open()
+        self.absolute = self.gamepad.absolute
+
+    def teardown(self):
+        self.keyboard.close()
+        self.gamepad.close()
+
+    def time_active_keys(self):
+        active_keys(self.keyboard)
+
+    def time_capabilities_keyboard(self):
+        capabilities(self.keyboard)
+
+    def time_capabilities_gamepad(self):
+        capabilities(self.gamepad)
+
+    def time_abs_attribute(self):
+        self.absolute.x
+
+    def time_abs_descriptor_attribute(self):
+        self.gamepad.absolute.x
+
+
+class Discovery:
+    """find_gamepads over N fake devices (half gamepads, half keyboards)"""
+
+    params = [1, 10, 100]
+    param_names = ['nb_devices']
+
+    def setup(self, nb_devices):
+        self.devices = [fake_gamepad() if i % 2 else fake_keyboard()
+                        for i in range(nb_devices)]
+
+    def time_find_gamepads(self, nb_devices):
+        for _ in find_gamepads(self.devices):
+            pass
+
+
+def timeraw_import_input():
+    return "import enjoy.input"
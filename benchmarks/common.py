@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Helpers shared by the benchmarks."""
+
+from enjoy.input import EventType, Absolute, Synchronization, event_struct
+
+# must fit in a pipe (64KiB) since the fake device is fed before reading
+NB_EVENTS = 2000
+
+
+def frames(nb_events=NB_EVENTS):
+    """(type, code, value) frames of one ABS_X change + SYN_REPORT"""
+    return [[(EventType.EV_ABS, Absolute.ABS_X, i % 256)]
+            for i in range(nb_events // 2)]
+
+
+def raw_events(nb_events=NB_EVENTS):
+    data = []
+    for i in range(nb_events // 2):
+        data.append(event_struct.pack(1, i, EventType.EV_ABS, Absolute.ABS_X, i % 256))
+        data.append(event_struct.pack(1, i, EventType.EV_SYN, Synchronization.SYN_REPORT, 0))
+    return b''.join(data)
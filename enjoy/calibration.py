@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Axis calibration: normalization, deadzone and hysteresis.
+
+:class:`AxisCalibration` precomputes, from the device absinfo, a scale
+and an offset per ABS code so normalizing a value is a multiply-add. It
+works over whole batches of InputEvent and drops events (and then empty
+frames) whose normalized value did not change enough::
+
+    calibration = AxisCalibration.from_device(pad, mode={Absolute.ABS_Z: UNIPOLAR})
+    for event in calibration.stream(event_stream(pad.fileno())):
+        ...   # ABS event values are floats in [-1, 1] (or [0, 1])
+"""
+
+from .input import EventType, Synchronization, Absolute, input_absinfo
+
+#: normalize to [-1, 1]
+SYMMETRIC = 'symmetric'
+#: normalize to [0, 1] (ex: triggers)
+UNIPOLAR = 'unipolar'
+
+_NB_CODES = Absolute.ABS_MAX + 1
+
+
+def _absinfo(info):
+    if isinstance(info, input_absinfo):
+        return input_absinfo.from_buffer_copy(info)
+    return input_absinfo(*info)
+
+
+class AxisCalibration(object):
+    """
+    Per axis normalization pipeline stage.
+
+    *abs_info*: {ABS code: input_absinfo (or equivalent sequence)}
+    *mode*: SYMMETRIC or UNIPOLAR, or a dict {code: mode} (default SYMMETRIC)
+    *deadzone*: fraction of the range around the rest position mapped to
+    the rest value (default: absinfo flat). Values outside are rescaled
+    so the output stays continuous.
+    *hysteresis*: minimum normalized change for an event to go through
+    (default: absinfo fuzz)
+    """
+
+    def __init__(self, abs_info, mode=SYMMETRIC, deadzone=None, hysteresis=None):
+        if deadzone is not None and not 0 <= deadzone < 1:
+            raise ValueError('deadzone must be in [0, 1[ (got {})'.format(deadzone))
+        self.abs_info = {code: _absinfo(info) for code, info in abs_info.items()}
+        self.mode = mode
+        self.deadzone = deadzone
+        self.hysteresis = hysteresis
+        self._scale = [None] * _NB_CODES
+        self._offset = [0.0] * _NB_CODES
+        self._low = [0.0] * _NB_CODES
+        self._dead = [0.0] * _NB_CODES
+        self._hyst = [0.0] * _NB_CODES
+        self._last = [None] * _NB_CODES
+        self._frame_empty = True
+        for code in self.abs_info:
+            self._compute(code)
+
+    @classmethod
+    def from_device(cls, device, codes=None, **kwargs):
+        """Calibration from the current device absinfo (all axes by default)"""
+        if codes is None:
+            codes = [code for code in device.capabilities.get(EventType.EV_ABS, ())
+                     if code < Absolute.ABS_MT_SLOT]
+        abs_info = {code: device.get_abs_info(code) for code in codes}
+        return cls(abs_info, **kwargs)
+
+    def _axis_mode(self, code):
+        if isinstance(self.mode, dict):
+            return self.mode.get(code, SYMMETRIC)
+        return self.mode
+
+    def _compute(self, code):
+        info = self.abs_info[code]
+        span = info.maximum - info.minimum
+        if span <= 0:
+            self._scale[code] = None
+            return
+        if self._axis_mode(code) == UNIPOLAR:
+            scale, offset, low = 1 / span, -info.minimum / span, 0.0
+        else:
+            scale = 2 / span
+            offset, low = -(info.maximum + info.minimum) / span, -1.0
+        self._scale[code], self._offset[code], self._low[code] = scale, offset, low
+        if self.deadzone is None:
+            dead = info.flat * scale
+            # a flat covering the whole range can't be rescaled: ignore it
+            self._dead[code] = dead if dead < 1 else 0.0
+        else:
+            self._dead[code] = self.deadzone
+        self._hyst[code] = info.fuzz * scale if self.hysteresis is None else self.hysteresis
+        self._last[code] = None
+
+    def normalize(self, code, value):
+        scale = self._scale[code]
+        if scale is None:
+            return value
+        result = value * scale + self._offset[code]
+        low = self._low[code]
+        dead = self._dead[code]
+        if low:
+            # symmetric: deadzone around 0
+            magnitude = abs(result)
+            if magnitude <= dead:
+                return 0.0
+            magnitude = min((magnitude - dead) / (1 - dead), 1.0)
+            return magnitude if result > 0 else -magnitude
+        if result <= dead:
+            return 0.0
+        return min((result - dead) / (1 - dead), 1.0)
+
+    def stream(self, events):
+        """
+        Generator of calibrated events. ABS events of calibrated axes get
+        their normalized value (float). Events which don't change the
+        normalized value more than the hysteresis are dropped, as well as
+        frames (SYN_REPORT) which end up empty
+        """
+        scales, offsets, lows = self._scale, self._offset, self._low
+        deads, hysts, lasts = self._dead, self._hyst, self._last
+        for event in events:
+            event_type = event.type
+            if event_type == EventType.EV_ABS:
+                code = event.code
+                scale = scales[code]
+                if scale is not None:
+                    # inlined normalize()
+                    value = event.value * scale + offsets[code]
+                    low, dead = lows[code], deads[code]
+                    if low:
+                        magnitude = -value if value < 0 else value
+                        if magnitude <= dead:
+                            value = 0.0
+                        else:
+                            magnitude = min((magnitude - dead) / (1 - dead), 1.0)
+                            value = magnitude if value > 0 else -magnitude
+                    elif value <= dead:
+                        value = 0.0
+                    else:
+                        value = min((value - dead) / (1 - dead), 1.0)
+                    last = lasts[code]
+                    if last is not None:
+                        delta = value - last
+                        if value == last or (-hysts[code] <= delta <= hysts[code]
+                                             and value not in (0.0, 1.0, low)):
+                            continue
+                    lasts[code] = value
+                    event = event._replace(value=value)
+            elif event_type == EventType.EV_SYN and \
+                    event.code == Synchronization.SYN_REPORT:
+                if self._frame_empty:
+                    continue
+                self._frame_empty = True
+                yield event
+                continue
+            self._frame_empty = False
+            yield event
+
+    def process(self, events):
+        """Calibrate a batch of events. Returns a list"""
+        return list(self.stream(events))
+
+    __call__ = process
+
+    def calibrate(self, device, code, minimum=None, maximum=None,
+                  fuzz=None, flat=None):
+        """
+        Change the calibration of an axis and write it to the device
+        (EVIOCSABS) so every client of the device benefits from it
+        """
+        info = self.abs_info.get(code)
+        info = _absinfo(device.get_abs_info(code) if info is None else info)
+        for name, value in (('minimum', minimum), ('maximum', maximum),
+                            ('fuzz', fuzz), ('flat', flat)):
+            if value is not None:
+                setattr(info, name, value)
+        device.set_abs_info(code, info)
+        self.abs_info[code] = info
+        self._compute(code)
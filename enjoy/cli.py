@@ -4,20 +4,35 @@
 # Copyright (c) 2021 Tiago Coutinho
 # Distributed under the GPLv3 license. See LICENSE for more info.
 
+import os
+import time
+import select
 import shutil
 import asyncio
+import functools
+import threading
+from typing import List
 
 import typer
 import beautifultable
 
-from enjoy.input import InputDevice, EventType, list_devices, async_event_stream
+from enjoy.input import (
+    InputDevice, EventType, Absolute, Synchronization, list_devices, event_stream,
+    async_event_stream, event_size, event_struct, code_name
+)
+from enjoy.fake import fake_gamepad
+from enjoy.drain import TimerDrain
+from enjoy.fanout import FanoutServer
+from enjoy.record import Recorder, device_metadata
+from enjoy.stats import LatencyStats, StreamStats
+from enjoy.uinput import VirtualDevice
 
 
 app = typer.Typer()
 
 
 def name(code):
-    return code.name.split("_", 1)[-1]
+    return code_name(code).split("_", 1)[-1]
 
 
 def names(codes, sep=" "):
@@ -25,15 +40,13 @@ def names(codes, sep=" "):
 
 
 def create_state(dev):
-    state = {}
+    state = {"events": 0, "rate": 0.0}
     for event_type, codes in dev.capabilities.items():
         if event_type == EventType.EV_KEY:
             state["keys"] = dev.active_keys
-            state["pressed"] = names(state["keys"])
         elif event_type == EventType.EV_ABS:
             state["abs"] = {
-                name(code): "{:3d}".format(dev.get_abs_info(code).value)
-                for code in codes
+                code: dev.get_abs_info(code).value for code in sorted(codes)
             }
         elif event_type == EventType.EV_FF:
             # TODO
@@ -41,16 +54,74 @@ def create_state(dev):
     return state
 
 
-def create_state_template(state):
-    template = []
+def update_state(state, event):
+    state["events"] += 1
+    if event.type == EventType.EV_KEY:
+        state["keys"].set(event.code, event.value)
+    elif event.type == EventType.EV_ABS:
+        state["abs"][event.code] = event.value
+
+
+def render_state(state):
+    parts = ["{:5.0f} ev/s".format(state["rate"])]
     if "abs" in state:
-        if "X" in state['abs']:
-            template.append("X: {abs[X]} Y:{abs[Y]} Z:{abs[Z]}")
-        if "RX" in state['abs']:
-            template.append("RX: {abs[RX]} RY:{abs[RY]} RZ:{abs[RZ]}")
+        parts.append(" ".join(
+            "{}:{:4d}".format(name(code), value) for code, value in state["abs"].items()
+        ))
     if "keys" in state:
-        template.append("{pressed}")
-    return " | ".join(template)
+        parts.append(names(state["keys"]))
+    return " | ".join(parts)
+
+
+class Renderer:
+    """
+    Render the state on the terminal at most *refresh* times per second.
+
+    :meth:`frame` is called at the end of each device frame (SYN_REPORT):
+    the state is rendered right away if the last render is old enough or
+    otherwise a render is scheduled so the last frame is never lost.
+    The event rate is refreshed every second.
+    """
+
+    CLEAR_LINE = "\r\x1b[0K"
+
+    def __init__(self, state, refresh=30.0):
+        self.state = state
+        self.period = 1 / refresh
+        self.last = 0.0
+        self.pending = None
+        self.rate_time = time.monotonic()
+        self.rate_events = 0
+
+    def start(self):
+        self.loop = asyncio.get_running_loop()
+        self.tick()
+
+    def tick(self):
+        now = time.monotonic()
+        events = self.state["events"]
+        self.state["rate"] = (events - self.rate_events) / (now - self.rate_time)
+        self.rate_time, self.rate_events = now, events
+        self.render()
+        self.loop.call_later(1, self.tick)
+
+    def frame(self):
+        if self.pending is not None:
+            return
+        delay = self.last + self.period - time.monotonic()
+        if delay <= 0:
+            self.render()
+        else:
+            self.pending = self.loop.call_later(delay, self.render)
+
+    def render(self):
+        if self.pending is not None:
+            self.pending.cancel()
+            self.pending = None
+        self.last = time.monotonic()
+        width = shutil.get_terminal_size().columns
+        line = render_state(self.state)[:width]
+        print(self.CLEAR_LINE + line, end="", flush=True)
 
 
 @app.command()
@@ -65,27 +136,436 @@ def table():
 
 
 @app.command()
-def listen(path: str):
-    CLEAR_LINE = "\r\x1b[0K"
+def listen(path: str, refresh: float = typer.Option(30.0, help="max renders per second")):
     async def event_loop():
+        renderer.start()
         async for event in async_event_stream(device.fileno()):
-            if event.type == EventType.EV_KEY:
-                keys = state["keys"]
-                (keys.add if event.value else keys.discard)(event.code)
-                state["pressed"] = names(keys)
-            elif event.type == EventType.EV_ABS:
-                state["abs"][name(event.code)] = f"{event.value:3d}"
-            elif event.type == EventType.EV_FF:
-                # TODO
-                pass
+            if event.type == EventType.EV_SYN:
+                if event.code == Synchronization.SYN_REPORT:
+                    renderer.frame()
             else:
-                continue
-            print(CLEAR_LINE + template.format(**state), end="", flush=True)
+                update_state(state, event)
 
     with InputDevice(path) as device:
         state = create_state(device)
-        template = create_state_template(state)
+        renderer = Renderer(state, refresh)
+        asyncio.run(event_loop())
+
+
+class Monitored:
+    """
+    A device watched by the monitor command. *source*: file object read
+    instead of *path* (ex: an enjoy.fake device)
+    """
+
+    def __init__(self, path, source=None):
+        self.path = path
+        self.device = InputDevice(path if source is None else source)
+        self.device.open()
+        try:
+            self.name = self.device.name
+            self.state = create_state(self.device)
+        except Exception:
+            self.device.close()
+            raise
+        self.last = ""
+        self.rate_time = time.monotonic()
+        self.rate_events = 0
+        self.task = None
+
+    async def run(self):
+        async for event in async_event_stream(self.device.fileno()):
+            if event.type != EventType.EV_SYN:
+                update_state(self.state, event)
+                self.last = "{} {} {}".format(
+                    name(event.type), name(event.code), event.value
+                )
+
+    def update_rate(self, now):
+        events = self.state["events"]
+        self.state["rate"] = (events - self.rate_events) / (now - self.rate_time)
+        self.rate_time, self.rate_events = now, events
+
+    def render(self, width):
+        state = self.state
+        line = "{:24.24} {:18.18} {:6.0f} ev/s | {:22.22}".format(
+            self.name, self.path, state["rate"], self.last
+        )
+        if "keys" in state:
+            line += " | " + names(state["keys"])
+        if "abs" in state:
+            line += " | " + " ".join(
+                "{}:{}".format(name(code), value) for code, value in state["abs"].items()
+            )
+        return line[:width]
+
+    def close(self):
+        if self.task is not None:
+            if not self.task.done():
+                self.task.cancel()
+            elif not self.task.cancelled():
+                # retrieve the error (ex: device unplugged)
+                self.task.exception()
+        self.device.close()
+
+
+class Monitor:
+    """
+    The devices of the monitor command: :meth:`scan` follows hotplug.
+    *open_device*: path -> Monitored (default: :class:`Monitored`)
+    """
+
+    def __init__(self, pattern="", list_devices=list_devices, open_device=Monitored):
+        self.pattern = pattern
+        self.list_devices = list_devices
+        self.open_device = open_device
+        self.devices = {}
+        # paths which didn't match the filter: {path: inode}
+        self.rejected = {}
+
+    def matches(self, path, device_name):
+        return not self.pattern or self.pattern in path or self.pattern in device_name
+
+    def scan(self):
+        """Drop gone devices and start watching the new ones (needs a running loop)"""
+        devices, rejected = self.devices, self.rejected
+        paths = set(self.list_devices())
+        for path in list(devices):
+            if path not in paths or devices[path].task.done():
+                devices.pop(path).close()
+        for path in set(rejected) - paths:
+            del rejected[path]
+        for path in sorted(paths - set(devices)):
+            try:
+                inode = os.stat(path).st_ino
+            except OSError:
+                continue
+            if rejected.get(path) == inode:
+                # same device as in the previous scans: don't query it again
+                continue
+            try:
+                monitored = self.open_device(path)
+            except OSError:
+                continue
+            if not self.matches(path, monitored.name):
+                monitored.close()
+                rejected[path] = inode
+                continue
+            monitored.task = asyncio.ensure_future(monitored.run())
+            devices[path] = monitored
+
+    def render(self, width, now):
+        lines = ["{} devices | {}".format(len(self.devices), time.strftime("%H:%M:%S"))]
+        for monitored in self.devices.values():
+            if now - monitored.rate_time >= 1:
+                monitored.update_rate(now)
+            lines.append(monitored.render(width))
+        return "\n".join(lines)
+
+    def close(self):
+        for monitored in self.devices.values():
+            monitored.close()
+        self.devices.clear()
+
+
+@app.command()
+def monitor(
+    pattern: str = typer.Option(
+        "", "--filter", help="only devices whose name or path contains it"
+    ),
+    refresh: float = typer.Option(10.0, help="screen refreshes per second"),
+    scan: float = typer.Option(1.0, help="hotplug scan period (s)"),
+):
+    """Watch all input devices in a single live dashboard"""
+    HOME_CLEAR = "\x1b[H\x1b[2J"
+    devices = Monitor(pattern)
+
+    async def event_loop():
+        period = 1 / refresh
+        next_scan = next_frame = time.monotonic()
+        while True:
+            if next_frame >= next_scan:
+                devices.scan()
+                next_scan += scan
+            width = shutil.get_terminal_size().columns
+            print(HOME_CLEAR + devices.render(width, time.monotonic()), end="", flush=True)
+            next_frame += period
+            await asyncio.sleep(max(0, next_frame - time.monotonic()))
+
+    try:
         asyncio.run(event_loop())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        devices.close()
+
+
+@app.command()
+def record(
+    path: str,
+    output: str,
+    duration: float = 0.0,
+    batch: int = 64,
+    interval: float = typer.Option(
+        0.0, help="write at most every INTERVAL s (timer batched: less wakeups)"
+    ),
+):
+    """Record raw events of the device into OUTPUT (until Ctrl-C or DURATION)"""
+    with InputDevice(path) as device:
+        fd = device.fileno()
+        with Recorder(output, device_metadata(device)) as recorder:
+            start = time.monotonic()
+            end = start + duration if duration > 0 else None
+            wakeups = 0
+            try:
+                if interval > 0:
+                    timer = TimerDrain()
+                    timer.add(device, interval=interval)
+                    if end is not None:
+                        stopper = threading.Timer(duration, timer.stop)
+                        stopper.daemon = True
+                        stopper.start()
+                    try:
+                        for _, events in timer.batches():
+                            recorder.write(bytes(events))
+                    finally:
+                        wakeups = timer.wakeups
+                else:
+                    while True:
+                        timeout = None if end is None else end - time.monotonic()
+                        if timeout is not None and timeout <= 0:
+                            break
+                        if select.select((fd,), (), (), timeout)[0]:
+                            recorder.write(os.read(fd, batch * event_size))
+                            wakeups += 1
+            except KeyboardInterrupt:
+                pass
+            elapsed = time.monotonic() - start
+    typer.echo("recorded {} events to {} ({:.0f} wakeups/s)".format(
+        recorder.count, output, wakeups / elapsed if elapsed else 0))
+
+
+@app.command()
+def serve(
+    paths: List[str] = typer.Argument(..., help="devices to serve"),
+    socket: str = typer.Option("/tmp/enjoy.sock", help="unix socket path"),
+):
+    """Serve the events of the devices to local clients (until Ctrl-C)"""
+    devices = [InputDevice(path) for path in paths]
+    try:
+        for device in devices:
+            device.open()
+        with FanoutServer(devices, socket) as server:
+            typer.echo("serving {} device(s) on {}".format(len(devices), socket))
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        for device in devices:
+            device.close()
+
+
+class GeneratedSource:
+    """Gamepad (fake or uinput) fed by a thread at a fixed frame rate"""
+
+    def __init__(self, rate, virtual=False, clock_id=time.CLOCK_REALTIME):
+        self.rate = rate
+        self.virtual = virtual
+        self.clock_id = clock_id
+        self.sink = None
+        self.device = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        fake = fake_gamepad()
+        if self.virtual:
+            # no ff_effects_max: the sink is created without EV_FF
+            self.sink = VirtualDevice(fake.capabilities, name=fake.name,
+                                      abs_info=fake.abs_info)
+            self.sink.open()
+            self.device = InputDevice(self.wait_device_path())
+            write = self.sink.write_events
+        else:
+            self.device = InputDevice(fake)
+            write = fake.emit
+        # the clock is applied on open, before any event is generated
+        self.device.set_clock(self.clock_id)
+        self.device.open()
+        self._thread = threading.Thread(target=self._run, args=(write,), daemon=True)
+        self._thread.start()
+        return self.device
+
+    def wait_device_path(self, timeout=5.0):
+        """Wait for udev to create the device node of the uinput sink"""
+        deadline = time.monotonic() + timeout
+        while True:
+            path = self.sink.device_path
+            if path is not None and os.access(path, os.R_OK):
+                return path
+            if time.monotonic() > deadline:
+                self.sink.close()
+                raise RuntimeError(
+                    "uinput device node not created after {}s".format(timeout))
+            time.sleep(0.05)
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self._stop.set()
+        # closing the reading side first unblocks a writer stuck on a full pipe
+        self.device.close()
+        self._thread.join(1)
+        if self.sink is not None:
+            self.sink.close()
+
+    def _run(self, write):
+        period = 1000000000 / self.rate
+        start, frame = time.monotonic_ns(), 0
+        while not self._stop.is_set():
+            delay = start + frame * period - time.monotonic_ns()
+            if delay > 0:
+                time.sleep(delay * 1e-9)
+            value = frame % 256
+            try:
+                write([(EventType.EV_ABS, Absolute.ABS_X, value),
+                       (EventType.EV_ABS, Absolute.ABS_Y, 255 - value)])
+            except (OSError, ValueError):
+                # device closed
+                break
+            frame += 1
+
+
+def bench_sync(device, duration):
+    end = time.monotonic() + duration
+    stream = event_stream(device.fileno(), latency=device.latency,
+                          stats=device.stats, timeout=duration)
+    for _ in stream:
+        if time.monotonic() >= end:
+            break
+
+
+def bench_wait(wait, device, duration, **kwargs):
+    end = time.monotonic() + duration
+    stream = event_stream(device.fileno(), latency=device.latency,
+                          stats=device.stats, wait=wait, **kwargs)
+    for _ in stream:
+        if time.monotonic() >= end:
+            break
+
+
+def bench_async(device, duration):
+    async def consume():
+        stream = async_event_stream(device.fileno(), latency=device.latency,
+                                    stats=device.stats)
+        async for _ in stream:
+            pass
+
+    async def run():
+        try:
+            await asyncio.wait_for(consume(), duration)
+        except asyncio.TimeoutError:
+            pass
+
+    asyncio.run(run())
+
+
+def bench_bulk(device, duration):
+    fd, end = device.fileno(), time.monotonic() + duration
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        if select.select((fd,), (), (), remaining)[0]:
+            device.read_events()
+
+
+def bench_raw(device, duration):
+    """no InputEvent decoding: just unpack the raw structures"""
+    fd, end = device.fileno(), time.monotonic() + duration
+    clock, delivery = device.latency.clock, device.latency.delivery
+    stats = device.stats
+    while True:
+        remaining = end - time.monotonic()
+        if remaining <= 0:
+            break
+        if not select.select((fd,), (), (), remaining)[0]:
+            continue
+        data = os.read(fd, 64 * event_size)
+        read_time = clock()
+        nb_events = dropped = 0
+        for sec, usec, ev_type, code, _ in event_struct.iter_unpack(data):
+            delivery.record(read_time - sec * 1000000000 - usec * 1000)
+            nb_events += 1
+            if ev_type == EventType.EV_SYN and code == Synchronization.SYN_DROPPED:
+                dropped += 1
+        stats.record_read_count(nb_events, dropped)
+
+
+BENCH_MODES = {
+    "sync": bench_sync, "async": bench_async, "bulk": bench_bulk, "raw": bench_raw,
+    # wait strategies (the blocking one needs a steady event source: the
+    # generated one)
+    "blocking": functools.partial(bench_wait, "blocking"),
+    "epoll": functools.partial(bench_wait, "epoll", timeout=1.0),
+    "spin": functools.partial(bench_wait, "spin", timeout=1.0),
+}
+
+
+def us(value):
+    return "-" if value is None else "{:.1f}".format(value / 1000)
+
+
+@app.command()
+def bench(
+    path: str = typer.Argument(None, help="device (default: generated gamepad)"),
+    duration: float = 5.0,
+    modes: str = "sync,async,bulk,raw",
+    rate: float = typer.Option(1000.0, help="frame rate of the generated device"),
+    virtual: bool = typer.Option(False, help="generate events through uinput"),
+):
+    """Compare event rate, batching, latency and CPU cost of the stream modes"""
+    table = beautifultable.BeautifulTable()
+    table.maxwidth = shutil.get_terminal_size().columns
+    table.columns.header = ["mode", "events", "ev/s", "ev/wakeup", "p50 us",
+                            "p99 us", "max us", "cpu us/ev", "drops"]
+    modes = modes.split(",")
+    unknown = [mode for mode in modes if mode not in BENCH_MODES]
+    if unknown:
+        raise typer.BadParameter(
+            "unknown mode(s): {} (choose from {})".format(
+                ", ".join(unknown), ", ".join(BENCH_MODES)),
+            param_hint="--modes")
+    if path is not None and "blocking" in modes:
+        # a blocking read never returns from an idle device
+        raise typer.BadParameter(
+            "blocking mode needs the generated source (no device path)",
+            param_hint="--modes")
+    for mode in modes:
+        runner = BENCH_MODES[mode]
+        # monotonic timestamps: latencies immune to NTP adjustments. Set
+        # before the source starts: switching later flushes the queue
+        if path is None:
+            source = GeneratedSource(rate, virtual=virtual,
+                                     clock_id=time.CLOCK_MONOTONIC)
+        else:
+            source = InputDevice(path)
+            source.set_clock(time.CLOCK_MONOTONIC)
+        with source as device:
+            device.latency = LatencyStats(clock_id=time.CLOCK_MONOTONIC)
+            device.stats = StreamStats()
+            start, cpu = time.monotonic(), time.thread_time()
+            runner(device, duration)
+            cpu, elapsed = time.thread_time() - cpu, time.monotonic() - start
+        stats, delivery = device.stats, device.latency.delivery
+        events = stats.events
+        table.rows.append((
+            mode, events, "{:.0f}".format(events / elapsed),
+            "{:.2f}".format(stats.events_per_read),
+            us(delivery.percentile(50)), us(delivery.percentile(99)),
+            us(delivery.max), us(cpu * 1e9 / events if events else None),
+            stats.dropped,
+        ))
+    typer.echo(table)
 
 
 @app.command()
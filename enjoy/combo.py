@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Key chord and sequence detection.
+
+Chords (keys held together) are compiled into bitmasks over the
+:class:`~enjoy.input.KeyState` bits and indexed by key code. Sequences
+(keys pressed one after the other) are compiled into a trie indexed by
+key code. An EV_KEY event only looks at the chords containing its code
+and at the sequences in progress. Sequence timeouts are handled by a
+timer wheel::
+
+    combos = ComboEngine()
+    combos.chord([Key.KEY_LEFTCTRL, Key.KEY_LEFTALT, Key.KEY_T], open_terminal)
+    combos.sequence([Key.KEY_UP, Key.KEY_UP, Key.KEY_DOWN], konami, timeout=0.5)
+    for event in event_stream(kbd.fileno()):
+        combos.process(event)
+"""
+
+import math
+
+from .input import EventType, KeyState
+
+
+class TimerWheel(object):
+    """
+    Hashed timer wheel: *nb_slots* buckets of *resolution* seconds.
+
+    Scheduling is O(1) and :meth:`advance` only visits the buckets of
+    the elapsed ticks (not all the pending timers).
+    """
+
+    def __init__(self, resolution=0.01, nb_slots=256):
+        self.resolution = resolution
+        self.nb_slots = nb_slots
+        self.slots = [[] for _ in range(nb_slots)]
+        self.tick = None
+        self.pending = 0
+
+    def _tick(self, when):
+        return int(when / self.resolution)
+
+    def schedule(self, deadline, item):
+        # rounded up: a timer never expires early
+        tick = int(math.ceil(deadline / self.resolution))
+        if self.tick is not None and tick <= self.tick:
+            tick = self.tick + 1
+        self.slots[tick % self.nb_slots].append((tick, item))
+        self.pending += 1
+
+    def advance(self, now):
+        """Move the wheel to *now*. Returns the list of expired items"""
+        current = self._tick(now)
+        if self.tick is None:
+            self.tick = current
+            return []
+        if current <= self.tick:
+            return []
+        expired = []
+        if self.pending:
+            first = self.tick + 1
+            # a full turn visits every bucket once
+            last = min(current, self.tick + self.nb_slots)
+            for tick in range(first, last + 1):
+                slot = self.slots[tick % self.nb_slots]
+                if not slot:
+                    continue
+                remaining = []
+                for entry in slot:
+                    if entry[0] <= current:
+                        expired.append(entry[1])
+                    else:
+                        # due in a later turn of the wheel
+                        remaining.append(entry)
+                slot[:] = remaining
+            self.pending -= len(expired)
+        self.tick = current
+        return expired
+
+
+class Chord(object):
+
+    __slots__ = ('keys', 'mask', 'callback', 'exact', 'active')
+
+    def __init__(self, keys, callback, exact=False):
+        self.keys = tuple(keys)
+        self.mask = KeyState(self.keys).bits
+        self.callback = callback
+        self.exact = exact
+        self.active = False
+
+
+class Sequence(object):
+
+    __slots__ = ('keys', 'callback', 'timeout')
+
+    def __init__(self, keys, callback, timeout):
+        self.keys = tuple(keys)
+        self.callback = callback
+        self.timeout = timeout
+
+
+class _Node(object):
+
+    __slots__ = ('children', 'sequences', 'timeout')
+
+    def __init__(self):
+        self.children = {}
+        self.sequences = []
+        # time allowed to press the next key
+        self.timeout = None
+
+
+class _Partial(object):
+    """A sequence match in progress"""
+
+    __slots__ = ('node', 'alive')
+
+    def __init__(self, node):
+        self.node = node
+        self.alive = True
+
+
+class ComboEngine(object):
+    """
+    Detect chords and sequences from EV_KEY events.
+
+    Callbacks are called with ``(combo, event)``. A chord fires once when
+    its last key is pressed and re-arms when one of its keys is released.
+    A sequence fires when its last key is pressed, each key having been
+    pressed less than *timeout* seconds after the previous one (other
+    key presses in between break the sequence).
+
+    Time is taken from the events, unless *clock* is given.
+    """
+
+    def __init__(self, timeout=1.0, resolution=0.01, clock=None):
+        self.timeout = timeout
+        self.clock = clock
+        self.keys = KeyState()
+        self.chords = []
+        self.sequences = []
+        self._chords_by_code = {}
+        self._root = _Node()
+        self._partials = []
+        self._wheel = TimerWheel(resolution)
+
+    def chord(self, keys, callback, exact=False):
+        """
+        Register a chord. If *exact*, no other key may be pressed at the
+        same time
+        """
+        chord = Chord(keys, callback, exact=exact)
+        self.chords.append(chord)
+        for code in chord.keys:
+            self._chords_by_code.setdefault(code, []).append(chord)
+        return chord
+
+    def sequence(self, keys, callback, timeout=None):
+        """Register a sequence of key presses"""
+        sequence = Sequence(keys, callback,
+                            self.timeout if timeout is None else timeout)
+        self.sequences.append(sequence)
+        node = self._root
+        for code in sequence.keys:
+            if node is not self._root and \
+               (node.timeout is None or sequence.timeout < node.timeout):
+                node.timeout = sequence.timeout
+            node = node.children.setdefault(code, _Node())
+        node.sequences.append(sequence)
+        return sequence
+
+    def expire(self, now):
+        """Drop the sequences in progress which timed out"""
+        for partial in self._wheel.advance(now):
+            partial.alive = False
+        if self._partials:
+            self._partials = [p for p in self._partials if p.alive]
+
+    def process(self, event):
+        if event.type != EventType.EV_KEY:
+            return
+        now = event.time if self.clock is None else self.clock()
+        self.expire(now)
+        code, value = event.code, event.value
+        keys = self.keys
+        if value == 2:
+            # autorepeat: not a new press
+            return
+        keys.set(code, value)
+        chords = self._chords_by_code.get(code)
+        if not value:
+            if chords:
+                for chord in chords:
+                    chord.active = False
+            return
+        if chords:
+            bits = keys.bits
+            for chord in chords:
+                mask = chord.mask
+                if chord.active or bits & mask != mask:
+                    continue
+                if chord.exact and bits != mask:
+                    continue
+                chord.active = True
+                chord.callback(chord, event)
+        self._advance_sequences(code, now, event)
+
+    def _advance_sequences(self, code, now, event):
+        partials = []
+        for partial in self._partials:
+            node = partial.node.children.get(code)
+            partial.alive = False
+            if node is not None:
+                partials.append(self._enter(node, now, event))
+        node = self._root.children.get(code)
+        if node is not None:
+            partials.append(self._enter(node, now, event))
+        self._partials = [partial for partial in partials if partial is not None]
+
+    def _enter(self, node, now, event):
+        for sequence in node.sequences:
+            sequence.callback(sequence, event)
+        if not node.children:
+            return None
+        partial = _Partial(node)
+        self._wheel.schedule(now + node.timeout, partial)
+        return partial
+
+    def process_batch(self, events):
+        for event in events:
+            self.process(event)
+
+    def __call__(self, events):
+        """Pipeline stage: detect combos and pass the events through"""
+        for event in events:
+            self.process(event)
+            yield event
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Timer batched consumption of several devices.
+
+Waking up on every event of a 1 kHz device costs 1000 wakeups per
+second. Consumers which tolerate a few ms of latency (logging,
+telemetry) can instead sleep until a deadline and then drain everything
+pending, from all the due devices, in bulk::
+
+    drain = TimerDrain()
+    drain.add(pad, interval=0.008)       # at most every 8 ms
+    drain.add(keyboard, interval=0.05)
+    for device, events in drain.batches():
+        log(device, events)              # raw input_event array
+    print(drain.wakeups_per_second)
+
+Deadlines are absolute (no drift). Devices due within *slack* seconds of
+each other are drained in the same wakeup. The kernel buffers the events
+meanwhile: keep the intervals well below the time it takes to fill the
+device buffer or SYN_DROPPED will follow.
+"""
+
+import os
+import time
+import threading
+
+from .input import input_event, event_size
+
+#: default read size while draining
+DRAIN_EVENTS = 256
+
+
+def drain(fd, max_events=DRAIN_EVENTS):
+    """
+    Read everything pending from a non blocking fd. Returns the raw
+    data (empty if nothing was pending). Raises EOFError at the end of
+    the source
+    """
+    chunks, size = [], max_events * event_size
+    while True:
+        try:
+            data = os.read(fd, size)
+        except BlockingIOError:
+            break
+        if not data:
+            if chunks:
+                break
+            raise EOFError
+        chunks.append(data)
+        if len(data) < size:
+            break
+    return b''.join(chunks)
+
+
+class _Entry(object):
+
+    __slots__ = ('device', 'fd', 'interval', 'deadline')
+
+    def __init__(self, device, interval, deadline):
+        self.device = device
+        self.fd = device.fileno()
+        self.interval = interval
+        self.deadline = deadline
+
+
+class TimerDrain(object):
+    """
+    Deliver the events of several devices in timer driven batches.
+
+    Each device has its own *interval* (s): its events are delivered at
+    most once per interval.
+    """
+
+    def __init__(self, slack=0.001, max_events=DRAIN_EVENTS):
+        self.slack = slack
+        self.max_events = max_events
+        self.entries = []
+        self.wakeups = 0
+        self.reads = 0
+        self.events = 0
+        self.start_time = None
+        self._stop = threading.Event()
+
+    def add(self, device, interval=0.01):
+        """Add an (open) device, drained every *interval* seconds"""
+        start = time.monotonic() if self.start_time is None else self.start_time
+        self.entries.append(_Entry(device, interval, start + interval))
+
+    def remove(self, device):
+        self.entries = [entry for entry in self.entries if entry.device is not device]
+
+    @property
+    def wakeups_per_second(self):
+        if self.start_time is None:
+            return 0.0
+        elapsed = time.monotonic() - self.start_time
+        return self.wakeups / elapsed if elapsed > 0 else 0.0
+
+    @property
+    def events_per_wakeup(self):
+        return self.events / self.wakeups if self.wakeups else 0.0
+
+    def batches(self):
+        """
+        Generator of (device, raw input_event array). Ends when all the
+        devices reached EOF or :meth:`stop` is called
+        """
+        self._stop.clear()
+        self.start_time = time.monotonic()
+        for entry in self.entries:
+            entry.deadline = self.start_time + entry.interval
+        while self.entries and not self._stop.is_set():
+            now = time.monotonic()
+            first = min(entry.deadline for entry in self.entries)
+            if first > now:
+                self._stop.wait(first - now)
+                continue
+            self.wakeups += 1
+            limit = now + self.slack
+            for entry in list(self.entries):
+                if entry.deadline > limit:
+                    continue
+                entry.deadline += entry.interval
+                if entry.deadline <= now:
+                    # too late: skip the missed deadlines
+                    entry.deadline = now + entry.interval
+                try:
+                    data = drain(entry.fd, self.max_events)
+                except EOFError:
+                    self.entries.remove(entry)
+                    continue
+                self.reads += 1
+                if data:
+                    nb_events = len(data) // event_size
+                    self.events += nb_events
+                    yield entry.device, (input_event * nb_events).from_buffer_copy(data)
+
+    def run(self, callback):
+        """Call ``callback(device, events)`` for each batch"""
+        for device, events in self.batches():
+            callback(device, events)
+
+    def stop(self):
+        self._stop.set()
@@ -0,0 +1,367 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+In memory fake evdev device, for tests and benchmarks without hardware.
+
+A :class:`FakeInputFile` can be given to :class:`enjoy.input.InputDevice`
+instead of a path. It emulates the evdev ioctls used by :mod:`enjoy.input`
+and serves the events given to :meth:`FakeInputFile.emit` through a pipe,
+so select/poll/asyncio based streams work unchanged::
+
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad:
+        fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1)])
+        print(pad.read_event())
+"""
+
+import os
+import time
+import errno
+import ctypes
+
+from .input import (
+    _IOC_DIRSHIFT, _IOC_DIRMASK, _IOC_TYPESHIFT, _IOC_TYPEMASK,
+    _IOC_NRSHIFT, _IOC_NRMASK, _IOC_SIZESHIFT, _IOC_SIZEMASK, _IOC_WRITE,
+    EVDEV_MAGIC, EVENT_TYPE_MAP, EventType, Synchronization, Key, Absolute,
+    Bus, ForceFeedback, input_id, input_absinfo, input_mask, ff_effect,
+    event_struct, _enum_bit_size
+)
+
+_SYN_REPORT = (EventType.EV_SYN, Synchronization.SYN_REPORT, 0)
+# clocks accepted by EVIOCSCLOCKID
+_CLOCKS = (time.CLOCK_REALTIME, time.CLOCK_MONOTONIC, time.CLOCK_BOOTTIME)
+
+# EVIOCGKEY, EVIOCGLED, EVIOCGSND, EVIOCGSW
+_STATE_NR = {
+    0x18: EventType.EV_KEY,
+    0x19: EventType.EV_LED,
+    0x1a: EventType.EV_SND,
+    0x1b: EventType.EV_SW,
+}
+
+
+def _bits(codes, nb_bytes):
+    result = bytearray(nb_bytes)
+    for code in codes:
+        result[code // 8] |= 1 << (code % 8)
+    return bytes(result)
+
+
+def _write(arg, data, size):
+    """Write *data* into the ioctl argument buffer (at most *size* bytes)"""
+    data = data[:size]
+    buff = (ctypes.c_char * len(data)).from_buffer(arg)
+    ctypes.memmove(buff, data, len(data))
+
+
+def _read(arg, size):
+    return bytes((ctypes.c_char * size).from_buffer(arg))
+
+
+class FakeInputFile(object):
+    """
+    Emulation of an evdev device node.
+
+    *capabilities* has the same format as
+    :attr:`enjoy.input.InputDevice.capabilities`. *abs_info* maps ABS
+    codes to input_absinfo (or equivalent sequences). The device state
+    (keys, abs values, multi-touch slots...) follows the emitted events,
+    like the kernel does.
+    """
+
+    def __init__(self, name='enjoy fake device', capabilities=None,
+                 abs_info=None, device_id=None, version=0x010001,
+                 physical_location='', uid='', ff_effects_max=16, path='fake'):
+        self.path = path
+        self.name = name
+        self.physical_location = physical_location
+        self.uid = uid
+        self.version = version
+        self.device_id = input_id(*(device_id or (Bus.BUS_VIRTUAL, 0, 0, 0)))
+        self.capabilities = {EventType(event_type): set(codes)
+                             for event_type, codes in (capabilities or {}).items()}
+        self.capabilities.setdefault(EventType.EV_SYN, set())
+        self.abs_info = {}
+        for code in self.capabilities.get(EventType.EV_ABS, ()):
+            info = (abs_info or {}).get(code)
+            self.abs_info[code] = input_absinfo() if info is None else input_absinfo(*info)
+        self.state = {event_type: set() for event_type in _STATE_NR.values()}
+        self.auto_repeat = [250, 33]
+        self.masks = {}
+        self.grabbed = False
+        self.clock_id = time.CLOCK_REALTIME
+        self.written = []
+        # force feedback: {id: ff_effect} and {id: play count}
+        self.ff_effects_max = ff_effects_max
+        self.effects = {}
+        self.playing = {}
+        self.gain = 0xFFFF
+        self.mt_slots = {}
+        if Absolute.ABS_MT_SLOT in self.abs_info:
+            nb_slots = self.abs_info[Absolute.ABS_MT_SLOT].maximum + 1
+            for code in self.abs_info:
+                if code > Absolute.ABS_MT_SLOT:
+                    value = -1 if code == Absolute.ABS_MT_TRACKING_ID else 0
+                    self.mt_slots[code] = nb_slots * [value]
+        self._fd = None
+        self._write_fd = None
+
+    @classmethod
+    def from_metadata(cls, metadata, **kwargs):
+        """Create a fake device from a recording metadata"""
+        kwargs.setdefault('name', metadata.get('name', 'enjoy fake device'))
+        kwargs.setdefault('physical_location', metadata.get('physical_location', ''))
+        device_id = metadata.get('device_id')
+        if device_id:
+            kwargs.setdefault('device_id', tuple(device_id.values()))
+        caps = {int(k): v for k, v in metadata.get('capabilities', {}).items()}
+        abs_info = {int(k): v for k, v in metadata.get('abs_info', {}).items()}
+        return cls(capabilities=caps, abs_info=abs_info, **kwargs)
+
+    # file interface
+
+    def open(self):
+        self.close()
+        self._fd, self._write_fd = os.pipe()
+        os.set_blocking(self._fd, False)
+
+    def close(self):
+        for fd in (self._fd, self._write_fd):
+            if fd is not None:
+                os.close(fd)
+        self._fd = self._write_fd = None
+        # as the kernel: the effects uploaded through the file are erased
+        self.effects.clear()
+        self.playing.clear()
+
+    def fileno(self):
+        return self._fd
+
+    def read(self, n):
+        return os.read(self._fd, n)
+
+    def write(self, data):
+        data = bytes(data)
+        self.written.append(data)
+        for _, _, event_type, code, value in event_struct.iter_unpack(data):
+            if event_type != EventType.EV_FF:
+                continue
+            if code == ForceFeedback.FF_GAIN:
+                self.gain = value
+            elif code in self.effects:
+                self.playing[code] = value
+        return len(data)
+
+    # event source
+
+    def _accepts(self, event_type, code):
+        mask = self.masks.get(event_type)
+        if mask is None:
+            return True
+        return code // 8 < len(mask) and mask[code // 8] & (1 << (code % 8))
+
+    def _update(self, event_type, code, value):
+        if event_type == EventType.EV_ABS:
+            info = self.abs_info.get(code)
+            if info is None:
+                return
+            info.value = value
+            if code > Absolute.ABS_MT_SLOT:
+                slot = self.abs_info[Absolute.ABS_MT_SLOT].value
+                slots = self.mt_slots.get(code)
+                if slots is not None and 0 <= slot < len(slots):
+                    slots[slot] = value
+        elif event_type in self.state:
+            (self.state[event_type].add if value else
+             self.state[event_type].discard)(code)
+
+    def pack(self, events, timestamp=None):
+        """
+        Update the device state with the (type, code, value) events and
+        pack the ones which pass the client mask. A SYN_REPORT is
+        appended if the batch doesn't end with one
+        """
+        events = list(events)
+        if not events or tuple(events[-1]) != _SYN_REPORT:
+            events.append(_SYN_REPORT)
+        if timestamp is None:
+            timestamp = time.clock_gettime_ns(self.clock_id)
+        sec, usec = timestamp // 1000000000, (timestamp // 1000) % 1000000
+        data = []
+        for event_type, code, value in events:
+            self._update(event_type, code, value)
+            if self._accepts(event_type, code):
+                data.append(event_struct.pack(sec, usec, event_type, code, value))
+        return b''.join(data)
+
+    def emit(self, events, timestamp=None):
+        """
+        Make a frame of (type, code, value) events available for reading.
+        *timestamp* (ns, default: now on the device clock, real time unless
+        changed with EVIOCSCLOCKID) is the event kernel time
+        """
+        return self._write(self.pack(events, timestamp))
+
+    def emit_raw(self, data):
+        """Make raw input_event data available for reading (state is not updated)"""
+        return self._write(data)
+
+    def _write(self, data):
+        fd = self._write_fd
+        if fd is None:
+            raise ValueError('I/O operation on closed fake device')
+        return os.write(fd, data)
+
+    def close_source(self):
+        """Close the writing side: readers get EOF after pending events"""
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+    # ioctl emulation
+
+    def ioctl(self, request, arg=0):
+        direction = (request >> _IOC_DIRSHIFT) & _IOC_DIRMASK
+        ioc_type = (request >> _IOC_TYPESHIFT) & _IOC_TYPEMASK
+        nr = (request >> _IOC_NRSHIFT) & _IOC_NRMASK
+        size = (request >> _IOC_SIZESHIFT) & _IOC_SIZEMASK
+        if ioc_type != EVDEV_MAGIC:
+            raise OSError(errno.ENOTTY, os.strerror(errno.ENOTTY))
+        if direction & _IOC_WRITE:
+            return self._ioctl_write(nr, arg, size)
+        return self._ioctl_read(nr, arg, size)
+
+    def _ioctl_read(self, nr, arg, size):
+        if nr == 0x01:
+            data = ctypes.c_int(self.version)
+        elif nr == 0x02:
+            data = self.device_id
+        elif nr == 0x03:
+            data = (ctypes.c_uint * 2)(*self.auto_repeat)
+        elif nr in (0x06, 0x07, 0x08):
+            text = (self.name, self.physical_location, self.uid)[nr - 0x06]
+            data = text.encode() + b'\x00'
+        elif nr == 0x0a:
+            code = ctypes.c_int32.from_buffer(arg).value
+            if code not in self.mt_slots:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            values = self.mt_slots[code]
+            nb_slots = size // ctypes.sizeof(ctypes.c_int32) - 1
+            data = (ctypes.c_int32 * (nb_slots + 1))(code, *values[:nb_slots])
+        elif nr in _STATE_NR:
+            data = _bits(self.state[_STATE_NR[nr]], size)
+        elif 0x20 <= nr < 0x40:
+            event_type = nr - 0x20
+            if event_type == 0:
+                codes = self.capabilities
+            else:
+                codes = self.capabilities.get(event_type, ())
+            data = _bits(codes, size)
+        elif 0x40 <= nr < 0x80:
+            info = self.abs_info.get(nr - 0x40)
+            if info is None:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            data = info
+        elif nr == 0x84:
+            data = ctypes.c_int(self.ff_effects_max)
+        elif nr == 0x92:
+            mask = input_mask.from_buffer(arg)
+            codes = self.masks.get(mask.type)
+            if codes is None:
+                nb_bytes = _enum_bit_size(EVENT_TYPE_MAP[mask.type])
+                codes = nb_bytes * b'\xff'
+            buff = (ctypes.c_char * mask.codes_size).from_address(mask.codes_ptr)
+            _write(buff, codes, mask.codes_size)
+            return 0
+        else:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+        _write(arg, bytes(data), size)
+        return 0
+
+    def _ioctl_write(self, nr, arg, size):
+        if nr == 0x80:
+            effect = ff_effect.from_buffer(arg)
+            if effect.id == -1:
+                free = [i for i in range(self.ff_effects_max) if i not in self.effects]
+                if not free:
+                    raise OSError(errno.ENOSPC, os.strerror(errno.ENOSPC))
+                effect.id = free[0]
+            elif effect.id not in self.effects:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            self.effects[effect.id] = ff_effect.from_buffer_copy(effect)
+        elif nr == 0x81:
+            if arg not in self.effects:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            del self.effects[arg]
+            self.playing.pop(arg, None)
+        elif nr == 0x90:
+            self.grabbed = bool(arg)
+        elif nr == 0x93:
+            mask = input_mask.from_buffer(arg)
+            buff = (ctypes.c_char * mask.codes_size).from_address(mask.codes_ptr)
+            self.masks[mask.type] = bytes(buff)
+        elif nr == 0xa0:
+            clock_id = ctypes.c_int.from_buffer(arg).value
+            if clock_id not in _CLOCKS:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            self.clock_id = clock_id
+        elif 0xc0 <= nr < 0x100:
+            info = self.abs_info.get(nr - 0xc0)
+            if info is None:
+                raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+            ctypes.memmove(ctypes.addressof(info), _read(arg, size), size)
+        else:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL))
+        return 0
+
+
+def fake_gamepad(name='enjoy fake gamepad', **kwargs):
+    """Fake device with the capabilities of a typical gamepad"""
+    axes = (Absolute.ABS_X, Absolute.ABS_Y, Absolute.ABS_Z,
+            Absolute.ABS_RX, Absolute.ABS_RY, Absolute.ABS_RZ)
+    hats = (Absolute.ABS_HAT0X, Absolute.ABS_HAT0Y)
+    caps = {
+        EventType.EV_KEY: set(range(Key.BTN_SOUTH, Key.BTN_THUMBR + 1)),
+        EventType.EV_ABS: axes + hats,
+        EventType.EV_FF: {ForceFeedback.FF_RUMBLE, ForceFeedback.FF_PERIODIC,
+                          ForceFeedback.FF_SINE, ForceFeedback.FF_GAIN},
+    }
+    abs_info = {code: (128, 0, 255, 0, 15, 0) for code in axes}
+    abs_info.update({code: (0, -1, 1, 0, 0, 0) for code in hats})
+    kwargs.setdefault('device_id', (Bus.BUS_USB, 0x054c, 0x0268, 0x8111))
+    return FakeInputFile(name, capabilities=caps, abs_info=abs_info, **kwargs)
+
+
+def fake_keyboard(name='enjoy fake keyboard', **kwargs):
+    """Fake device with the capabilities of a typical keyboard"""
+    caps = {
+        EventType.EV_KEY: set(range(Key.KEY_ESC, Key.KEY_MICMUTE + 1)),
+        EventType.EV_LED: {0, 1, 2},
+        EventType.EV_REP: set(),
+    }
+    kwargs.setdefault('device_id', (Bus.BUS_USB, 0x046d, 0xc31c, 0x0110))
+    return FakeInputFile(name, capabilities=caps, **kwargs)
+
+
+def fake_touchscreen(name='enjoy fake touchscreen', nb_slots=10, **kwargs):
+    """Fake multi-touch (protocol B) device"""
+    mt = {
+        Absolute.ABS_MT_SLOT: (0, 0, nb_slots - 1, 0, 0, 0),
+        Absolute.ABS_MT_TRACKING_ID: (0, -1, 65535, 0, 0, 0),
+        Absolute.ABS_MT_POSITION_X: (0, 0, 4095, 0, 0, 0),
+        Absolute.ABS_MT_POSITION_Y: (0, 0, 4095, 0, 0, 0),
+        Absolute.ABS_MT_PRESSURE: (0, 0, 255, 0, 0, 0),
+    }
+    abs_info = dict(mt)
+    abs_info[Absolute.ABS_X] = (0, 0, 4095, 0, 0, 0)
+    abs_info[Absolute.ABS_Y] = (0, 0, 4095, 0, 0, 0)
+    caps = {
+        EventType.EV_KEY: {Key.BTN_TOUCH},
+        EventType.EV_ABS: set(abs_info),
+    }
+    return FakeInputFile(name, capabilities=caps, abs_info=abs_info, **kwargs)
@@ -0,0 +1,392 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Event fan-out over a Unix domain socket.
+
+A :class:`FanoutServer` owns the devices (only it needs permissions on
+/dev/input and the kernel copies the events once) and sends each batch
+it reads, compactly encoded, to the subscribed clients. Each client
+tells which events it wants so it only receives those::
+
+    # daemon (or: enjoy serve /dev/input/event26 --socket /tmp/enjoy.sock)
+    with InputDevice('/dev/input/event26') as pad:
+        FanoutServer([pad], '/tmp/enjoy.sock').serve_forever()
+
+    # consumers
+    with FanoutClient('/tmp/enjoy.sock', events={EventType.EV_KEY: None}) as client:
+        for event in client.event_stream():
+            print(event)
+
+Messages are SOCK_SEQPACKET packets starting with a kind byte:
+
+* ``H`` (server): JSON hello with the metadata of each device
+* ``S`` (client): JSON subscription ``{"device": index, "events": {type: codes}}``
+  (``null`` codes means all codes of the type; no events means everything)
+* ``F`` (server): frame: device index (u16), number of events (u16), time
+  of the first event (µs, i64) followed by the events: type (u8), code
+  (u16), value (i32), time offset to the first event (µs, u32): 11 bytes
+  per event instead of 24.
+
+A client too slow to keep up loses frames; it receives a SYN_DROPPED
+event before the next frame it gets (as with the kernel).
+"""
+
+import os
+import json
+import stat
+import select
+import socket
+import struct
+import selectors
+import threading
+
+from .input import (
+    EventType, Synchronization, CODE_BITS, EVENT_INDEX_SIZE, event_index,
+    event_from_us, read_events
+)
+from .record import device_metadata
+
+VERSION = 1
+
+FRAME = struct.Struct('<cHHq')
+EVENT = struct.Struct('<BHiI')
+
+MASK_SIZE = EVENT_INDEX_SIZE
+
+_MAX_MESSAGE = 64 * 1024
+
+
+def event_mask(events):
+    """
+    Compile an events filter ({event type: codes or None (all)}) into a
+    bytearray indexed by ``event_type << CODE_BITS | code``
+    """
+    mask = bytearray(MASK_SIZE)
+    for event_type, codes in events.items():
+        if codes is None:
+            base = event_index(event_type, 0)
+            mask[base:base + (1 << CODE_BITS)] = b'\x01' * (1 << CODE_BITS)
+        else:
+            for code in codes:
+                mask[event_index(event_type, code)] = 1
+    return mask
+
+
+def encode_frame(device, events, mask=None, pending=0):
+    """
+    Encode raw input_event(s) of a device into a frame message.
+
+    If *mask* is given (see :func:`event_mask`) only the selected events
+    are kept, plus the SYN_REPORT closing frames which kept at least one
+    event (*pending*: number of kept events since the last SYN_REPORT).
+    Returns (message or None if nothing is left, pending)
+    """
+    parts, base = [], None
+    pack = EVENT.pack
+    for event in events:
+        event_type, code = event.type, event.code
+        if event_type == EventType.EV_SYN:
+            if mask is not None and code == Synchronization.SYN_REPORT:
+                if not pending:
+                    continue
+                pending = 0
+        elif mask is not None:
+            if not mask[event_type << CODE_BITS | code]:
+                continue
+            pending += 1
+        time_us = event.time.tv_sec * 1000000 + event.time.tv_usec
+        if base is None:
+            base = time_us
+        parts.append(pack(event_type, code, event.value, time_us - base))
+    if not parts:
+        return None, pending
+    return FRAME.pack(b'F', device, len(parts), base) + b''.join(parts), pending
+
+
+def decode_frame(data):
+    """
+    Decode a frame message.
+    Returns (device index, list of (time_us, type, code, value))
+    """
+    kind, device, nb_events, base = FRAME.unpack_from(data)
+    if kind != b'F':
+        raise ValueError('not a frame message: {!r}'.format(kind))
+    events = [(base + dt, event_type, code, value)
+              for event_type, code, value, dt in EVENT.iter_unpack(data[FRAME.size:])]
+    return device, events
+
+
+def _dropped_frame(device, time_us):
+    event = EVENT.pack(EventType.EV_SYN, Synchronization.SYN_DROPPED, 0, 0)
+    return FRAME.pack(b'F', device, 1, time_us) + event
+
+
+class _Subscriber(object):
+
+    __slots__ = ('sock', 'device', 'mask', 'pending', 'dropped', 'lost')
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.device = None
+        self.mask = None
+        self.pending = 0
+        # frames lost since the last delivered frame
+        self.lost = False
+        self.dropped = 0
+
+    def subscribe(self, request):
+        self.device = request.get('device', 0)
+        events = request.get('events')
+        if events:
+            self.mask = event_mask({int(event_type): codes
+                                    for event_type, codes in events.items()})
+        else:
+            self.mask = None
+        self.pending = 0
+
+
+class FanoutServer(object):
+    """
+    Serve the events of the given (open) devices on the Unix socket *path*.
+    """
+
+    def __init__(self, devices, path):
+        self.devices = list(devices)
+        self.path = path
+        self.subscribers = set()
+        self.frames = 0
+        self._hello = b'H' + json.dumps(dict(
+            version=VERSION,
+            devices=[device_metadata(device) for device in self.devices],
+        )).encode()
+        self._selector = None
+        self._sock = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def open(self):
+        try:
+            mode = os.lstat(self.path).st_mode
+        except FileNotFoundError:
+            pass
+        else:
+            # only replace a (stale) socket: never delete anything else
+            if not stat.S_ISSOCK(mode):
+                raise FileExistsError('{} exists and is not a socket'.format(self.path))
+            os.unlink(self.path)
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        sock.bind(self.path)
+        sock.listen()
+        sock.setblocking(False)
+        self._sock = sock
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(sock, selectors.EVENT_READ, None)
+        for index, device in enumerate(self.devices):
+            self._selector.register(device.fileno(), selectors.EVENT_READ, index)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _accept(self):
+        sock, _ = self._sock.accept()
+        sock.setblocking(False)
+        subscriber = _Subscriber(sock)
+        try:
+            sock.send(self._hello)
+        except OSError:
+            sock.close()
+            return
+        self.subscribers.add(subscriber)
+        self._selector.register(sock, selectors.EVENT_READ, subscriber)
+
+    def _remove(self, subscriber):
+        self.subscribers.discard(subscriber)
+        self._selector.unregister(subscriber.sock)
+        subscriber.sock.close()
+
+    def _request(self, subscriber):
+        try:
+            data = subscriber.sock.recv(_MAX_MESSAGE)
+        except OSError:
+            data = b''
+        if not data:
+            self._remove(subscriber)
+        elif data[:1] == b'S':
+            subscriber.subscribe(json.loads(data[1:].decode()))
+
+    def _send(self, subscriber, message, time_us):
+        sock = subscriber.sock
+        try:
+            if subscriber.lost:
+                sock.send(_dropped_frame(subscriber.device, time_us))
+                subscriber.lost = False
+            sock.send(message)
+        except BlockingIOError:
+            subscriber.lost = True
+            subscriber.dropped += 1
+        except OSError:
+            self._remove(subscriber)
+
+    def _dispatch(self, index):
+        fd = self.devices[index].fileno()
+        try:
+            events = read_events(fd)
+        except (EOFError, OSError):
+            # device gone: its subscribers get EOF
+            self._selector.unregister(fd)
+            for subscriber in list(self.subscribers):
+                if subscriber.device == index:
+                    self._remove(subscriber)
+            return
+        self.frames += 1
+        time_us = events[0].time.tv_sec * 1000000 + events[0].time.tv_usec
+        shared = None
+        for subscriber in list(self.subscribers):
+            if subscriber.device != index:
+                continue
+            if subscriber.mask is None:
+                if shared is None:
+                    # encoded once for all unfiltered subscribers
+                    shared = encode_frame(index, events)[0]
+                message = shared
+            else:
+                message, subscriber.pending = encode_frame(
+                    index, events, subscriber.mask, subscriber.pending)
+            if message is not None:
+                self._send(subscriber, message, time_us)
+
+    def serve(self, timeout=0.1):
+        """Serve until :meth:`close` (or :meth:`stop`)"""
+        if self._sock is None:
+            self.open()
+        self._stop.clear()
+        while not self._stop.is_set():
+            for key, _ in self._selector.select(timeout):
+                data = key.data
+                if data is None:
+                    self._accept()
+                elif isinstance(data, _Subscriber):
+                    if data in self.subscribers:
+                        self._request(data)
+                else:
+                    self._dispatch(data)
+
+    serve_forever = serve
+
+    def start(self):
+        """Serve from a background thread"""
+        if self._sock is None:
+            self.open()
+        self._thread = threading.Thread(target=self.serve, name='FanoutServer',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def close(self):
+        self.stop()
+        for subscriber in list(self.subscribers):
+            self._remove(subscriber)
+        if self._sock is not None:
+            self._selector.close()
+            self._sock.close()
+            self._sock = None
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class FanoutClient(object):
+    """
+    Receive the events of a device served by a :class:`FanoutServer`.
+
+    *device* is the index of the device in the server. *events* is the
+    filter ({event type: codes or None for all codes}, default: all events).
+    """
+
+    def __init__(self, path, device=0, events=None):
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            self.sock.connect(path)
+            hello = self.sock.recv(_MAX_MESSAGE)
+            if hello[:1] != b'H':
+                raise ConnectionError('unexpected hello from {}'.format(path))
+            hello = json.loads(hello[1:].decode())
+            self.devices = hello['devices']
+            self.subscribe(device, events)
+        except Exception:
+            self.sock.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def close(self):
+        self.sock.close()
+
+    @property
+    def metadata(self):
+        """Metadata of the subscribed device (see enjoy.record.device_metadata)"""
+        return self.devices[self.device]
+
+    def subscribe(self, device=0, events=None):
+        if not 0 <= device < len(self.devices):
+            raise ValueError('server has no device {}'.format(device))
+        self.device = device
+        if events is not None:
+            events = {int(event_type): None if codes is None else sorted(int(c) for c in codes)
+                      for event_type, codes in events.items()}
+        request = dict(device=device, events=events)
+        self.sock.send(b'S' + json.dumps(request).encode())
+
+    def read_frame(self):
+        """
+        Read one frame message (blocking).
+        Returns list of (time_us, type, code, value). Raises EOFError when
+        the server is gone
+        """
+        data = self.sock.recv(_MAX_MESSAGE)
+        if not data:
+            raise EOFError('server closed the connection')
+        return decode_frame(data)[1]
+
+    def read_events(self):
+        """Read one frame message (blocking). Returns a list of InputEvent"""
+        return [event_from_us(*event) for event in self.read_frame()]
+
+    def event_stream(self, timeout=None):
+        """
+        Generator of InputEvent. Ends when the server closes the connection
+        or after *timeout* seconds without events
+        """
+        fd = self.fileno()
+        while True:
+            if not select.select((fd,), (), (), timeout)[0]:
+                return
+            try:
+                events = self.read_frame()
+            except (EOFError, ConnectionError):
+                return
+            for event in events:
+                yield event_from_us(*event)
@@ -10,13 +10,17 @@ from __future__ import print_function
 
 import os
 import enum
+import errno
 import glob
 import stat
+import time
 import fcntl
 import ctypes
 import select
 import struct
 import asyncio
+import functools
+import collections
 
 from ._input import *
 
@@ -26,6 +30,8 @@ from ._input import *
 
 int_size = ctypes.sizeof(ctypes.c_int)
 event_size = ctypes.sizeof(input_event)
+# (tv_sec, tv_usec, type, code, value): same layout as input_event
+event_struct = struct.Struct('qqHHi')
 
 # --------------------------------------------------------------------------
 #                       Linux ioctl numbers made easy
@@ -87,6 +93,11 @@ def _enum_max(enu):
     return tuple(enu)[-1]
 
 
+def code_name(code):
+    """Name of an event code (the number for codes without a name)"""
+    return getattr(code, 'name', str(code))
+
+
 def _enum_bit_size(enu):
     return _enum_max(enu) // 8 + 1
 
@@ -130,10 +141,12 @@ def EVIOCGABS(abs_type_value):
 
 
 def EVIOCSABS(abs_type_value):
-    raise NotImplementedError
+    return _IOW(EVDEV_MAGIC, 0xc0 + abs_type_value,
+                ctypes.sizeof(input_absinfo))
 
 
 EVIOCSFF = _IOW(EVDEV_MAGIC, 0x80, ctypes.sizeof(ff_effect))
+EVIOCSCLOCKID = _IOW(EVDEV_MAGIC, 0xa0, int_size)
 EVIOCRMFF = _IOW(EVDEV_MAGIC, 0x81, int_size)
 EVIOCGEFFECTS = _IOR(EVDEV_MAGIC, 0x84, int_size)
 EVIOCGRAB = _IOW(EVDEV_MAGIC, 0x90, int_size)
@@ -141,41 +154,53 @@ EVIOCGMASK = _IOR(EVDEV_MAGIC, 0x92, ctypes.sizeof(input_mask))
 EVIOCSMASK = _IOW(EVDEV_MAGIC, 0x93, ctypes.sizeof(input_mask))
 
 
+def ioctl(fd, request, arg=0):
+    """
+    ioctl on *fd*: either a file descriptor number or an object with a
+    fileno() method. If the object has an ioctl() method it is used
+    instead (ex: a fake device backend)
+    """
+    method = getattr(fd, 'ioctl', None)
+    if method is None:
+        return fcntl.ioctl(fd, request, arg)
+    return method(request, arg)
+
+
 def grab(fd):
-    fcntl.ioctl(fd, EVIOCGRAB, 1)
+    ioctl(fd, EVIOCGRAB, 1)
 
 
 def release(fd):
-    fcntl.ioctl(fd, EVIOCGRAB, 0)
+    ioctl(fd, EVIOCGRAB, 0)
 
 
 def version(fd):
     result = ctypes.c_int()
-    fcntl.ioctl(fd, EVIOCGVERSION, result)
+    ioctl(fd, EVIOCGVERSION, result)
     return result.value
 
 
 def device_id(fd):
     result = input_id()
-    fcntl.ioctl(fd, EVIOCGID, result)
+    ioctl(fd, EVIOCGID, result)
     return result
 
 
 def name(fd):
     result = ctypes.create_string_buffer(_S_BUFF)
-    fcntl.ioctl(fd, EVIOCGNAME, result)
+    ioctl(fd, EVIOCGNAME, result)
     return result.value.decode()
 
 
 def physical_location(fd):
     result = ctypes.create_string_buffer(_S_BUFF)
-    fcntl.ioctl(fd, EVIOCGPHYS, result)
+    ioctl(fd, EVIOCGPHYS, result)
     return result.value.decode()
 
 
 def uid(fd):
     result = ctypes.create_string_buffer(_S_BUFF)
-    fcntl.ioctl(fd, EVIOCGUNIQ, result)
+    ioctl(fd, EVIOCGUNIQ, result)
     return result.value.decode()
 
 
@@ -185,12 +210,142 @@ def _bit(array, bit):
 
 def _active(fd, code, dtype):
     result = ctypes.create_string_buffer(_enum_bit_size(dtype))
-    fcntl.ioctl(fd, code, result)
+    ioctl(fd, code, result)
     return {item for item in dtype if _bit(result, item)}
 
 
+class KeyState(object):
+    """
+    Set of pressed keys stored as a bitset (an int: bit n is key code n).
+
+    Membership is a shift, the difference between two snapshots a XOR
+    and it can be built directly from the EVIOCGKEY buffer. Iterating
+    gives the Key members in code order (decoded on demand).
+    """
+
+    __slots__ = ('bits',)
+
+    #: maximum number of keys (KEY_MAX + 1)
+    size = _enum_max(Key) + 1
+
+    def __init__(self, codes=()):
+        bits = 0
+        for code in codes:
+            bits |= 1 << code
+        self.bits = bits
+
+    @classmethod
+    def from_bits(cls, bits):
+        result = cls.__new__(cls)
+        result.bits = bits
+        return result
+
+    @classmethod
+    def from_buffer(cls, buff):
+        """Key state from an EVIOCGKEY buffer (bytes like)"""
+        return cls.from_bits(int.from_bytes(bytes(buff), 'little'))
+
+    def to_bytes(self):
+        """EVIOCGKEY layout"""
+        return self.bits.to_bytes(_enum_bit_size(Key), 'little')
+
+    def copy(self):
+        return self.from_bits(self.bits)
+
+    def __contains__(self, code):
+        return (self.bits >> code) & 1 == 1
+
+    def add(self, code):
+        self.bits |= 1 << code
+
+    def discard(self, code):
+        self.bits &= ~(1 << code)
+
+    def set(self, code, value):
+        """Update from a EV_KEY event value (repeat (2) counts as pressed)"""
+        if value:
+            self.bits |= 1 << code
+        else:
+            self.bits &= ~(1 << code)
+
+    def clear(self):
+        self.bits = 0
+
+    def codes(self):
+        """Generator of the key codes (int) in the set"""
+        bits = self.bits
+        while bits:
+            low = bits & -bits
+            yield low.bit_length() - 1
+            bits ^= low
+
+    def __iter__(self):
+        for code in self.codes():
+            try:
+                yield Key(code)
+            except ValueError:
+                # code without a name in the Key enum
+                yield code
+
+    def keys(self):
+        """Enum view: set of Key members"""
+        return set(self)
+
+    def __len__(self):
+        return bin(self.bits).count('1')
+
+    def __bool__(self):
+        return self.bits != 0
+
+    def _other_bits(self, other):
+        if isinstance(other, KeyState):
+            return other.bits
+        return KeyState(other).bits
+
+    def __eq__(self, other):
+        try:
+            return self.bits == self._other_bits(other)
+        except TypeError:
+            return NotImplemented
+
+    __hash__ = None
+
+    def __xor__(self, other):
+        return self.from_bits(self.bits ^ self._other_bits(other))
+
+    def __and__(self, other):
+        return self.from_bits(self.bits & self._other_bits(other))
+
+    def __or__(self, other):
+        return self.from_bits(self.bits | self._other_bits(other))
+
+    def __sub__(self, other):
+        return self.from_bits(self.bits & ~self._other_bits(other))
+
+    def diff(self, previous):
+        """(pressed, released) since a *previous* snapshot"""
+        changed = self.bits ^ previous.bits
+        return (self.from_bits(changed & self.bits),
+                self.from_bits(changed & previous.bits))
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__,
+                               ', '.join(code_name(key) for key in self))
+
+
+def key_state(fd, buff=None):
+    """
+    KeyState of the device. If given, *buff* (a ctypes char array of
+    EVIOCGKEY size) is reused
+    """
+    if buff is None:
+        buff = ctypes.create_string_buffer(_enum_bit_size(Key))
+    ioctl(fd, EVIOCGKEY, buff)
+    return KeyState.from_buffer(buff)
+
+
 def active_keys(fd):
-    return _active(fd, EVIOCGKEY, Key)
+    return key_state(fd)
 
 
 def active_leds(fd):
@@ -205,16 +360,62 @@ def active_switches(fd):
     return _active(fd, EVIOCGSW, Switch)
 
 
+def set_clock(fd, clock_id):
+    """
+    Select the clock of the event timestamps: time.CLOCK_REALTIME
+    (kernel default), time.CLOCK_MONOTONIC or time.CLOCK_BOOTTIME
+    """
+    ioctl(fd, EVIOCSCLOCKID, ctypes.c_int(clock_id))
+
+
+def clock_ns(clock_id):
+    """Function returning the current time (ns) on the given clock"""
+    if clock_id == time.CLOCK_REALTIME:
+        return time.time_ns
+    if clock_id == time.CLOCK_MONOTONIC:
+        return time.monotonic_ns
+    return functools.partial(time.clock_gettime_ns, clock_id)
+
+
 def abs_info(fd, abs_code):
     result = input_absinfo()
-    fcntl.ioctl(fd, EVIOCGABS(abs_code), result)
+    ioctl(fd, EVIOCGABS(abs_code), result)
     return result
 
 
+def set_abs_info(fd, abs_code, info):
+    """Write the input_absinfo of an axis (ex: calibration)"""
+    if not isinstance(info, input_absinfo):
+        info = input_absinfo(*info)
+    ioctl(fd, EVIOCSABS(abs_code), info)
+
+
+def mt_slots_buffer(abs_code, nb_slots):
+    """
+    Create a buffer with the EVIOCGMTSLOTS layout: the ABS_MT code
+    followed by one value per slot
+    """
+    result = (ctypes.c_int32 * (nb_slots + 1))()
+    result[0] = abs_code
+    return result
+
+
+def mt_slots(fd, abs_code, nb_slots, buff=None):
+    """
+    Read the values of all slots for the given ABS_MT code in a single
+    ioctl. If *buff* (see :func:`mt_slots_buffer`) is given, it is filled
+    in place
+    """
+    if buff is None:
+        buff = mt_slots_buffer(abs_code, nb_slots)
+    ioctl(fd, EVIOCGMTSLOTS(nb_slots), buff)
+    return input_mt_request_layout(abs_code, buff[1:])
+
+
 def available_event_types(fd):
     nb_bytes = _enum_bit_size(EventType)
     result = ctypes.create_string_buffer(nb_bytes)
-    fcntl.ioctl(fd, EVIOCGBIT(0, nb_bytes), result)
+    ioctl(fd, EVIOCGBIT(0, nb_bytes), result)
     return {ev_type for ev_type in EventType if _bit(result, ev_type)}
 
 
@@ -228,13 +429,13 @@ def event_type_capabilities(fd, event_type):
     event_code_type = EVENT_TYPE_MAP[event_type]
     nb_bytes = _enum_bit_size(event_code_type)
     event_codes_bits = ctypes.create_string_buffer(nb_bytes)
-    fcntl.ioctl(fd, EVIOCGBIT(event_type, nb_bytes), event_codes_bits)
+    ioctl(fd, EVIOCGBIT(event_type, nb_bytes), event_codes_bits)
     return {c for c in event_code_type if _bit(event_codes_bits, c)}
 
 
 def auto_repeat_settings(fd):
     result = (ctypes.c_uint*2)()
-    fcntl.ioctl(fd, EVIOCGREP, result)
+    ioctl(fd, EVIOCGREP, result)
     return {rep: result[rep] for rep in AutoRepeat}
 
 
@@ -253,6 +454,46 @@ def capabilities_str(caps, indent=''):
     return '\n'.join(lines)
 
 
+def max_effects(fd):
+    """Number of force feedback effects the device can hold at once"""
+    result = ctypes.c_int()
+    ioctl(fd, EVIOCGEFFECTS, result)
+    return result.value
+
+
+def upload_effect(fd, effect):
+    """
+    Upload (effect.id == -1) or update (effect.id is a previously
+    uploaded effect) a force feedback effect. Returns the effect id
+    """
+    ioctl(fd, EVIOCSFF, effect)
+    return effect.id
+
+
+def erase_effect(fd, effect_id):
+    ioctl(fd, EVIOCRMFF, effect_id)
+
+
+def rumble_effect(strong_magnitude, weak_magnitude, length=1000, delay=0):
+    """Build a FF_RUMBLE effect (magnitudes 0..0xFFFF, times in ms)"""
+    effect = ff_effect(type=ForceFeedback.FF_RUMBLE, id=-1)
+    effect.replay.length, effect.replay.delay = length, delay
+    effect.u.rumble.strong_magnitude = strong_magnitude
+    effect.u.rumble.weak_magnitude = weak_magnitude
+    return effect
+
+
+def periodic_effect(waveform=ForceFeedback.FF_SINE, period=100, magnitude=0x4000,
+                    offset=0, phase=0, length=1000, delay=0, direction=0x4000):
+    """Build a FF_PERIODIC effect (times in ms)"""
+    effect = ff_effect(type=ForceFeedback.FF_PERIODIC, id=-1, direction=direction)
+    effect.replay.length, effect.replay.delay = length, delay
+    periodic = effect.u.periodic
+    periodic.waveform, periodic.period = waveform, period
+    periodic.magnitude, periodic.offset, periodic.phase = magnitude, offset, phase
+    return effect
+
+
 def get_input_mask(fd, event_type):
     event_code_type = EVENT_TYPE_MAP[event_type]
     nb_bytes = _enum_bit_size(event_code_type)
@@ -261,17 +502,101 @@ def get_input_mask(fd, event_type):
     result.type = event_type
     result.codes_size = nb_bytes
     result.codes_ptr = ctypes.cast(event_codes_bits, ctypes.c_void_p)
-    fcntl.ioctl(fd, EVIOCGMASK, result)
+    ioctl(fd, EVIOCGMASK, result)
     return result, event_codes_bits
 
 
+def set_input_mask(fd, event_type, codes):
+    """Only receive events of *event_type* with the given codes"""
+    event_code_type = EVENT_TYPE_MAP[event_type]
+    nb_bytes = _enum_bit_size(event_code_type)
+    event_codes_bits = (ctypes.c_ubyte * nb_bytes)()
+    for code in codes:
+        event_codes_bits[code // 8] |= 1 << (code % 8)
+    mask = input_mask()
+    mask.type = event_type
+    mask.codes_size = nb_bytes
+    mask.codes_ptr = ctypes.cast(event_codes_bits, ctypes.c_void_p)
+    ioctl(fd, EVIOCSMASK, mask)
+
+
 def read_event(fd, read=os.read):
     data = read(fd, event_size)
+    if not data:
+        raise EOFError
     if len(data) < event_size:
         raise ValueError
     return input_event.from_buffer_copy(data)
 
 
+def read_events(fd, max_events=64, read=os.read):
+    """
+    Read up to *max_events* pending events in a single read.
+    Returns a ctypes array of input_event
+    """
+    data = read(fd, max_events * event_size)
+    if not data:
+        raise EOFError
+    nb_events, remainder = divmod(len(data), event_size)
+    if remainder:
+        raise ValueError
+    return (input_event * nb_events).from_buffer_copy(data)
+
+
+def event_time_ns(event):
+    """Kernel timestamp (ns) of a raw input_event"""
+    return event.time.tv_sec * 1000000000 + event.time.tv_usec * 1000
+
+
+#: flat (type, code) table index: ``event_type << CODE_BITS | code``
+CODE_BITS = 10
+#: number of entries of a flat (type, code) table
+EVENT_INDEX_SIZE = (EventType.EV_MAX + 1) << CODE_BITS
+
+
+def event_index(event_type, code):
+    """
+    Flat table index of (*event_type*, *code*) (see :data:`CODE_BITS`).
+    Raises ValueError if the type or code doesn't fit the table
+    """
+    event_type, code = int(event_type), int(code)
+    if not 0 <= event_type <= EventType.EV_MAX:
+        raise ValueError('invalid event type {}'.format(event_type))
+    if code < 0 or code >> CODE_BITS:
+        raise ValueError('invalid event code {}'.format(code))
+    return event_type << CODE_BITS | code
+
+
+def handler_table():
+    """
+    Empty handler table for :func:`dispatch`: a flat list with one slot
+    (None or a tuple of handlers) per (type, code)
+    """
+    return [None] * EVENT_INDEX_SIZE
+
+
+def dispatch(fd, handlers, max_events=64, read=os.read):
+    """
+    Read up to *max_events* pending events in a single read and call
+    ``handler(code, value, time_ns)`` (plain ints) for the events which
+    have handlers in the *handlers* table (see :func:`handler_table`).
+    No event object is created: an unhandled event costs one table lookup.
+    Returns the number of events read
+    """
+    data = read(fd, max_events * event_size)
+    if not data:
+        raise EOFError
+    if len(data) % event_size:
+        raise ValueError
+    for sec, usec, event_type, code, value in event_struct.iter_unpack(data):
+        slot = handlers[event_type << CODE_BITS | code]
+        if slot is not None:
+            time_ns = sec * 1000000000 + usec * 1000
+            for handler in slot:
+                handler(code, value, time_ns)
+    return len(data) // event_size
+
+
 def list_devices(base_dir='/dev/input'):
     '''List readable character devices in ``input_device_dir``.'''
     fns = glob.glob('{}/event*'.format(base_dir))
@@ -294,16 +619,22 @@ def is_device(fn):
     return True
 
 
-def _build_struct_type(struct, funcs=None):
+def _build_struct_type(struct, funcs=None, extra=None):
     name = ''.join(map(str.capitalize, struct.__name__.split('_')))
     field_names = [f[0] for f in struct._fields_]
-    klass = collections.namedtuple(name, field_names)
+    # extra: {field name: func(struct)} for fields computed from the struct
+    extra = extra or {}
+    klass = collections.namedtuple(name, field_names + list(extra))
+    # extra fields are optional
+    klass.__new__.__defaults__ = (None,) * len(extra) or None
     if funcs is None:
         funcs = {}
     _identity = lambda o, v: v
     def from_struct(s):
         fields = {name: funcs.get(name, _identity)(s, getattr(s, name))
                   for name in field_names}
+        for name, func in extra.items():
+            fields[name] = func(s)
         return klass(**fields)
     klass.from_struct = from_struct
     return klass
@@ -314,7 +645,15 @@ InputId = _build_struct_type(input_id,
 InputEvent = _build_struct_type(input_event,
                                 dict(time=lambda o, t: t.tv_sec + (t.tv_usec)*1e-6,
                                      type=lambda o, t: EventType(t),
-                                     code=lambda o, c: EVENT_TYPE_MAP[o.type](c)))
+                                     code=lambda o, c: EVENT_TYPE_MAP[o.type](c)),
+                                dict(time_ns=event_time_ns))
+
+
+def event_from_us(time_us, event_type, code, value):
+    """InputEvent from plain ints with a microsecond timestamp (ex: network frames)"""
+    event_type = EventType(event_type)
+    return InputEvent(time_us * 1e-6, event_type,
+                      EVENT_TYPE_MAP[event_type](code), value, time_us * 1000)
 
 
 class InputFile(object):
@@ -341,6 +680,9 @@ class InputFile(object):
     def write(self, data):
         return os.write(self._fd, data)
 
+    def ioctl(self, request, arg=0):
+        return fcntl.ioctl(self._fd, request, arg)
+
 
 class _Type:
 
@@ -397,17 +739,124 @@ class _Keys(_Type):
             return super().__getattr__(name)
 
 
+class _ForceFeedback(_Type):
+    """
+    Force feedback effects.
+
+    Devices only hold a few effects (see :attr:`max_effects`).
+    :meth:`play_effect` keeps the uploaded effects in an LRU cache so
+    replaying a known effect is a single write (no upload ioctl).
+    The least recently played effect is erased when the device is full
+    (including when effects uploaded with :meth:`upload` fill it).
+    """
+
+    _event_type = EventType.EV_FF
+
+    @property
+    def max_effects(self):
+        device = self.device
+        if device._max_effects is None:
+            device._max_effects = max_effects(device)
+        return device._max_effects
+
+    @property
+    def cached_effects(self):
+        return list(self.device._effects.values())
+
+    def upload(self, effect):
+        """Upload a new effect. Returns its id"""
+        effect.id = -1
+        return upload_effect(self.device, effect)
+
+    def update(self, effect):
+        """Update a previously uploaded effect (effect.id must be set)"""
+        return upload_effect(self.device, effect)
+
+    def erase(self, effect_id):
+        erase_effect(self.device, effect_id)
+        effects = self.device._effects
+        for key, cached_id in list(effects.items()):
+            if cached_id == effect_id:
+                del effects[key]
+
+    def play(self, effect_id, count=1):
+        self.device.write_event(EventType.EV_FF, effect_id, count)
+
+    def stop(self, effect_id):
+        self.device.write_event(EventType.EV_FF, effect_id, 0)
+
+    def set_gain(self, gain):
+        """Overall gain (0..0xFFFF)"""
+        self.device.write_event(EventType.EV_FF, ForceFeedback.FF_GAIN, gain)
+
+    def set_autocenter(self, value):
+        """Autocenter strength (0..0xFFFF, 0 disables)"""
+        self.device.write_event(EventType.EV_FF, ForceFeedback.FF_AUTOCENTER, value)
+
+    def play_effect(self, effect, count=1):
+        """
+        Play the effect, uploading it only if it is not already in the
+        device (LRU cache). Returns the effect id
+        """
+        key = ff_effect.from_buffer_copy(effect)
+        key.id = -1
+        key = bytes(key)
+        effects = self.device._effects
+        effect_id = effects.get(key)
+        if effect_id is None:
+            if len(effects) >= self.max_effects:
+                _, oldest = effects.popitem(last=False)
+                erase_effect(self.device, oldest)
+            while True:
+                try:
+                    effect_id = self.upload(effect)
+                    break
+                except OSError as error:
+                    # slots also taken by effects uploaded with upload()
+                    if error.errno != errno.ENOSPC or not effects:
+                        raise
+                    _, oldest = effects.popitem(last=False)
+                    erase_effect(self.device, oldest)
+            effects[key] = effect_id
+        else:
+            effects.move_to_end(key)
+            effect.id = effect_id
+        self.play(effect_id, count)
+        return effect_id
+
+    def clear(self):
+        """Erase all cached effects from the device"""
+        effects = self.device._effects
+        while effects:
+            erase_effect(self.device, effects.popitem()[1])
+
+
 class InputDevice(object):
 
     absolute = _Abs()
     keys = _Keys()
+    force_feedback = _ForceFeedback()
 
     def __init__(self, path):
         self._caps = None
-        self._fileobj = InputFile(path)
+        # clock of the event timestamps (see set_clock())
+        self.clock_id = time.CLOCK_REALTIME
+        # optional instrumentation (enjoy.stats.LatencyStats and
+        # enjoy.stats.StreamStats) filled by read_event() and read_events()
+        self.latency = None
+        self.stats = None
+        # callbacks registered with on() (see dispatch())
+        self._handlers = None
+        # force feedback: uploaded effects LRU cache {effect bytes: id}
+        self._effects = collections.OrderedDict()
+        self._max_effects = None
+        # path can also be a file like object (ex: enjoy.fake.FakeInputFile)
+        if isinstance(path, (str, bytes, os.PathLike)):
+            path = InputFile(path)
+        self._fileobj = path
 
     def __enter__(self):
-        self._fileobj.open()
+        self.open()
         return self
 
     def __exit__(self, exc_type, exc_value, tb):
@@ -416,11 +865,33 @@ class InputDevice(object):
     def fileno(self):
         return self._fileobj.fileno()
 
+    def ioctl(self, request, arg=0):
+        return ioctl(self._fileobj, request, arg)
+
     def open(self):
         self._fileobj.open()
+        if self.clock_id != time.CLOCK_REALTIME:
+            # the clock is a property of the open file
+            set_clock(self._fileobj, self.clock_id)
 
     def close(self):
         self._fileobj.close()
+        # the kernel erases the effects uploaded through the file
+        self._effects.clear()
+        self._max_effects = None
+
+    def set_clock(self, clock_id):
+        """
+        Select the clock of the event timestamps (ex: time.CLOCK_MONOTONIC
+        so they can be compared with time.monotonic_ns()). The latency
+        instrumentation, if any, follows. If the device is not open the
+        clock is applied when it opens (before any event is queued)
+        """
+        if self._fileobj.fileno() is not None:
+            set_clock(self._fileobj, clock_id)
+        self.clock_id = clock_id
+        if self.latency is not None:
+            self.latency.clock = clock_ns(clock_id)
 
     @property
     def uid(self):
@@ -455,6 +926,12 @@ class InputDevice(object):
     def get_abs_info(self, abs_code):
         return abs_info(self._fileobj, abs_code)
 
+    def set_abs_info(self, abs_code, info):
+        set_abs_info(self._fileobj, abs_code, info)
+
+    def get_mt_slots(self, abs_code, nb_slots, buff=None):
+        return mt_slots(self._fileobj, abs_code, nb_slots, buff=buff)
+
     @property
     def x(self):
         return self.get_abs_info(Absolute.ABS_X).value
@@ -479,41 +956,358 @@ class InputDevice(object):
     def rz(self):
         return self.get_abs_info(Absolute.ABS_RZ).value
 
+    def write_event(self, event_type, code, value):
+        """Write an event to the device (ex: play a force feedback effect)"""
+        return self._fileobj.write(event_struct.pack(0, 0, event_type, code, value))
+
     def read_event(self):
         """
         Read event.
         Event must be available to read or otherwise will raise an error
         """
-        return InputEvent.from_struct(read_event(self._fileobj.fileno()))
+        event = read_event(self._fileobj.fileno())
+        if self.stats is not None:
+            self.stats.record_read((event,))
+        latency = self.latency
+        if latency is None:
+            return InputEvent.from_struct(event)
+        event_time = event_time_ns(event)
+        latency.delivery.record(latency.clock() - event_time)
+        result = InputEvent.from_struct(event)
+        latency.handoff.record(latency.clock() - event_time)
+        return result
+
+    def on(self, event_type, code, handler):
+        """
+        Call ``handler(code, value, time_ns)`` for every *event_type*/*code*
+        event read by :meth:`dispatch`. Returns the handler
+        """
+        index = event_index(event_type, code)
+        if self._handlers is None:
+            self._handlers = handler_table()
+        self._handlers[index] = (self._handlers[index] or ()) + (handler,)
+        return handler
+
+    def off(self, event_type, code, handler=None):
+        """Remove *handler* (default: all handlers) of *event_type*/*code*"""
+        index = event_index(event_type, code)
+        if self._handlers is None:
+            return
+        slot = self._handlers[index] or ()
+        if handler is not None:
+            slot = tuple(h for h in slot if h is not handler)
+        else:
+            slot = ()
+        self._handlers[index] = slot or None
+
+    def dispatch(self, max_events=64):
+        """
+        Read up to *max_events* pending events and call the handlers
+        registered with :meth:`on`. Returns the number of events read.
+        Events must be available to read or otherwise will raise an error.
+        The :attr:`stats` and :attr:`latency` instrumentation is not
+        recorded: this path is kept as cheap as possible
+        """
+        if self._handlers is None:
+            self._handlers = handler_table()
+        return dispatch(self._fileobj.fileno(), self._handlers, max_events)
+
+    def dispatch_forever(self, timeout=None, max_events=64):
+        """
+        Dispatch events to the handlers until EOF or until no event
+        arrives within *timeout* seconds
+        """
+        fd = self._fileobj.fileno()
+        while select.select((fd,), (), (), timeout)[0]:
+            try:
+                self.dispatch(max_events)
+            except EOFError:
+                return
+
+    def read_events(self, max_events=64):
+        """
+        Read up to *max_events* pending events in a single read.
+        Events must be available to read or otherwise will raise an error
+        """
+        events = read_events(self._fileobj.fileno(), max_events)
+        if self.stats is not None:
+            self.stats.record_read(events)
+        if self.latency is None:
+            return [InputEvent.from_struct(event) for event in events]
+        clock, delivery, handoff = (self.latency.clock, self.latency.delivery,
+                                    self.latency.handoff)
+        read_time = clock()
+        result = []
+        for event in events:
+            event_time = event_time_ns(event)
+            delivery.record(read_time - event_time)
+            result.append(InputEvent.from_struct(event))
+            handoff.record(clock() - event_time)
+        return result
+
+
+class SelectWait(object):
+    """
+    Wait strategy: select() then a non blocking bulk read (two syscalls
+    per wakeup). Supports timeouts. The default.
+    """
+
+    def __init__(self, fd):
+        self.fd = fd
+
+    def read(self, max_events, timeout=None):
+        """
+        Wait for events and read them in bulk.
+        Returns the ctypes array of input_event or None on timeout.
+        Raises EOFError at the end of the source
+        """
+        if not select.select((self.fd,), (), (), timeout)[0]:
+            return None
+        return read_events(self.fd, max_events)
+
+    def close(self):
+        pass
+
+
+class BlockingWait(SelectWait):
+    """
+    Wait strategy: blocking bulk read (one syscall per wakeup). The file
+    is switched to blocking mode until :meth:`close`. No timeout support.
+    """
+
+    def __init__(self, fd):
+        super().__init__(fd)
+        self._blocking = os.get_blocking(fd)
+        os.set_blocking(fd, True)
+
+    def read(self, max_events, timeout=None):
+        if timeout is not None:
+            raise ValueError('blocking wait does not support timeout')
+        return read_events(self.fd, max_events)
+
+    def close(self):
+        os.set_blocking(self.fd, self._blocking)
+
+
+class EpollWait(SelectWait):
+    """Wait strategy: epoll (fd registered once) then a non blocking bulk read"""
+
+    def __init__(self, fd):
+        super().__init__(fd)
+        self._epoll = select.epoll()
+        self._epoll.register(fd, select.EPOLLIN)
+
+    def read(self, max_events, timeout=None):
+        if not self._epoll.poll(-1 if timeout is None else timeout):
+            return None
+        return read_events(self.fd, max_events)
+
+    def close(self):
+        self._epoll.close()
+
+
+class SpinWait(SelectWait):
+    """
+    Wait strategy: busy poll with non blocking reads for up to
+    *spin_budget* ns (None: spin until the timeout, ie, forever by
+    default), then fall back to select(). Lowest latency at the cost of a
+    full core: meant for dedicated (isolated) cores.
+    """
+
+    def __init__(self, fd, spin_budget=None):
+        super().__init__(fd)
+        self.spin_budget = spin_budget
+
+    def read(self, max_events, timeout=None):
+        fd, clock = self.fd, time.monotonic_ns
+        start = clock()
+        end = None if timeout is None else start + int(timeout * 1e9)
+        spin_end = end if self.spin_budget is None else start + self.spin_budget
+        if end is not None and spin_end is not None:
+            spin_end = min(spin_end, end)
+        while True:
+            try:
+                return read_events(fd, max_events)
+            except BlockingIOError:
+                pass
+            if spin_end is not None and clock() >= spin_end:
+                break
+        if end is None:
+            return super().read(max_events)
+        return super().read(max_events, max(end - clock(), 0) * 1e-9)
+
+
+WAIT_STRATEGIES = {
+    'select': SelectWait,
+    'blocking': BlockingWait,
+    'epoll': EpollWait,
+    'spin': SpinWait,
+}
+
+
+def wait_strategy(fd, wait='select', **kwargs):
+    """
+    Create a wait strategy for fd. *wait* is a name from WAIT_STRATEGIES
+    (extra *kwargs* go to its constructor, ex: spin_budget) or a class
+    """
+    if isinstance(wait, str):
+        wait = WAIT_STRATEGIES[wait]
+    return wait(fd, **kwargs)
+
+
+def event_stream(fd, latency=None, stats=None, max_events=64, timeout=None,
+                 wait='select', **wait_kwargs):
+    """
+    Generator of InputEvent read from fd. Pending events are read in
+    bulk (up to *max_events* per read). If *timeout* (s) is given, the
+    stream ends when no event arrives within that time.
+
+    *wait* selects how to wait for events (see WAIT_STRATEGIES):
+    'select' (default), 'blocking' (one syscall per wakeup, no timeout),
+    'epoll' or 'spin' (busy poll, see SpinWait: *spin_budget*). The
+    strategy belongs to the stream: to pick one per device, give each
+    device stream its own *wait*.
+
+    Optional instrumentation (there is no cost if not given):
+
+    * *latency*: enjoy.stats.LatencyStats which records the kernel to
+      user space latency of every event
+    * *stats*: enjoy.stats.StreamStats which counts reads, events,
+      drops and consumer stall time
+    """
+    if latency is None and stats is None:
+        return _event_stream(fd, max_events, timeout, wait, wait_kwargs)
+    return _instrumented_event_stream(fd, max_events, timeout, latency, stats,
+                                      wait, wait_kwargs)
+
+
+def _event_stream(fd, max_events, timeout, wait, wait_kwargs):
+    waiter = wait_strategy(fd, wait, **wait_kwargs)
+    try:
+        while True:
+            try:
+                events = waiter.read(max_events, timeout)
+            except EOFError:
+                # end of a non device source (ex: replay pipe)
+                return
+            if events is None:
+                return
+            for event in events:
+                yield InputEvent.from_struct(event)
+    finally:
+        waiter.close()
+
 
+def _instrumented_event_stream(fd, max_events, timeout, latency, stats,
+                               wait, wait_kwargs):
+    monotonic = time.monotonic_ns
+    last_read = None
+    waiter = wait_strategy(fd, wait, **wait_kwargs)
+    try:
+        while True:
+            if stats is not None and last_read is not None:
+                # time spent by the consumer with the previous batch
+                stats.record_stall(monotonic() - last_read)
+            try:
+                events = waiter.read(max_events, timeout)
+            except EOFError:
+                return
+            if events is None:
+                return
+            if stats is not None:
+                last_read = monotonic()
+                stats.record_read(events)
+            if latency is None:
+                for event in events:
+                    yield InputEvent.from_struct(event)
+                continue
+            clock, delivery, handoff = latency.clock, latency.delivery, latency.handoff
+            read_time = clock()
+            for event in events:
+                event_time = event_time_ns(event)
+                delivery.record(read_time - event_time)
+                result = InputEvent.from_struct(event)
+                handoff.record(clock() - event_time)
+                yield result
+    finally:
+        waiter.close()
 
-def event_stream(fd):
-    while True:
-        select.select((fd,), (), ())
-        yield InputEvent.from_struct(read_event(fd))
 
+async def async_event_stream(fd, maxsize=1000, latency=None, stats=None,
+                             max_events=64):
+    """
+    Asynchronous generator of InputEvent read from fd.
 
-async def async_event_stream(fd, maxsize=1000):
+    Events are queued (at most *maxsize*) as soon as they are available.
+    When the queue is full the device is not read until the consumer
+    catches up (events are kept by the kernel).
+    See :func:`event_stream` for the other arguments
+    """
     loop = asyncio.get_event_loop()
     queue = asyncio.Queue(maxsize=maxsize)
-    loop.add_reader(fd, lambda: queue.put_nowait(read_event(fd)))
+    monotonic = time.monotonic_ns
+    paused = error = None
+    if latency is not None:
+        clock, delivery, handoff = latency.clock, latency.delivery, latency.handoff
+
+    def on_readable():
+        nonlocal paused, error
+        room = max_events
+        if maxsize > 0:
+            room = min(room, maxsize - queue.qsize())
+        try:
+            events = read_events(fd, room)
+        except (EOFError, OSError) as err:
+            # EOF or read error (ex: device unplugged): end the stream
+            if not isinstance(err, EOFError):
+                error = err
+            loop.remove_reader(fd)
+            queue.put_nowait(None)
+            return
+        if latency is not None:
+            read_time = clock()
+            for event in events:
+                delivery.record(read_time - event_time_ns(event))
+        for event in events:
+            queue.put_nowait(event)
+        if stats is not None:
+            stats.record_read(events)
+            stats.record_queue_depth(queue.qsize())
+        if queue.full():
+            loop.remove_reader(fd)
+            paused = monotonic()
+
+    loop.add_reader(fd, on_readable)
     try:
         while True:
-            yield InputEvent.from_struct(await queue.get())
+            event = await queue.get()
+            if event is None:
+                if error is not None:
+                    raise error
+                return
+            if paused is not None and queue.qsize() <= maxsize // 2:
+                if stats is not None:
+                    stats.record_stall(monotonic() - paused)
+                paused = None
+                loop.add_reader(fd, on_readable)
+            result = InputEvent.from_struct(event)
+            if latency is not None:
+                handoff.record(clock() - event_time_ns(event))
+            yield result
     finally:
         loop.remove_reader(fd)
 
 
-def find_gamepads():
-    for path in list_devices():
+def find_gamepads(paths=None):
+    for path in list_devices() if paths is None else paths:
         with InputDevice(path) as dev:
             caps = dev.capabilities
         if EventType.EV_ABS in caps and Key.BTN_GAMEPAD in caps.get(EventType.EV_KEY, ()):
             yield dev
 
 
-def find_keyboards():
-    for path in list_devices():
+def find_keyboards(paths=None):
+    for path in list_devices() if paths is None else paths:
         with InputDevice(path) as dev:
             caps = dev.capabilities
         key_caps = caps.get(EventType.EV_KEY, ())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Multi-touch (protocol B) slot tracking.
+
+The state of every slot is kept in one ctypes array per ABS_MT code which
+has the exact EVIOCGMTSLOTS layout (code followed by the slot values) so
+the initial state is read directly into it with a single ioctl per code
+and events update it in place.
+"""
+
+from .input import Absolute, EventType, Synchronization, mt_slots_buffer
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+MT_CODES = tuple(code for code in Absolute
+                 if Absolute.ABS_MT_SLOT < code < Absolute.ABS_MAX)
+
+
+class MultiTouchState(object):
+    """
+    Array backed multi-touch protocol B state machine.
+
+    Feed it events with :meth:`process`. Values of a given code for all
+    slots are available through ``state[code]`` (the ctypes int32 array in
+    EVIOCGMTSLOTS layout: slot ``n`` is at index ``n + 1``) or, if numpy is
+    installed, as a zero-copy ``state.view(code)``.
+    """
+
+    def __init__(self, nb_slots, codes=MT_CODES):
+        self.nb_slots = nb_slots
+        self.codes = tuple(codes)
+        self.slot = 0
+        self.frame = 0
+        self.dropped = False
+        self._buffers = {}
+        self._slots = [None] * (Absolute.ABS_MAX + 1)
+        for code in self.codes:
+            buff = mt_slots_buffer(code, nb_slots)
+            self._buffers[code] = buff
+            self._slots[code] = buff
+        tracking = self._buffers.get(Absolute.ABS_MT_TRACKING_ID)
+        if tracking is not None:
+            for slot in range(1, nb_slots + 1):
+                tracking[slot] = -1
+
+    @classmethod
+    def from_device(cls, device):
+        """Create a state for the device and synchronize it"""
+        caps = device.capabilities[EventType.EV_ABS]
+        nb_slots = device.get_abs_info(Absolute.ABS_MT_SLOT).maximum + 1
+        state = cls(nb_slots, codes=[code for code in MT_CODES if code in caps])
+        state.sync(device)
+        return state
+
+    def sync(self, device):
+        """
+        (Re)read the full slot state from the device: one EVIOCGMTSLOTS
+        ioctl per code, written in place
+        """
+        for code, buff in self._buffers.items():
+            device.get_mt_slots(code, self.nb_slots, buff=buff)
+        self.slot = device.get_abs_info(Absolute.ABS_MT_SLOT).value
+        self.dropped = False
+
+    def update(self, code, value):
+        """Update the state with a single EV_ABS code/value pair"""
+        if code == Absolute.ABS_MT_SLOT:
+            self.slot = value
+            return
+        buff = self._slots[code]
+        if buff is not None and 0 <= self.slot < self.nb_slots:
+            buff[self.slot + 1] = value
+
+    def process(self, event):
+        """
+        Update the state with the given event.
+        Returns True when the event closes a frame (SYN_REPORT)
+        """
+        if event.type == EventType.EV_ABS:
+            self.update(event.code, event.value)
+        elif event.type == EventType.EV_SYN:
+            if event.code == Synchronization.SYN_REPORT:
+                self.frame += 1
+                return True
+            elif event.code == Synchronization.SYN_DROPPED:
+                # state is no longer reliable until the next sync()
+                self.dropped = True
+        return False
+
+    def __getitem__(self, code):
+        return self._buffers[code]
+
+    def values(self, code):
+        """Slot values for the given code as a list indexed by slot"""
+        return self._buffers[code][1:]
+
+    def view(self, code):
+        """Zero-copy numpy int32 view of the slot values for the code"""
+        if numpy is None:
+            raise RuntimeError('numpy is not available')
+        return numpy.frombuffer(self._buffers[code], dtype=numpy.int32)[1:]
+
+    def contacts(self):
+        """List of slots with an active contact (tracking id != -1)"""
+        tracking = self._buffers[Absolute.ABS_MT_TRACKING_ID]
+        return [slot for slot in range(self.nb_slots)
+                if tracking[slot + 1] != -1]
+
+    def contact(self, slot, codes=None):
+        """Values of the given codes for a slot as a tuple"""
+        codes = self.codes if codes is None else codes
+        index = slot + 1
+        return tuple(self._buffers[code][index] for code in codes)
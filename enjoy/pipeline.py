@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Declarative event filter and transform pipeline.
+
+Instead of ``if event.type == ... and event.code == ...`` chains, declare
+the steps once::
+
+    pipeline = (Pipeline()
+                .filter({EventType.EV_ABS: [Absolute.ABS_X, Absolute.ABS_Y],
+                         EventType.EV_KEY: None})
+                .remap({(EventType.EV_KEY, Key.BTN_SOUTH): (EventType.EV_KEY, Key.KEY_ENTER)})
+                .scale({(EventType.EV_ABS, Absolute.ABS_X): (1 / 128, -1)})
+                .dedupe())
+    for event in pipeline.stream(event_stream(fd)):
+        ...
+
+Consecutive filter/remap/scale/dedupe steps are compiled into a single
+dispatch table indexed by :func:`enjoy.input.event_index`: each entry holds the
+final outcome of the steps for that (type, code) (dropped, or output
+type, code, scale factor and offset, dedupe) so an event costs one table
+lookup whatever the number of steps. Entries are compiled the first time
+their (type, code) is seen.
+
+Any object with a ``process(batch)`` method returning a list of events
+(ex: :class:`enjoy.calibration.AxisCalibration`) can be inserted with
+:meth:`Pipeline.stage`.
+
+EV_SYN events are not subject to the steps. A SYN_REPORT closing a frame
+whose events were all dropped is dropped as well.
+"""
+
+from .input import (
+    EventType, Synchronization, EVENT_TYPE_MAP, CODE_BITS, EVENT_INDEX_SIZE,
+    event_index
+)
+
+# table entry not compiled yet
+_UNKNOWN = object()
+
+
+def _key(event_type, code):
+    event_index(event_type, code)   # raises ValueError if out of the table
+    return int(event_type), int(code)
+
+
+def _code(event_type, code):
+    try:
+        return EVENT_TYPE_MAP[event_type](code)
+    except (KeyError, ValueError):
+        return code
+
+
+class _Compiled(object):
+    """A run of filter/remap/scale/dedupe steps compiled in a table"""
+
+    def __init__(self, steps):
+        self.steps = steps
+        self.table = [_UNKNOWN] * EVENT_INDEX_SIZE
+        self.last = {}
+        self.emitted = False
+
+    def compile_key(self, event_type, code):
+        factor, offset, dedupe = None, 0, False
+        for kind, arg in self.steps:
+            if kind == 'filter':
+                if event_type not in arg:
+                    return None
+                codes = arg[event_type]
+                if codes is not None and code not in codes:
+                    return None
+            elif kind == 'remap':
+                event_type, code = arg.get((event_type, code), (event_type, code))
+            elif kind == 'scale':
+                scale = arg.get((event_type, code))
+                if scale is not None:
+                    scale_factor, scale_offset = scale
+                    if factor is None:
+                        factor, offset = scale_factor, scale_offset
+                    else:
+                        factor, offset = factor * scale_factor, offset * scale_factor + scale_offset
+            elif kind == 'dedupe':
+                if arg is None or (event_type, code) in arg:
+                    dedupe = True
+        event_type = EventType(event_type)
+        return (event_type, _code(event_type, code), factor, offset, dedupe,
+                event_index(event_type, code))
+
+    def process(self, events):
+        table, last, result = self.table, self.last, []
+        append = result.append
+        emitted = self.emitted
+        for event in events:
+            event_type = event.type
+            if event_type == EventType.EV_SYN:
+                if event.code == Synchronization.SYN_REPORT:
+                    if not emitted:
+                        continue
+                    emitted = False
+                append(event)
+                continue
+            code = event.code
+            key = event_type << CODE_BITS | code
+            entry = table[key]
+            if entry is _UNKNOWN:
+                entry = table[key] = self.compile_key(event_type, code)
+            if entry is None:
+                continue
+            out_type, out_code, factor, offset, dedupe, out_key = entry
+            value = event.value
+            if factor is not None:
+                value = value * factor + offset
+            if dedupe:
+                if last.get(out_key, _UNKNOWN) == value:
+                    continue
+                last[out_key] = value
+            if out_key != key:
+                event = event._replace(type=out_type, code=out_code, value=value)
+            elif factor is not None:
+                event = event._replace(value=value)
+            append(event)
+            emitted = True
+        self.emitted = emitted
+        return result
+
+
+class Pipeline(object):
+    """
+    Chain of event steps applied over batches of InputEvent (see module
+    documentation). Steps are added with the chainable methods below.
+    """
+
+    def __init__(self):
+        self.steps = []
+        self._stages = None
+
+    def _add(self, kind, arg):
+        self.steps.append((kind, arg))
+        self._stages = None
+        return self
+
+    def filter(self, events):
+        """
+        Keep only the given events: {event type: codes (None: all codes)}
+        """
+        result = {}
+        for event_type, codes in events.items():
+            event_type = _key(event_type, 0)[0]
+            result[event_type] = None if codes is None else \
+                frozenset(_key(event_type, code)[1] for code in codes)
+        return self._add('filter', result)
+
+    def remap(self, mapping):
+        """Change (type, code) of events: {(type, code): (new type, new code)}"""
+        mapping = {_key(*key): _key(*new_key) for key, new_key in mapping.items()}
+        return self._add('remap', mapping)
+
+    def scale(self, factors):
+        """
+        Scale values: {(type, code): factor or (factor, offset)}
+        (value * factor + offset)
+        """
+        result = {}
+        for (event_type, code), factor in factors.items():
+            if not isinstance(factor, (tuple, list)):
+                factor = factor, 0
+            result[_key(event_type, code)] = tuple(factor)
+        return self._add('scale', result)
+
+    def dedupe(self, events=None):
+        """
+        Drop events whose value didn't change since the last one with the
+        same (type, code). *events*: (type, code) pairs (default: all)
+        """
+        if events is not None:
+            events = frozenset(_key(t, c) for t, c in events)
+        return self._add('dedupe', events)
+
+    def stage(self, stage):
+        """Insert any object with a ``process(batch)`` method"""
+        return self._add('stage', stage)
+
+    def compile(self):
+        """Group the steps into stages (done automatically)"""
+        stages, run = [], []
+        for kind, arg in self.steps:
+            if kind == 'stage':
+                if run:
+                    stages.append(_Compiled(run))
+                    run = []
+                stages.append(arg)
+            else:
+                run.append((kind, arg))
+        if run:
+            stages.append(_Compiled(run))
+        self._stages = stages
+        return self
+
+    def process(self, events):
+        """Apply the pipeline to a batch of events. Returns a list"""
+        if self._stages is None:
+            self.compile()
+        for stage in self._stages:
+            events = stage.process(events)
+        return events if isinstance(events, list) else list(events)
+
+    __call__ = process
+
+    def stream(self, events):
+        """
+        Generator applying the pipeline to an event iterable (ex:
+        event_stream()) frame by frame
+        """
+        frame = []
+        for event in events:
+            frame.append(event)
+            if event.type == EventType.EV_SYN and \
+               event.code == Synchronization.SYN_REPORT:
+                yield from self.process(frame)
+                frame = []
+        if frame:
+            yield from self.process(frame)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Compact binary recording of raw input events.
+
+File layout::
+
+    header     magic, format version, record size, metadata size
+    metadata   JSON document (device name, id, capabilities, abs info...)
+    records    raw ``input_event`` structures, as read from the device
+    index      (time_ns, record number) every ``index_stride`` records
+    footer     index offset, index size, magic
+
+Everything is appended as it arrives. The index and footer are only
+written on close: a recording which was not closed properly (ex: crash)
+is still readable and searchable since records have a fixed size and
+are in time order.
+"""
+
+import sys
+import json
+import mmap
+import bisect
+import struct
+
+from .input import (
+    EventType, InputEvent, input_event, event_size, event_struct
+)
+
+MAGIC = b'ENJOYREC'
+INDEX_MAGIC = b'ENJOYIDX'
+VERSION = 1
+INDEX_STRIDE = 1024
+
+HEADER = struct.Struct('<8sHHI')
+INDEX_ENTRY = struct.Struct('<qQ')
+FOOTER = struct.Struct('<QQ8s')
+
+# native layout of struct input_event
+EVENT = event_struct
+
+
+def _time_ns(sec, usec):
+    return sec * 1000000000 + usec * 1000
+
+
+def device_metadata(device):
+    """Build the recording metadata (a JSON serializable dict) of a device"""
+    caps = device.capabilities
+    abs_info = {}
+    for code in caps.get(EventType.EV_ABS, ()):
+        abs_info[int(code)] = list(device.get_abs_info(code))
+    ff_effects_max = 0
+    if EventType.EV_FF in caps:
+        ff_effects_max = device.force_feedback.max_effects
+    return dict(
+        name=device.name,
+        physical_location=device.physical_location,
+        device_id=device.device_id.asdict(),
+        version=device.version,
+        capabilities={int(event_type): sorted(int(code) for code in codes)
+                      for event_type, codes in caps.items()},
+        abs_info=abs_info,
+        ff_effects_max=ff_effects_max,
+        byteorder=sys.byteorder,
+    )
+
+
+class Recorder(object):
+    """
+    Append-only writer of raw input event batches.
+
+    *data* given to :meth:`write` is the raw bytes read from the device
+    (a multiple of the input_event size).
+    """
+
+    def __init__(self, filename, metadata=None, index_stride=INDEX_STRIDE):
+        self.filename = filename
+        self.index_stride = index_stride
+        self.count = 0
+        self._index = []
+        meta = json.dumps(metadata or {}).encode()
+        self._file = open(filename, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, event_size, len(meta)))
+        self._file.write(meta)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def write(self, data):
+        nb_events, remainder = divmod(len(data), event_size)
+        if remainder:
+            raise ValueError('data is not a multiple of the event size')
+        stride = self.index_stride
+        start = self.count
+        # first record of this batch which must go to the index
+        record = -start % stride
+        while record < nb_events:
+            sec, usec = EVENT.unpack_from(data, record * event_size)[:2]
+            self._index.append((_time_ns(sec, usec), start + record))
+            record += stride
+        self._file.write(data)
+        self.count += nb_events
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file is None:
+            return
+        offset = self._file.tell()
+        for entry in self._index:
+            self._file.write(INDEX_ENTRY.pack(*entry))
+        self._file.write(FOOTER.pack(offset, len(self._index), INDEX_MAGIC))
+        self._file.close()
+        self._file = None
+
+
+class Recording(object):
+    """
+    mmap based reader of a recording.
+
+    Records are accessed by index without parsing the file. Use
+    :meth:`find` to locate the first record at a given time and
+    :meth:`raw` / :meth:`events` to iterate over ranges.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        with open(filename, 'rb') as fobj:
+            self._mmap = mmap.mmap(fobj.fileno(), 0, access=mmap.ACCESS_READ)
+        mm = self._mmap
+        magic, version, record_size, meta_size = HEADER.unpack_from(mm)
+        if magic != MAGIC:
+            raise ValueError('{!r} is not a recording'.format(filename))
+        if version != VERSION:
+            raise ValueError('unsupported recording version {}'.format(version))
+        if record_size != event_size:
+            raise ValueError('recording has incompatible record size')
+        self.offset = HEADER.size + meta_size
+        self.metadata = json.loads(mm[HEADER.size:self.offset].decode())
+        end = len(mm)
+        self.index = []
+        if end - self.offset >= FOOTER.size:
+            index_offset, index_size, magic = FOOTER.unpack_from(mm, end - FOOTER.size)
+            if magic == INDEX_MAGIC:
+                self.index = [
+                    INDEX_ENTRY.unpack_from(mm, index_offset + i * INDEX_ENTRY.size)
+                    for i in range(index_size)
+                ]
+                end = index_offset
+        self.count = (end - self.offset) // event_size
+        self._index_times = [entry[0] for entry in self.index]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        self._mmap.close()
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        """Raw (sec, usec, type, code, value) tuple of record *i*"""
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError('record index out of range')
+        return EVENT.unpack_from(self._mmap, self.offset + i * event_size)
+
+    def time_ns(self, i):
+        sec, usec = EVENT.unpack_from(self._mmap, self.offset + i * event_size)[:2]
+        return _time_ns(sec, usec)
+
+    @property
+    def start_ns(self):
+        return self.time_ns(0) if self.count else None
+
+    @property
+    def end_ns(self):
+        return self.time_ns(self.count - 1) if self.count else None
+
+    def find(self, time_ns):
+        """Index of the first record with a timestamp >= *time_ns*"""
+        lo, hi = 0, self.count
+        if self.index:
+            # narrow the search to a single stride using the sparse index
+            pos = bisect.bisect_left(self._index_times, time_ns)
+            if pos > 0:
+                lo = self.index[pos - 1][1]
+            if pos < len(self.index):
+                hi = self.index[pos][1]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.time_ns(mid) < time_ns:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, start, stop):
+        start = 0 if start is None else self.find(start)
+        stop = self.count if stop is None else self.find(stop)
+        return start, stop
+
+    def raw(self, start=None, stop=None):
+        """
+        Iterate over raw (sec, usec, type, code, value) tuples of the
+        records with start <= time_ns < stop
+        """
+        first, last = self._range(start, stop)
+        data = memoryview(self._mmap)[self.offset + first * event_size:
+                                      self.offset + last * event_size]
+        items = EVENT.iter_unpack(data)
+        try:
+            for item in items:
+                yield item
+        finally:
+            # drop the iterator buffer export before releasing the view
+            del items
+            data.release()
+
+    def events(self, start=None, stop=None):
+        """Iterate over InputEvent of the records with start <= time_ns < stop"""
+        first, last = self._range(start, stop)
+        mm, offset = self._mmap, self.offset
+        for i in range(first, last):
+            event = input_event.from_buffer_copy(mm, offset + i * event_size)
+            yield InputEvent.from_struct(event)
@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Event forwarding over the network.
+
+A :class:`Forwarder` reads the frames of a device and sends them to a
+:class:`Receiver` over TCP (Nagle disabled) or UDP (with sequence
+numbers: lost datagrams show up as a SYN_DROPPED). The receiver
+reconstructs the event stream or feeds a virtual device::
+
+    # robot
+    receiver = Receiver(('0.0.0.0', 5000), protocol='udp')
+    with receiver.virtual_device() as virtual:
+        receiver.forward_to(virtual)
+
+    # operator station
+    with InputDevice('/dev/input/event26') as pad:
+        Forwarder(pad, ('robot', 5000), protocol='udp').run()
+
+Wire format: a message is a kind byte followed by its payload (TCP
+messages are prefixed by their varint size, UDP datagrams carry a single
+message):
+
+* ``H``: JSON device metadata (see :func:`enjoy.record.device_metadata`)
+  (over UDP it is repeated every *hello_period* seconds)
+* ``F``: [UDP only: sequence number] number of frames then, for each
+  frame: time (µs, absolute for the first frame, delta to the previous
+  one otherwise), number of events and the events: type (byte), code
+  (varint) and value (zigzag varint). The SYN_REPORT closing each frame
+  is implicit. A gamepad axis event usually takes 3 or 4 bytes.
+
+With *coalesce*, consecutive frames read in the same batch which only
+carry axes (ABS, except multi-touch, and REL) are merged into one frame
+(last ABS value, summed REL values): when the network is slower than
+the device, stale intermediate positions are not sent.
+"""
+
+import json
+import time
+import select
+import socket
+import threading
+
+from .input import (
+    EventType, Synchronization, Absolute, event_from_us, read_events
+)
+from .record import device_metadata
+from .uinput import VirtualDevice
+
+TCP = 'tcp'
+UDP = 'udp'
+
+_SYN_DROPPED = (EventType.EV_SYN, Synchronization.SYN_DROPPED, 0)
+_MAX_DATAGRAM = 65507
+# UDP: a sequence number this far behind the last one means the
+# forwarder restarted
+_RESTART_GAP = 1000
+
+
+def write_varint(out, value):
+    """Append unsigned *value* to the bytearray *out* as a varint"""
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, pos):
+    """Decode a varint from data at pos. Returns (value, new pos)"""
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+
+def unzigzag(value):
+    return (value >> 1) ^ -(value & 1)
+
+
+def split_frames(events, pending):
+    """
+    Split raw input_event(s) into frames: (time µs, [(type, code, value)]).
+    *pending* (list) holds the events of the frame not yet closed by a
+    SYN_REPORT and is updated in place
+    """
+    frames = []
+    for event in events:
+        event_type, code = event.type, event.code
+        if event_type == EventType.EV_SYN and code == Synchronization.SYN_REPORT:
+            time_us = event.time.tv_sec * 1000000 + event.time.tv_usec
+            frames.append((time_us, pending[:]))
+            del pending[:]
+        else:
+            pending.append((event_type, code, event.value))
+    return frames
+
+
+def _coalescable(events):
+    for event_type, code, _ in events:
+        if event_type == EventType.EV_REL:
+            continue
+        if event_type == EventType.EV_ABS and code < Absolute.ABS_MT_SLOT:
+            continue
+        return False
+    return True
+
+
+def coalesce(frames):
+    """Merge consecutive frames carrying only axes (see module doc)"""
+    if len(frames) < 2:
+        return frames
+    result, merged, index = [], None, {}
+
+    def flush():
+        if merged is not None:
+            result.append((merged[0], [tuple(event) for event in merged[1]]))
+
+    for time_us, events in frames:
+        if not _coalescable(events):
+            flush()
+            merged = None
+            result.append((time_us, events))
+            continue
+        if merged is None:
+            merged, index = (time_us, []), {}
+        merged = time_us, merged[1]
+        merged_events = merged[1]
+        for event_type, code, value in events:
+            i = index.get((event_type, code))
+            if i is None:
+                index[event_type, code] = len(merged_events)
+                merged_events.append([event_type, code, value])
+            elif event_type == EventType.EV_REL:
+                merged_events[i][2] += value
+            else:
+                merged_events[i][2] = value
+    flush()
+    return result
+
+
+def encode_frames(frames, out):
+    """Append the encoded frames to the bytearray *out*"""
+    write_varint(out, len(frames))
+    previous = None
+    for time_us, events in frames:
+        if previous is None:
+            write_varint(out, time_us)
+        else:
+            write_varint(out, zigzag(time_us - previous))
+        previous = time_us
+        write_varint(out, len(events))
+        for event_type, code, value in events:
+            out.append(event_type)
+            write_varint(out, code)
+            write_varint(out, zigzag(value))
+    return out
+
+
+def decode_frames(data, pos=0):
+    """Decode frames encoded with :func:`encode_frames`. Returns (frames, pos)"""
+    nb_frames, pos = read_varint(data, pos)
+    frames, time_us = [], None
+    for _ in range(nb_frames):
+        value, pos = read_varint(data, pos)
+        time_us = value if time_us is None else time_us + unzigzag(value)
+        nb_events, pos = read_varint(data, pos)
+        events = []
+        for _ in range(nb_events):
+            event_type = data[pos]
+            code, pos = read_varint(data, pos + 1)
+            value, pos = read_varint(data, pos)
+            events.append((event_type, code, unzigzag(value)))
+        frames.append((time_us, events))
+    return frames, pos
+
+
+class Forwarder(object):
+    """
+    Send the frames of *device* (open InputDevice) to *address*
+    (host, port) over *protocol* (TCP or UDP).
+    """
+
+    def __init__(self, device, address, protocol=TCP, coalesce=False,
+                 hello_period=1.0):
+        if protocol not in (TCP, UDP):
+            raise ValueError('unsupported protocol {!r}'.format(protocol))
+        self.device = device
+        self.address = address
+        self.protocol = protocol
+        self.coalesce = coalesce
+        self.hello_period = hello_period
+        self.seq = 0
+        self.frames = 0
+        self.bytes = 0
+        self.sock = None
+        self._hello = b'H' + json.dumps(device_metadata(device)).encode()
+        self._last_hello = None
+        self._pending = []
+        self._buff = bytearray()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def connect(self):
+        if self.protocol == TCP:
+            sock = socket.create_connection(self.address)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(self.address)
+        self.sock = sock
+        self._send(self._hello)
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _send(self, message):
+        if self.protocol == TCP:
+            header = bytearray()
+            write_varint(header, len(message))
+            self.sock.sendall(header + message)
+        else:
+            self.sock.send(message)
+            if message[:1] == b'H':
+                self._last_hello = time.monotonic()
+        self.bytes += len(message)
+
+    def forward(self, events):
+        """Send the complete frames of a batch of raw input_event(s)"""
+        frames = split_frames(events, self._pending)
+        if not frames:
+            return
+        if self.coalesce:
+            frames = coalesce(frames)
+        buff = self._buff
+        del buff[:]
+        buff.append(ord('F'))
+        if self.protocol == UDP:
+            now = time.monotonic()
+            if now - self._last_hello > self.hello_period:
+                # a receiver may have (re)started
+                self._send(self._hello)
+            write_varint(buff, self.seq)
+            self.seq += 1
+        encode_frames(frames, buff)
+        self._send(buff)
+        self.frames += len(frames)
+
+    def run(self, timeout=0.1):
+        """Forward the device frames until :meth:`close` or device EOF"""
+        if self.sock is None:
+            self.connect()
+        fd = self.device.fileno()
+        self._stop.clear()
+        while not self._stop.is_set():
+            if not select.select((fd,), (), (), timeout)[0]:
+                continue
+            try:
+                events = read_events(fd)
+            except EOFError:
+                break
+            self.forward(events)
+
+    def start(self):
+        """Forward from a background thread"""
+        if self.sock is None:
+            self.connect()
+        self._thread = threading.Thread(target=self.run, name='Forwarder',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+
+class Receiver(object):
+    """
+    Receive the frames sent by a :class:`Forwarder`. Listens on
+    *address* (host, port; port 0 picks a free port: see :attr:`address`).
+    Over TCP the first incoming connection is accepted.
+    """
+
+    def __init__(self, address, protocol=TCP):
+        if protocol not in (TCP, UDP):
+            raise ValueError('unsupported protocol {!r}'.format(protocol))
+        self.protocol = protocol
+        self.metadata = None
+        self.seq = None
+        self.lost = 0
+        self.late = 0
+        self._conn = None
+        self._buff = bytearray()
+        kind = socket.SOCK_STREAM if protocol == TCP else socket.SOCK_DGRAM
+        self.sock = socket.socket(socket.AF_INET, kind)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.sock.bind(address)
+        if protocol == TCP:
+            self.sock.listen(1)
+
+    @property
+    def address(self):
+        return self.sock.getsockname()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        self.sock.close()
+
+    def fileno(self):
+        return (self.sock if self._conn is None else self._conn).fileno()
+
+    def _messages(self):
+        """Receive (blocking) the next message(s)"""
+        if self.protocol == UDP:
+            return [self.sock.recv(_MAX_DATAGRAM)]
+        if self._conn is None:
+            self._conn, _ = self.sock.accept()
+            self._conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        data = self._conn.recv(65536)
+        if not data:
+            raise EOFError('forwarder closed the connection')
+        buff = self._buff
+        buff += data
+        messages, pos = [], 0
+        while pos < len(buff):
+            try:
+                size, start = read_varint(buff, pos)
+            except IndexError:
+                break
+            if start + size > len(buff):
+                break
+            messages.append(bytes(buff[start:start + size]))
+            pos = start + size
+        del buff[:pos]
+        return messages
+
+    def _decode(self, message):
+        kind = message[:1]
+        if kind == b'H':
+            self.metadata = json.loads(message[1:].decode())
+            # the forwarder may have restarted (its sequence from 0)
+            self.seq = None
+            return []
+        if kind != b'F':
+            return []
+        pos, frames = 1, []
+        if self.protocol == UDP:
+            seq, pos = read_varint(message, pos)
+            if self.seq is not None:
+                if seq <= self.seq < seq + _RESTART_GAP:
+                    # duplicated or out of order
+                    self.late += 1
+                    return []
+                # (a large jump backwards is a restarted forwarder)
+                if seq > self.seq + 1:
+                    self.lost += seq - self.seq - 1
+                    frames.append((None, [_SYN_DROPPED]))
+            self.seq = seq
+        decoded = decode_frames(message, pos)[0]
+        if frames:
+            frames[0] = (decoded[0][0] if decoded else 0, frames[0][1])
+        return frames + decoded
+
+    def read_frames(self):
+        """
+        Read (blocking) the next frames: list of (time µs, [(type, code,
+        value)]). A frame holding a SYN_DROPPED signals lost frames.
+        Raises EOFError when a TCP forwarder disconnects
+        """
+        while True:
+            frames = []
+            for message in self._messages():
+                frames.extend(self._decode(message))
+            if frames:
+                return frames
+
+    def event_stream(self, timeout=None):
+        """
+        Generator of InputEvent (each frame is closed by a SYN_REPORT).
+        Ends when the forwarder disconnects (TCP) or after *timeout*
+        seconds without events
+        """
+        while True:
+            if not select.select((self,), (), (), timeout)[0]:
+                return
+            try:
+                frames = self.read_frames()
+            except EOFError:
+                return
+            for time_us, events in frames:
+                for event in events:
+                    yield event_from_us(time_us, *event)
+                if events != [_SYN_DROPPED]:
+                    yield event_from_us(time_us, EventType.EV_SYN,
+                                        Synchronization.SYN_REPORT, 0)
+
+    def virtual_device(self, timeout=None, **kwargs):
+        """
+        Create (not opened) a VirtualDevice like the remote device.
+        Waits for the device metadata if not yet received
+        """
+        start = time.monotonic()
+        while self.metadata is None:
+            remaining = None if timeout is None else timeout - (time.monotonic() - start)
+            if remaining is not None and remaining <= 0:
+                raise TimeoutError('no device metadata received')
+            if select.select((self,), (), (), remaining)[0]:
+                for message in self._messages():
+                    self._decode(message)
+        return VirtualDevice.from_metadata(self.metadata, **kwargs)
+
+    def forward_to(self, sink):
+        """
+        Write the received frames to *sink* (ex: an open VirtualDevice:
+        anything with ``write_events(batch)``) until the forwarder
+        disconnects (TCP)
+        """
+        while True:
+            try:
+                frames = self.read_frames()
+            except EOFError:
+                return
+            for _, events in frames:
+                if events != [_SYN_DROPPED]:
+                    sink.write_events(events)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Timing accurate replay of recordings (see :mod:`enjoy.record`).
+
+A :class:`Replayer` writes the recorded frames into a pipe at the right
+time so any consumer of the regular stream API can use it as if it was
+a device::
+
+    with Recording('session.rec') as rec, Replayer(rec, speed=2) as replayer:
+        for event in event_stream(replayer.fileno()):
+            ...
+
+Frame deadlines are computed from the replay start (absolute deadlines)
+so sleep inaccuracies don't accumulate over long sessions.
+"""
+
+import os
+import time
+import threading
+
+from .input import EventType, Synchronization, InputEvent, input_event
+from .record import EVENT
+
+
+def frames(recording, start=None, stop=None):
+    """
+    Group the records in frames (terminated by SYN_REPORT).
+    Yields (time_ns, [raw records]) tuples
+    """
+    frame = []
+    for item in recording.raw(start, stop):
+        frame.append(item)
+        if item[2] == EventType.EV_SYN and item[3] == Synchronization.SYN_REPORT:
+            sec, usec = frame[0][:2]
+            yield sec * 1000000000 + usec * 1000, frame
+            frame = []
+    if frame:
+        sec, usec = frame[0][:2]
+        yield sec * 1000000000 + usec * 1000, frame
+
+
+def schedule(recording, speed=1.0, start=None, stop=None,
+             clock=time.monotonic_ns, sleep=time.sleep):
+    """
+    Yield the frames of the recording at their replay time.
+
+    *speed* scales the original timing (2 means twice as fast). None
+    (or 0) means as fast as possible. Each frame deadline is absolute
+    (relative to the replay start), so delays don't accumulate.
+    Yields (lag_ns, frame) where lag_ns is how late the frame was
+    delivered with respect to its deadline.
+    """
+    origin = first = None
+    for frame_ns, frame in frames(recording, start, stop):
+        if not speed:
+            yield 0, frame
+            continue
+        if origin is None:
+            origin, first = clock(), frame_ns
+        deadline = origin + int((frame_ns - first) / speed)
+        delay = deadline - clock()
+        if delay > 0:
+            sleep(delay * 1e-9)
+        yield max(0, clock() - deadline), frame
+
+
+def _pack(frame, retime):
+    if retime:
+        now = time.time_ns()
+        sec, usec = now // 1000000000, (now // 1000) % 1000000
+        return b''.join(EVENT.pack(sec, usec, *item[2:]) for item in frame)
+    return b''.join(EVENT.pack(*item) for item in frame)
+
+
+def replay_events(recording, speed=1.0, start=None, stop=None):
+    """
+    Yield the recorded events as InputEvent at their replay time (no
+    pipe involved)
+    """
+    for _, frame in schedule(recording, speed=speed, start=start, stop=stop):
+        for item in frame:
+            yield InputEvent.from_struct(input_event.from_buffer_copy(EVENT.pack(*item)))
+
+
+class Replayer(object):
+    """
+    Replay a recording through a pipe.
+
+    :meth:`fileno` can be given to :func:`enjoy.input.event_stream` or
+    :func:`enjoy.input.async_event_stream`. The stream ends when the
+    recording is exhausted.
+
+    If *retime* is True, events are stamped with the replay time (real
+    time clock, like the kernel default) instead of the recorded time.
+    """
+
+    def __init__(self, recording, speed=1.0, start=None, stop=None,
+                 retime=False):
+        self.recording = recording
+        self.speed = speed
+        self.start_ns = start
+        self.stop_ns = stop
+        self.retime = retime
+        self.frames = 0
+        self.events = 0
+        self.max_lag_ns = 0
+        self._read_fd = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def fileno(self):
+        return self._read_fd
+
+    def start(self):
+        self._read_fd, write_fd = os.pipe()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(write_fd,), name='Replayer', daemon=True)
+        self._thread.start()
+
+    def _run(self, fd):
+        # waiting on the stop event: close() doesn't wait for long gaps
+        sched = schedule(self.recording, speed=self.speed,
+                         start=self.start_ns, stop=self.stop_ns,
+                         sleep=self._stop.wait)
+        try:
+            for lag, frame in sched:
+                if self._stop.is_set():
+                    break
+                os.write(fd, _pack(frame, self.retime))
+                self.frames += 1
+                self.events += len(frame)
+                self.max_lag_ns = max(self.max_lag_ns, lag)
+        except OSError:
+            # consumer side closed
+            pass
+        finally:
+            os.close(fd)
+
+    def join(self, timeout=None):
+        """Wait for the replay to finish"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        self._stop.set()
+        if self._read_fd is not None:
+            os.close(self._read_fd)
+            self._read_fd = None
+        self.join()
+        self._thread = None
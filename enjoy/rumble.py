@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Rumble streaming.
+
+Applications typically compute a rumble intensity every frame. Uploading
+it every time means an EVIOCSFF ioctl per frame per device. The
+:class:`RumbleScheduler` only keeps the latest requested intensity of
+each device and applies it at a bounded rate, and only if it changed
+more than a threshold::
+
+    scheduler = RumbleScheduler(rate=30)
+    scheduler.start()                  # or: await scheduler.run()
+    while True:
+        scheduler.set(pad, strong, weak)   # no syscall
+        ...
+"""
+
+import time
+import asyncio
+import threading
+
+from .input import rumble_effect
+
+
+class _Rumble(object):
+
+    __slots__ = ('effect', 'applied', 'playing', 'last_play')
+
+    def __init__(self, length):
+        self.effect = rumble_effect(0, 0, length=length)
+        self.applied = (0, 0)
+        self.playing = False
+        self.last_play = 0
+
+
+class RumbleScheduler(object):
+    """
+    Merge rumble updates of several devices and apply them at most
+    *rate* times per second.
+
+    An update is only uploaded if the strong or the weak magnitude
+    changed more than *threshold* (0..0xFFFF) since the last upload.
+    Stopping (0, 0) is always applied. Rumble effects last *length* ms
+    and are replayed while active so they don't expire.
+    """
+
+    def __init__(self, rate=60.0, threshold=0x400, length=1000):
+        self.period = 1 / rate
+        self.threshold = threshold
+        self.length = length
+        self.keepalive = length / 2000
+        self.requests = 0
+        self.uploads = 0
+        self.plays = 0
+        # devices which failed (ex: unplugged)
+        self.errors = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._rumbles = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def set(self, device, strong, weak):
+        """Request a rumble intensity (0..0xFFFF). Cheap: no syscall"""
+        with self._lock:
+            self._pending[device] = strong, weak
+            self.requests += 1
+
+    def stop(self, device):
+        self.set(device, 0, 0)
+
+    def _apply(self, device, rumble, strong, weak, now):
+        if strong == 0 and weak == 0:
+            if rumble.playing:
+                device.force_feedback.stop(rumble.effect.id)
+                rumble.playing = False
+            rumble.applied = 0, 0
+            return
+        effect = rumble.effect
+        effect.u.rumble.strong_magnitude = strong
+        effect.u.rumble.weak_magnitude = weak
+        if effect.id == -1:
+            device.force_feedback.upload(effect)
+        else:
+            device.force_feedback.update(effect)
+        self.uploads += 1
+        rumble.applied = strong, weak
+        if not rumble.playing:
+            self._play(device, rumble, now)
+
+    def _play(self, device, rumble, now):
+        device.force_feedback.play(rumble.effect.id)
+        rumble.playing = True
+        rumble.last_play = now
+        self.plays += 1
+
+    def tick(self, now=None):
+        """Apply the pending requests (called by the timer)"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        threshold = self.threshold
+        for device, (strong, weak) in pending.items():
+            rumble = self._rumbles.get(device)
+            if rumble is None:
+                rumble = self._rumbles[device] = _Rumble(self.length)
+            applied_strong, applied_weak = rumble.applied
+            try:
+                if strong == 0 and weak == 0:
+                    self._apply(device, rumble, 0, 0, now)
+                elif abs(strong - applied_strong) > threshold or \
+                     abs(weak - applied_weak) > threshold or \
+                     not rumble.playing:
+                    self._apply(device, rumble, strong, weak, now)
+            except OSError:
+                self._failed(device)
+        for device, rumble in list(self._rumbles.items()):
+            if rumble.playing and now - rumble.last_play > self.keepalive:
+                try:
+                    self._play(device, rumble, now)
+                except OSError:
+                    self._failed(device)
+
+    def _failed(self, device):
+        # forget the device: the others keep going
+        self.errors += 1
+        self._rumbles.pop(device, None)
+
+    def start(self):
+        """Apply the updates from a background thread"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='RumbleScheduler',
+                                        daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        start, tick = time.monotonic(), 0
+        while not self._stop.is_set():
+            self.tick()
+            tick += 1
+            # absolute deadlines: no drift
+            delay = start + tick * self.period - time.monotonic()
+            if delay > 0:
+                self._stop.wait(delay)
+
+    async def run(self):
+        """Apply the updates from an asyncio task (until cancelled)"""
+        start, tick = time.monotonic(), 0
+        while True:
+            self.tick()
+            tick += 1
+            await asyncio.sleep(max(0, start + tick * self.period - time.monotonic()))
+
+    def close(self):
+        """Stop the timer and the rumble of all devices"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            for device in self._rumbles:
+                self._pending[device] = 0, 0
+        self.tick()
+        for device, rumble in self._rumbles.items():
+            if rumble.effect.id != -1:
+                try:
+                    device.force_feedback.erase(rumble.effect.id)
+                except OSError:
+                    self.errors += 1
+        self._rumbles.clear()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Fixed rate state sampling for control loops.
+
+A :class:`Sampler` reads the device events in a single background thread
+(sleeping in select() until the next tick deadline) and, at every tick,
+takes a sample-and-hold snapshot of the state vector: the selected axes
+and keys. Samples are delivered to a callback and/or stored in a
+preallocated numpy ring::
+
+    sampler = Sampler(pad, rate=500, ring_size=5000)
+    sampler.start()
+    ...
+    times, samples = sampler.latest(100)   # last 100 ticks
+    sampler.close()
+    print(sampler.jitter.summary(), sampler.overruns)
+
+Ticks follow absolute deadlines (no drift). Each tick lateness is
+recorded in the :attr:`Sampler.jitter` histogram (ns). When a tick is
+late by more than a period the missed ticks are skipped and counted in
+:attr:`Sampler.overruns`.
+"""
+
+import time
+import select
+import threading
+
+from .input import (
+    EventType, Synchronization, Absolute, CODE_BITS, event_index, read_events
+)
+from .stats import Histogram
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class Sampler(object):
+    """
+    Sample the state of *device* (open InputDevice) *rate* times per second.
+
+    *axes*: ABS codes to sample (default: all the non multi-touch axes)
+    *keys*: key codes to sample (default: all the device keys)
+    *callback*: called at each tick with ``(tick, time_ns, values)``
+    (*values* is a tuple with the axes then the keys (0/1) values)
+    *ring_size*: if given, samples are stored in a numpy ring (see
+    :meth:`latest`)
+    """
+
+    def __init__(self, device, rate=500.0, axes=None, keys=None,
+                 callback=None, ring_size=None, clock=time.monotonic_ns):
+        caps = device.capabilities
+        if axes is None:
+            axes = sorted(code for code in caps.get(EventType.EV_ABS, ())
+                          if code < Absolute.ABS_MT_SLOT)
+        if keys is None:
+            keys = sorted(caps.get(EventType.EV_KEY, ()))
+        self.device = device
+        self.period = int(1000000000 / rate)
+        self.columns = [(EventType.EV_ABS, code) for code in axes] + \
+                       [(EventType.EV_KEY, code) for code in keys]
+        self.callback = callback
+        self.clock = clock
+        # column of each (type, code) indexed by event_index()
+        self._index = {}
+        for column, (event_type, code) in enumerate(self.columns):
+            self._index[event_index(event_type, code)] = column
+        self.values = [0] * len(self.columns)
+        self.tick = 0
+        self.overruns = 0
+        self.jitter = Histogram()
+        self._pending = []
+        self._dropped = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.ring = self.ring_times = None
+        if ring_size:
+            if numpy is None:
+                raise RuntimeError('numpy is not available')
+            self.ring = numpy.zeros((ring_size, len(self.columns)), dtype=numpy.int32)
+            self.ring_times = numpy.zeros(ring_size, dtype=numpy.int64)
+        self.count = 0
+        self.sync()
+
+    def sync(self):
+        """(Re)read the current state of the sampled codes from the device"""
+        device, values = self.device, self.values
+        pressed = None
+        for column, (event_type, code) in enumerate(self.columns):
+            if event_type == EventType.EV_ABS:
+                values[column] = device.get_abs_info(code).value
+            else:
+                if pressed is None:
+                    pressed = device.active_keys
+                values[column] = int(code in pressed)
+        self._pending = []
+        self._dropped = False
+
+    def process(self, events):
+        """Update the state with raw input_event(s) (applied frame by frame)"""
+        index, pending = self._index, self._pending
+        for event in events:
+            event_type = event.type
+            if event_type == EventType.EV_SYN:
+                if event.code == Synchronization.SYN_REPORT:
+                    if self._dropped:
+                        self.sync()
+                        pending = self._pending
+                        continue
+                    values = self.values
+                    for column, value in pending:
+                        values[column] = value
+                    del pending[:]
+                elif event.code == Synchronization.SYN_DROPPED:
+                    self._dropped = True
+                continue
+            column = index.get(event_type << CODE_BITS | event.code)
+            if column is not None:
+                if event_type == EventType.EV_KEY:
+                    # autorepeat (2) is still pressed
+                    pending.append((column, 1 if event.value else 0))
+                else:
+                    pending.append((column, event.value))
+
+    def sample(self, time_ns):
+        """Take the sample of the current tick"""
+        values = tuple(self.values)
+        if self.ring is not None:
+            i = self.count % len(self.ring)
+            self.ring[i] = values
+            self.ring_times[i] = time_ns
+        self.count += 1
+        if self.callback is not None:
+            self.callback(self.tick, time_ns, values)
+
+    def latest(self, n=None):
+        """
+        (times, samples) of the last *n* ticks (default: whole ring) as
+        numpy arrays (copies), oldest first
+        """
+        if self.ring is None:
+            raise RuntimeError('sampler has no ring')
+        size = len(self.ring)
+        # at most a whole ring: older rows are overwritten
+        n = min(self.count, size, size if n is None else n)
+        indexes = numpy.arange(self.count - n, self.count) % size
+        return self.ring_times[indexes], self.ring[indexes]
+
+    def run(self):
+        """Sample until :meth:`close` (or device EOF)"""
+        fd, clock, period = self.device.fileno(), self.clock, self.period
+        self._stop.clear()
+        start = clock()
+        self.tick = 0
+        deadline = start
+        while not self._stop.is_set():
+            now = clock()
+            while now < deadline:
+                readable = select.select((fd,), (), (), (deadline - now) * 1e-9)[0]
+                if readable:
+                    try:
+                        self.process(read_events(fd))
+                    except EOFError:
+                        return
+                now = clock()
+            if select.select((fd,), (), (), 0)[0]:
+                # freshest state for the sample
+                try:
+                    self.process(read_events(fd))
+                except EOFError:
+                    return
+            late = now - deadline
+            self.jitter.record(late)
+            if late >= period:
+                # missed ticks are skipped
+                missed = late // period
+                self.overruns += missed
+                self.tick += missed
+            self.sample(now)
+            self.tick += 1
+            deadline = start + self.tick * period
+
+    def start(self):
+        """Sample from a background thread"""
+        self._thread = threading.Thread(target=self.run, name='Sampler',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Device state shared between processes.
+
+A :class:`StatePublisher` owns the device, reads its events and writes
+the state (keys bitset, axes, multi-touch slots) to shared memory at the
+end of each frame. Any number of :class:`StateReader` (in any local
+process) take consistent snapshots of it without a syscall::
+
+    # process 1
+    with InputDevice('/dev/input/event26') as pad:
+        publisher = StatePublisher(pad, name='pad0')
+        publisher.run()
+
+    # process 2..N
+    reader = StateReader('pad0')
+    state = reader.snapshot()
+    state.keys, state.abs[Absolute.ABS_X]
+
+Consistency is ensured with a seqlock: the writer makes the sequence
+number odd while it updates the state and even when done. Readers copy
+the state and retry if the sequence number changed meanwhile.
+
+Layout: header (magic, version, number of slots, number of MT codes, MT
+codes), sequence number (u64) and the state: frame timestamp (ns), frame
+count, keys (EVIOCGKEY layout), axes (native int32 per ABS code) and, for
+each MT code, the EVIOCGMTSLOTS layout buffer.
+"""
+
+import time
+import array
+import select
+import struct
+import threading
+import itertools
+import collections
+from multiprocessing import shared_memory
+
+from .input import (
+    EventType, Synchronization, Absolute, KeyState, read_events,
+    event_time_ns, _enum_bit_size, Key
+)
+from .multitouch import MultiTouchState
+
+MAGIC = b'ENJOYSHM'
+VERSION = 1
+
+_HEADER = struct.Struct('<8sHHH')
+_SEQ = struct.Struct('<Q')
+_FRAME = struct.Struct('<qQ')
+# busy read retries (write in progress) before yielding the CPU
+_SPIN_RETRIES = 1000
+
+_KEYS_SIZE = _enum_bit_size(Key)
+_NB_ABS = Absolute.ABS_MAX + 1
+
+
+Snapshot = collections.namedtuple('Snapshot', 'seq time_ns frames keys abs mt')
+Snapshot.__doc__ = """\
+Consistent copy of a device state:
+seq (frame sequence number), time_ns (kernel timestamp of the frame),
+frames, keys (KeyState), abs (int32 array indexed by ABS code) and
+mt ({MT code: values indexed by slot})"""
+
+
+class _Layout(object):
+
+    def __init__(self, nb_slots, mt_codes):
+        self.nb_slots = nb_slots
+        self.mt_codes = tuple(mt_codes)
+        header_size = _HEADER.size + 2 * len(self.mt_codes)
+        # 8 byte aligned sequence number
+        self.seq_offset = (header_size + 7) & ~7
+        self.state_offset = self.seq_offset + _SEQ.size
+        self.keys_offset = _FRAME.size
+        self.abs_offset = self.keys_offset + _KEYS_SIZE
+        self.mt_offset = self.abs_offset + 4 * _NB_ABS
+        self.mt_size = 4 * (nb_slots + 1)
+        self.state_size = self.mt_offset + self.mt_size * len(self.mt_codes)
+        self.size = self.state_offset + self.state_size
+
+    def pack_header(self, buff):
+        _HEADER.pack_into(buff, 0, MAGIC, VERSION, self.nb_slots,
+                          len(self.mt_codes))
+        struct.pack_into('<{}H'.format(len(self.mt_codes)), buff,
+                         _HEADER.size, *self.mt_codes)
+
+    @classmethod
+    def unpack_header(cls, buff):
+        magic, version, nb_slots, nb_codes = _HEADER.unpack_from(buff)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('not an enjoy shared state (version {})'.format(VERSION))
+        codes = struct.unpack_from('<{}H'.format(nb_codes), buff, _HEADER.size)
+        return cls(nb_slots, [Absolute(code) for code in codes])
+
+
+class StatePublisher(object):
+    """
+    Publish the state of *device* in shared memory *name* (a random
+    name is chosen if None: see :attr:`name`).
+
+    Feed it raw events (:func:`~enjoy.input.read_events`) with
+    :meth:`process` or let it read the device with :meth:`run` /
+    :meth:`start`. Call :meth:`close` to release the shared memory.
+    """
+
+    def __init__(self, device, name=None):
+        self.device = device
+        caps = device.capabilities
+        self._abs_codes = [code for code in caps.get(EventType.EV_ABS, ())
+                           if code < Absolute.ABS_MT_SLOT]
+        if Absolute.ABS_MT_SLOT in caps.get(EventType.EV_ABS, ()):
+            self.mt = MultiTouchState.from_device(device)
+            layout = _Layout(self.mt.nb_slots, self.mt.codes)
+        else:
+            self.mt = None
+            layout = _Layout(0, ())
+        self.layout = layout
+        self.keys = KeyState()
+        self.frames = 0
+        self.time_ns = 0
+        self._state = bytearray(layout.state_size)
+        self._abs = memoryview(self._state)[layout.abs_offset:layout.mt_offset].cast('i')
+        self._seq = 0
+        self._dropped = False
+        self._stop = threading.Event()
+        self._thread = None
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=layout.size)
+        self._buff = self.shm.buf
+        layout.pack_header(self._buff)
+        _SEQ.pack_into(self._buff, layout.seq_offset, 0)
+        self.sync()
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def seq(self):
+        """Number of published frames"""
+        return self._seq // 2
+
+    def sync(self):
+        """(Re)read the full state from the device and publish it"""
+        self.keys = self.device.active_keys
+        for code in self._abs_codes:
+            self._abs[code] = self.device.get_abs_info(code).value
+        if self.mt is not None:
+            self.mt.sync(self.device)
+        self._dropped = False
+        self.publish()
+
+    def publish(self):
+        """Write the current state to shared memory (seqlock protected)"""
+        layout, state, buff = self.layout, self._state, self._buff
+        _FRAME.pack_into(state, 0, self.time_ns, self.frames)
+        state[layout.keys_offset:layout.abs_offset] = self.keys.to_bytes()
+        if self.mt is not None:
+            offset, size = layout.mt_offset, layout.mt_size
+            for code in layout.mt_codes:
+                state[offset:offset + size] = bytes(self.mt[code])
+                offset += size
+        seq = self._seq + 1
+        _SEQ.pack_into(buff, layout.seq_offset, seq)
+        buff[layout.state_offset:layout.size] = state
+        self._seq = seq + 1
+        _SEQ.pack_into(buff, layout.seq_offset, self._seq)
+
+    def process(self, events):
+        """Update the state with raw input_event(s) and publish each frame"""
+        keys, axes, mt = self.keys, self._abs, self.mt
+        for event in events:
+            event_type = event.type
+            if event_type == EventType.EV_KEY:
+                keys.set(event.code, event.value)
+            elif event_type == EventType.EV_ABS:
+                code = event.code
+                if code < Absolute.ABS_MT_SLOT:
+                    axes[code] = event.value
+                elif mt is not None:
+                    mt.update(code, event.value)
+            elif event_type == EventType.EV_SYN:
+                if event.code == Synchronization.SYN_REPORT:
+                    self.frames += 1
+                    self.time_ns = event_time_ns(event)
+                    if self._dropped:
+                        # events were lost: the kernel state is the truth
+                        self.sync()
+                        keys = self.keys
+                    else:
+                        self.publish()
+                elif event.code == Synchronization.SYN_DROPPED:
+                    self._dropped = True
+
+    def run(self, timeout=0.1):
+        """Read the device and publish its state until :meth:`close`"""
+        fd = self.device.fileno()
+        self._stop.clear()
+        while not self._stop.is_set():
+            if not select.select((fd,), (), (), timeout)[0]:
+                continue
+            try:
+                events = read_events(fd)
+            except EOFError:
+                break
+            self.process(events)
+
+    def start(self):
+        """Run the publisher in a background thread"""
+        self._thread = threading.Thread(target=self.run, name='StatePublisher',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.shm is not None:
+            self._abs.release()
+            self._buff = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13: the resource tracker would destroy the memory
+        # of the publisher when the reader process exits
+        shm = shared_memory.SharedMemory(name=name)
+        try:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        except Exception:
+            pass
+        return shm
+
+
+class StateReader(object):
+    """
+    Read snapshots of a state published by a :class:`StatePublisher`
+    (possibly in another process). Reading involves no syscall.
+    """
+
+    def __init__(self, name):
+        self.shm = _attach(name)
+        self._buff = self.shm.buf
+        self.layout = _Layout.unpack_header(self._buff)
+
+    @property
+    def seq(self):
+        """
+        Current frame sequence number (cheap way to know if the state
+        changed since a previous snapshot)
+        """
+        return _SEQ.unpack_from(self._buff, self.layout.seq_offset)[0] // 2
+
+    def read_raw(self, timeout=0.1):
+        """
+        (sequence number, copy of the raw state bytes). Raises TimeoutError
+        if no consistent copy could be made within *timeout* seconds (ex:
+        the publisher died in the middle of a write)
+        """
+        buff, layout = self._buff, self.layout
+        unpack_from, offset = _SEQ.unpack_from, layout.seq_offset
+        start, end = layout.state_offset, layout.size
+        deadline = None
+        for retry in itertools.count():
+            seq = unpack_from(buff, offset)[0]
+            if not seq & 1:
+                data = bytes(buff[start:end])
+                if unpack_from(buff, offset)[0] == seq:
+                    return seq // 2, data
+            # write in progress
+            if retry < _SPIN_RETRIES:
+                continue
+            now = time.monotonic()
+            if deadline is None:
+                deadline = now + timeout
+            elif now > deadline:
+                raise TimeoutError('no consistent state in {}s: publisher '
+                                   'stalled mid write?'.format(timeout))
+            # let the publisher run
+            time.sleep(0)
+
+    def snapshot(self, timeout=0.1):
+        """Consistent :data:`Snapshot` of the current state (see :meth:`read_raw`)"""
+        seq, data = self.read_raw(timeout)
+        layout = self.layout
+        time_ns, frames = _FRAME.unpack_from(data)
+        keys = KeyState.from_buffer(data[layout.keys_offset:layout.abs_offset])
+        axes = array.array('i')
+        axes.frombytes(data[layout.abs_offset:layout.mt_offset])
+        mt, offset = {}, layout.mt_offset
+        for code in layout.mt_codes:
+            values = array.array('i')
+            values.frombytes(data[offset + 4:offset + layout.mt_size])
+            mt[code] = values
+            offset += layout.mt_size
+        return Snapshot(seq, time_ns, frames, keys, axes, mt)
+
+    def close(self):
+        if self.shm is not None:
+            self._buff = None
+            self.shm.close()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Stream instrumentation: counters and fixed memory latency histograms."""
+
+import time
+import array
+
+from .input import EventType, Synchronization, event_size, clock_ns
+
+# 2**7 sub-buckets per power of 2: < 1% relative error
+SUB_BUCKET_BITS = 7
+# 10s
+MAX_VALUE = 10 * 1000 * 1000 * 1000
+
+
+class Histogram(object):
+    """
+    HDR style log-linear histogram of positive integers (ex: latencies
+    in ns).
+
+    Memory is fixed: values are counted in buckets whose width grows
+    with the value, keeping the relative error below
+    ``2**-(sub_bucket_bits-1)``. Values above *max_value* are counted
+    in the last bucket (the exact maximum is always kept).
+    """
+
+    def __init__(self, max_value=MAX_VALUE, sub_bucket_bits=SUB_BUCKET_BITS):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_count >> 1
+        self.max_value = max_value
+        nb_shifts = max(max_value.bit_length() - sub_bucket_bits, 0)
+        self._size = self.sub_count + nb_shifts * self.half_count
+        self._last = self._size - 1
+        self.reset()
+
+    def reset(self):
+        self.counts = array.array('Q', bytes(8 * self._size))
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value):
+        if value < self.sub_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        index = self.sub_count + (shift - 1) * self.half_count + \
+            (value >> shift) - self.half_count
+        return min(index, self._last)
+
+    def _upper(self, index):
+        """highest value which falls into the bucket at index"""
+        if index < self.sub_count:
+            return index
+        shift, sub = divmod(index - self.sub_count, self.half_count)
+        shift += 1
+        return ((sub + self.half_count + 1) << shift) - 1
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self.min is None or value < self.min:
+            self.min = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.total += other.total
+        for name, func in (('min', min), ('max', max)):
+            values = [v for v in (getattr(self, name), getattr(other, name)) if v is not None]
+            setattr(self, name, func(values) if values else None)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """
+        Value below which *percent* % of the recorded values fall
+        (upper bound of the bucket, never above the recorded maximum)
+        """
+        if not self.count:
+            return None
+        target = max(1, int(round(self.count * percent / 100.0)))
+        acc = 0
+        for index, count in enumerate(self.counts):
+            acc += count
+            if acc >= target:
+                if index == self._last:
+                    # overflow bucket: only the maximum is known
+                    return self.max
+                return min(self._upper(index), self.max)
+        return self.max
+
+    def summary(self):
+        return dict(count=self.count, min=self.min, mean=self.mean,
+                    p50=self.percentile(50), p90=self.percentile(90),
+                    p99=self.percentile(99), p999=self.percentile(99.9),
+                    max=self.max)
+
+
+class LatencyStats(object):
+    """
+    Latency between the kernel event timestamp and:
+
+    * ``delivery``: the moment the event was read from the device
+    * ``handoff``: the moment the event was handed to the consumer
+      (includes decoding and, in the async stream, queueing)
+
+    *clock* must return ns on the same clock as the device events: by
+    default the one given by *clock_id* (the kernel uses the real time
+    clock unless told otherwise: see InputDevice.set_clock()).
+    One instance should be used per device.
+    """
+
+    def __init__(self, clock=None, max_value=MAX_VALUE, clock_id=time.CLOCK_REALTIME):
+        self.clock = clock_ns(clock_id) if clock is None else clock
+        self.delivery = Histogram(max_value)
+        self.handoff = Histogram(max_value)
+
+    def reset(self):
+        self.delivery.reset()
+        self.handoff.reset()
+
+    def summary(self):
+        return dict(delivery=self.delivery.summary(),
+                    handoff=self.handoff.summary())
+
+
+class StreamStats(object):
+    """
+    Counters of a device stream.
+
+    * ``reads``, ``bytes``, ``events``: read syscalls and what they returned
+    * ``events_per_read``: batching efficiency
+    * ``dropped``: SYN_DROPPED events (kernel buffer overrun)
+    * ``queue_depth``, ``queue_high_water``: async stream queue
+    * ``stall_ns``, ``max_stall_ns``: time the device was not being read
+      because of the consumer
+
+    Optional hooks (callables, None by default):
+
+    * ``on_read(stats, events)``: after each read
+    * ``on_dropped(stats)``: when a SYN_DROPPED is received
+    * ``on_stall(stats, stall_ns)``: after each consumer stall
+    """
+
+    def __init__(self, on_read=None, on_dropped=None, on_stall=None):
+        self.on_read = on_read
+        self.on_dropped = on_dropped
+        self.on_stall = on_stall
+        self.reset()
+
+    def reset(self):
+        self.reads = 0
+        self.bytes = 0
+        self.events = 0
+        self.dropped = 0
+        self.queue_depth = 0
+        self.queue_high_water = 0
+        self.stall_ns = 0
+        self.max_stall_ns = 0
+
+    @property
+    def events_per_read(self):
+        return self.events / self.reads if self.reads else 0.0
+
+    def record_read(self, events):
+        """Account a read which returned the given raw input_event(s)"""
+        dropped = 0
+        for event in events:
+            if event.type == EventType.EV_SYN and \
+               event.code == Synchronization.SYN_DROPPED:
+                dropped += 1
+        self.record_read_count(len(events), dropped)
+        if self.on_read is not None:
+            self.on_read(self, events)
+
+    def record_read_count(self, nb_events, nb_dropped=0):
+        """Account a read of nb_events (of which nb_dropped SYN_DROPPED)"""
+        self.reads += 1
+        self.events += nb_events
+        self.bytes += nb_events * event_size
+        for _ in range(nb_dropped):
+            self.dropped += 1
+            if self.on_dropped is not None:
+                self.on_dropped(self)
+
+    def record_queue_depth(self, depth):
+        self.queue_depth = depth
+        if depth > self.queue_high_water:
+            self.queue_high_water = depth
+
+    def record_stall(self, stall_ns):
+        self.stall_ns += stall_ns
+        if stall_ns > self.max_stall_ns:
+            self.max_stall_ns = stall_ns
+        if self.on_stall is not None:
+            self.on_stall(self, stall_ns)
+
+    def summary(self):
+        return dict(reads=self.reads, bytes=self.bytes, events=self.events,
+                    events_per_read=self.events_per_read, dropped=self.dropped,
+                    queue_depth=self.queue_depth,
+                    queue_high_water=self.queue_high_water,
+                    stall_ns=self.stall_ns, max_stall_ns=self.max_stall_ns)
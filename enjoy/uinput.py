@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""
+Virtual input devices through /dev/uinput.
+
+Example::
+
+    with InputDevice('/dev/input/event26') as pad:
+        virtual = VirtualDevice.clone(pad)
+    with virtual:
+        virtual.write_events([(EventType.EV_KEY, Key.BTN_SOUTH, 1)])
+"""
+
+import os
+import glob
+import fcntl
+import ctypes
+
+from .input import (
+    _IO, _IOW, _IOC, _IOC_READ, int_size, event_size, event_struct,
+    EventType, Synchronization, input_id, input_absinfo, max_effects
+)
+
+UINPUT_IOCTL_BASE = ord(b'U')
+UINPUT_MAX_NAME_SIZE = 80
+
+
+class uinput_setup(ctypes.Structure):
+    _fields_ = [
+        ('id', input_id),
+        ('name', ctypes.c_char * UINPUT_MAX_NAME_SIZE),
+        ('ff_effects_max', ctypes.c_uint32)
+    ]
+
+
+class uinput_abs_setup(ctypes.Structure):
+    _fields_ = [
+        ('code', ctypes.c_uint16),
+        ('absinfo', input_absinfo)
+    ]
+
+
+UI_DEV_CREATE = _IO(UINPUT_IOCTL_BASE, 1)
+UI_DEV_DESTROY = _IO(UINPUT_IOCTL_BASE, 2)
+UI_DEV_SETUP = _IOW(UINPUT_IOCTL_BASE, 3, ctypes.sizeof(uinput_setup))
+UI_ABS_SETUP = _IOW(UINPUT_IOCTL_BASE, 4, ctypes.sizeof(uinput_abs_setup))
+UI_SET_EVBIT = _IOW(UINPUT_IOCTL_BASE, 100, int_size)
+UI_SET_KEYBIT = _IOW(UINPUT_IOCTL_BASE, 101, int_size)
+UI_SET_RELBIT = _IOW(UINPUT_IOCTL_BASE, 102, int_size)
+UI_SET_ABSBIT = _IOW(UINPUT_IOCTL_BASE, 103, int_size)
+UI_SET_MSCBIT = _IOW(UINPUT_IOCTL_BASE, 104, int_size)
+UI_SET_LEDBIT = _IOW(UINPUT_IOCTL_BASE, 105, int_size)
+UI_SET_SNDBIT = _IOW(UINPUT_IOCTL_BASE, 106, int_size)
+UI_SET_FFBIT = _IOW(UINPUT_IOCTL_BASE, 107, int_size)
+UI_SET_SWBIT = _IOW(UINPUT_IOCTL_BASE, 109, int_size)
+
+
+def UI_GET_SYSNAME(size):
+    return _IOC(_IOC_READ, UINPUT_IOCTL_BASE, 44, size)
+
+
+UI_SET_BIT = {
+    EventType.EV_KEY: UI_SET_KEYBIT,
+    EventType.EV_REL: UI_SET_RELBIT,
+    EventType.EV_ABS: UI_SET_ABSBIT,
+    EventType.EV_MSC: UI_SET_MSCBIT,
+    EventType.EV_LED: UI_SET_LEDBIT,
+    EventType.EV_SND: UI_SET_SNDBIT,
+    EventType.EV_FF: UI_SET_FFBIT,
+    EventType.EV_SW: UI_SET_SWBIT,
+}
+
+_SYN_REPORT = (EventType.EV_SYN, Synchronization.SYN_REPORT, 0)
+
+
+def _ff_capabilities(capabilities, ff_effects_max):
+    # the kernel refuses to create an EV_FF device which holds no effects
+    if ff_effects_max or EventType.EV_FF not in capabilities:
+        return capabilities
+    return {event_type: codes for event_type, codes in capabilities.items()
+            if event_type != EventType.EV_FF}
+
+
+def pack_events(batch, buff=None):
+    """
+    Pack a batch of (type, code, value) into input_event structures,
+    appending a SYN_REPORT if the batch doesn't end with one.
+    If given, *buff* (a bytearray) is reused (and grown if needed).
+    Returns a memoryview over the packed data
+    """
+    batch = list(batch)
+    if not batch or tuple(batch[-1]) != _SYN_REPORT:
+        batch.append(_SYN_REPORT)
+    size = len(batch) * event_size
+    if buff is None or len(buff) < size:
+        buff = bytearray(size)
+    pack_into = event_struct.pack_into
+    for i, (event_type, code, value) in enumerate(batch):
+        # time is filled in by the kernel
+        pack_into(buff, i * event_size, 0, 0, event_type, code, value)
+    return memoryview(buff)[:size]
+
+
+class VirtualDevice(object):
+    """
+    A virtual input device created through uinput.
+
+    *capabilities* has the same format as
+    :attr:`enjoy.input.InputDevice.capabilities` ({event type: codes}).
+    *abs_info* maps ABS codes to input_absinfo (or an equivalent
+    (value, minimum, maximum, fuzz, flat, resolution) sequence).
+    """
+
+    def __init__(self, capabilities, name='enjoy virtual device',
+                 abs_info=None, device_id=None, ff_effects_max=0,
+                 path='/dev/uinput'):
+        self.path = path
+        self.name = name
+        self.capabilities = _ff_capabilities(capabilities, ff_effects_max)
+        self.abs_info = abs_info or {}
+        self.device_id = device_id
+        self.ff_effects_max = ff_effects_max
+        self._fd = None
+        self._buff = bytearray(64 * event_size)
+
+    @classmethod
+    def from_capabilities(cls, capabilities, **kwargs):
+        return cls(capabilities, **kwargs)
+
+    @classmethod
+    def from_metadata(cls, metadata, **kwargs):
+        """
+        Create a virtual device from device metadata (see
+        :func:`enjoy.record.device_metadata`)
+        """
+        kwargs.setdefault('name', metadata.get('name', 'enjoy virtual device'))
+        device_id = metadata.get('device_id')
+        if device_id:
+            kwargs.setdefault('device_id', tuple(device_id.values()))
+        caps = {int(k): v for k, v in metadata.get('capabilities', {}).items()}
+        abs_info = {int(k): v for k, v in metadata.get('abs_info', {}).items()}
+        kwargs.setdefault('ff_effects_max', metadata.get('ff_effects_max', 0))
+        return cls(caps, abs_info=abs_info, **kwargs)
+
+    @classmethod
+    def clone(cls, device, name=None, **kwargs):
+        """Create a virtual device with the same capabilities of *device*"""
+        caps = device.capabilities
+        abs_info = {code: device.get_abs_info(code)
+                    for code in caps.get(EventType.EV_ABS, ())}
+        kwargs.setdefault('device_id', device.device_id)
+        if 'ff_effects_max' not in kwargs:
+            ff = EventType.EV_FF in caps
+            kwargs['ff_effects_max'] = max_effects(device) if ff else 0
+        return cls(caps, name=device.name if name is None else name,
+                   abs_info=abs_info, **kwargs)
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def fileno(self):
+        return self._fd
+
+    def open(self):
+        self.close()
+        fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+        try:
+            self._setup(fd)
+        except Exception:
+            os.close(fd)
+            raise
+        self._fd = fd
+
+    def _setup(self, fd):
+        for event_type, codes in self.capabilities.items():
+            if event_type == EventType.EV_SYN:
+                continue
+            fcntl.ioctl(fd, UI_SET_EVBIT, event_type)
+            set_bit = UI_SET_BIT.get(event_type)
+            if set_bit is None:
+                continue
+            for code in codes:
+                fcntl.ioctl(fd, set_bit, code)
+        for code in self.capabilities.get(EventType.EV_ABS, ()):
+            setup = uinput_abs_setup(code=code)
+            info = self.abs_info.get(code)
+            if info is not None:
+                setup.absinfo = input_absinfo(*info)
+            fcntl.ioctl(fd, UI_ABS_SETUP, setup)
+        fcntl.ioctl(fd, UI_DEV_SETUP, self.setup())
+        fcntl.ioctl(fd, UI_DEV_CREATE)
+
+    def setup(self):
+        """The uinput_setup structure of the device"""
+        setup = uinput_setup(name=self.name.encode()[:UINPUT_MAX_NAME_SIZE - 1],
+                             ff_effects_max=self.ff_effects_max)
+        if self.device_id is not None:
+            setup.id = input_id(*self.device_id)
+        return setup
+
+    def close(self):
+        if self._fd is not None:
+            try:
+                fcntl.ioctl(self._fd, UI_DEV_DESTROY)
+            finally:
+                os.close(self._fd)
+                self._fd = None
+
+    @property
+    def sysname(self):
+        """Kernel name of the device (ex: 'input42')"""
+        result = ctypes.create_string_buffer(64)
+        fcntl.ioctl(self._fd, UI_GET_SYSNAME(len(result)), result)
+        return result.value.decode()
+
+    @property
+    def device_path(self):
+        """/dev/input/event* node of the created device (None if not found)"""
+        sys_path = '/sys/devices/virtual/input/{}/event*'.format(self.sysname)
+        for path in glob.glob(sys_path):
+            return os.path.join('/dev/input', os.path.basename(path))
+
+    def write(self, data):
+        return os.write(self._fd, data)
+
+    def write_events(self, batch):
+        """
+        Write a frame of (type, code, value) events (terminated with a
+        SYN_REPORT) in a single write
+        """
+        data = pack_events(batch, self._buff)
+        if data.obj is not self._buff:
+            self._buff = data.obj
+        return os.write(self._fd, data)
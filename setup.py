@@ -25,7 +25,10 @@ setup(
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Natural Language :: English",
         "Programming Language :: Python :: 3",
-        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
     ],
     description="I/O agnostic approach to linux input system",
     install_requires=requirements,
@@ -38,7 +41,7 @@ setup(
     packages=find_packages(),
     test_suite="tests",
     tests_require=test_requirements,
-    python_requires=">=3.5",
+    python_requires=">=3.8",
     url="https://github.com/tiagocoutinho/enjoy",
     project_urls={
         "Documentation": "https://github.com/tiagocoutinho/enjoy",
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Fixtures shared by the `enjoy` tests."""
+
+import pytest
+
+from enjoy.input import InputDevice
+from enjoy.fake import fake_gamepad
+
+
+@pytest.fixture
+def gamepad():
+    """(fake gamepad, open InputDevice on it)"""
+    fake = fake_gamepad()
+    with InputDevice(fake) as device:
+        yield fake, device
+
+
+@pytest.fixture
+def pad(gamepad):
+    """Open InputDevice on a fake gamepad"""
+    return gamepad[1]
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.calibration` module."""
+
+import pytest
+
+from enjoy.input import InputEvent, EventType, Absolute, Key, Synchronization
+from enjoy.calibration import AxisCalibration, UNIPOLAR
+
+
+def event(event_type, code, value):
+    return InputEvent(0.0, event_type, code, value)
+
+
+def syn():
+    return event(EventType.EV_SYN, Synchronization.SYN_REPORT, 0)
+
+
+def test_normalize(pad):
+    calibration = AxisCalibration.from_device(pad, mode={Absolute.ABS_Z: UNIPOLAR},
+                                              deadzone=0.1)
+    X, Z = Absolute.ABS_X, Absolute.ABS_Z
+    assert calibration.normalize(X, 0) == -1.0
+    assert calibration.normalize(X, 255) == 1.0
+    assert calibration.normalize(X, 128) == 0.0
+    assert calibration.normalize(X, 136) == 0.0
+    # continuous at the deadzone edge
+    assert 0 < calibration.normalize(X, 142) < 0.02
+    assert calibration.normalize(Z, 0) == 0.0
+    assert calibration.normalize(Z, 255) == 1.0
+    assert calibration.normalize(Z, 128) == pytest.approx((128 / 255 - 0.1) / 0.9)
+    assert calibration.normalize(Absolute.ABS_HAT0X, -1) == -1.0
+    # not calibrated: raw value
+    assert calibration.normalize(Absolute.ABS_WHEEL, 12) == 12
+
+
+def test_process_suppresses_unchanged(pad):
+    calibration = AxisCalibration.from_device(pad, hysteresis=0.05)
+    X, Y = Absolute.ABS_X, Absolute.ABS_Y
+    batch = [
+        event(EventType.EV_ABS, X, 255), syn(),
+        # same value, inside hysteresis, inside the deadzone: frame dropped
+        event(EventType.EV_ABS, X, 254), syn(),
+        event(EventType.EV_ABS, Y, 130), syn(),
+        event(EventType.EV_ABS, Y, 131), syn(),
+        # keys pass through
+        event(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+        event(EventType.EV_ABS, X, 0), syn(),
+    ]
+    result = calibration.process(batch)
+    assert [(e.code, e.value) for e in result] == [
+        (X, 1.0), (Synchronization.SYN_REPORT, 0),
+        (Y, 0.0), (Synchronization.SYN_REPORT, 0),
+        (Key.BTN_SOUTH, 1), (X, -1.0), (Synchronization.SYN_REPORT, 0),
+    ]
+    # state is kept between batches
+    assert calibration.process([event(EventType.EV_ABS, X, 0), syn()]) == []
+
+
+def test_calibrate_writes_absinfo(pad):
+    calibration = AxisCalibration.from_device(pad, codes=[Absolute.ABS_X])
+    calibration.calibrate(pad, Absolute.ABS_X, minimum=10, maximum=210, flat=0)
+    info = pad.get_abs_info(Absolute.ABS_X)
+    assert (info.minimum, info.maximum, info.flat) == (10, 210, 0)
+    assert calibration.normalize(Absolute.ABS_X, 210) == 1.0
+    assert calibration.normalize(Absolute.ABS_X, 110) == 0.0
+
+
+def test_invalid_deadzone(pad):
+    for deadzone in (1, 1.5, -0.1):
+        with pytest.raises(ValueError):
+            AxisCalibration.from_device(pad, deadzone=deadzone)
+    # a flat covering the whole range is ignored
+    calibration = AxisCalibration({Absolute.ABS_X: (128, 0, 255, 0, 255, 0)})
+    assert calibration.normalize(Absolute.ABS_X, 255) == 1.0
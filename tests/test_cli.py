@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.cli` module."""
+
+import os
+import asyncio
+
+import pytest
+
+pytest.importorskip("typer")
+pytest.importorskip("beautifultable")
+
+from typer.testing import CliRunner
+
+from enjoy.cli import (
+    app, create_state, update_state, render_state, names, Renderer, Monitor, Monitored
+)
+from enjoy.input import InputEvent, EventType, Key, Absolute, KeyState
+from enjoy.fake import fake_gamepad, fake_keyboard
+
+
+def event(event_type, code, value):
+    return InputEvent(0.0, event_type, code, value)
+
+
+@pytest.fixture
+def state(pad):
+    return create_state(pad)
+
+
+def test_render_state(state):
+    assert not state["keys"]
+    assert state["abs"][Absolute.ABS_X] == 128
+    update_state(state, event(EventType.EV_KEY, Key.BTN_START, 1))
+    update_state(state, event(EventType.EV_ABS, Absolute.ABS_X, 255))
+    assert state["events"] == 2
+    rate, axes, keys = render_state(state).split(" | ")
+    assert rate == "    0 ev/s"
+    assert axes.startswith("X: 255 Y: 128 ")
+    assert keys == "START"
+    update_state(state, event(EventType.EV_KEY, Key.BTN_START, 0))
+    assert render_state(state).endswith(" | ")
+
+
+def test_names_unnamed_code():
+    assert names(KeyState([Key.KEY_A, 84])) == "A 84"
+
+
+def test_renderer_rate_limit(state, capsys):
+    async def run():
+        renderer = Renderer(state, refresh=10)
+        renderer.start()
+        # right after a render: the next one is scheduled, not lost
+        renderer.frame()
+        assert renderer.pending is not None
+        renderer.frame()
+        await asyncio.sleep(0.15)
+        assert renderer.pending is None
+
+    asyncio.run(run())
+    out = capsys.readouterr().out
+    # tick + one scheduled render for both frames
+    assert out.count(Renderer.CLEAR_LINE) == 2
+    assert out.startswith(Renderer.CLEAR_LINE + "    0 ev/s | X: 128 Y: 128")
+
+
+class FakeDevices:
+    """Device files in *directory* backed by enjoy.fake devices"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.fakes = {}
+        self.opened = []
+
+    def add(self, name, fake):
+        path = str(self.directory / name)
+        # new inode even if the path already exists (like a replugged device)
+        tmp = path + ".new"
+        open(tmp, "w").close()
+        os.replace(tmp, path)
+        self.fakes[path] = fake
+        return path
+
+    def list_devices(self):
+        return list(self.fakes)
+
+    def open_device(self, path):
+        self.opened.append(path)
+        return Monitored(path, self.fakes[path])
+
+
+def test_monitor_filter(tmp_path):
+    fakes = FakeDevices(tmp_path)
+    pad = fakes.add("event0", fake_gamepad())
+    keyboard = fakes.add("event1", fake_keyboard())
+    monitor = Monitor("gamepad", fakes.list_devices, fakes.open_device)
+
+    async def run():
+        monitor.scan()
+        assert list(monitor.devices) == [pad]
+        assert monitor.rejected == {keyboard: os.stat(keyboard).st_ino}
+        # rejected device with the same inode: not opened again
+        monitor.scan()
+        assert fakes.opened == [pad, keyboard]
+        # replugged: new inode, queried again
+        fakes.add("event1", fake_keyboard())
+        monitor.scan()
+        assert fakes.opened == [pad, keyboard, keyboard]
+        # unplugged: forgotten
+        del fakes.fakes[keyboard]
+        monitor.scan()
+        assert monitor.rejected == {}
+        monitor.close()
+
+    asyncio.run(run())
+
+
+def test_monitor_removes_ended_devices(tmp_path):
+    fakes = FakeDevices(tmp_path)
+    fake = fake_gamepad()
+    pad = fakes.add("event0", fake)
+    other = fakes.add("event1", fake_gamepad())
+    monitor = Monitor("", fakes.list_devices, fakes.open_device)
+
+    async def run():
+        monitor.scan()
+        monitored, other_monitored = monitor.devices[pad], monitor.devices[other]
+        fake.emit([(EventType.EV_KEY, Key.BTN_START, 1)])
+        fake.close_source()
+        await asyncio.wait_for(monitored.task, 1)
+        assert monitored.state["events"] == 1
+        # ended stream: closed and, as the path is still there, opened again
+        fakes.fakes[pad] = fake_gamepad()
+        monitor.scan()
+        assert monitored.device.fileno() is None
+        assert monitor.devices[pad] is not monitored
+        assert monitor.devices[pad].state["events"] == 0
+        # device file gone
+        del fakes.fakes[other]
+        monitor.scan()
+        assert list(monitor.devices) == [pad]
+        assert other_monitored.device.fileno() is None
+        assert fakes.opened == [pad, other, pad]
+        monitor.close()
+
+    asyncio.run(run())
+
+
+def test_monitored_render(tmp_path):
+    fake = fake_gamepad(name="a gamepad with a very long name")
+    monitored = Monitored("/dev/input/event12345678", fake)
+    try:
+        update_state(monitored.state, event(EventType.EV_KEY, Key.BTN_START, 1))
+        monitored.last = "KEY START 1"
+        monitored.update_rate(monitored.rate_time + 0.5)
+        line = monitored.render(500)
+        info, last, keys, axes = line.split(" | ")
+        # fixed width columns: name, path, rate
+        assert info == "a gamepad with a very lo /dev/input/event12      2 ev/s"
+        assert last == "KEY START 1           "
+        assert keys == "START"
+        assert axes.startswith("X:128 Y:128 Z:128 ")
+        assert monitored.render(10) == line[:10]
+    finally:
+        monitored.close()
+
+
+def test_bench_unknown_mode():
+    result = CliRunner().invoke(app, ["bench", "--modes", "sync,nope"])
+    assert result.exit_code != 0
+    assert "nope" in result.output
+
+
+def test_bench_generated_source():
+    result = CliRunner().invoke(
+        app, ["bench", "--modes", "sync,raw", "--duration", "0.2", "--rate", "500"],
+        env={"COLUMNS": "200"})
+    assert result.exit_code == 0, result.output
+    lines = result.output.splitlines()
+    header = next(line for line in lines if "mode" in line)
+    assert [cell.strip() for cell in header.split("|")[1:-1]] == [
+        "mode", "events", "ev/s", "ev/wakeup", "p50 us", "p99 us",
+        "max us", "cpu us/ev", "drops"]
+    rows = {line.split("|")[1].strip(): line.split("|")[2:-1]
+            for line in lines if line.startswith("|") and "mode" not in line}
+    assert set(rows) == {"sync", "raw"}
+    for row in rows.values():
+        assert int(row[0]) > 0
+        assert int(row[-1]) == 0
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.combo` module."""
+
+from enjoy.input import InputEvent, EventType, Key
+from enjoy.combo import ComboEngine, TimerWheel
+
+
+def key(code, value, time):
+    return InputEvent(time, EventType.EV_KEY, code, value)
+
+
+def press(engine, codes, start=0.0, step=0.1):
+    for i, code in enumerate(codes):
+        engine.process(key(code, 1, start + i * step))
+        engine.process(key(code, 0, start + i * step + step / 2))
+
+
+def test_timer_wheel():
+    wheel = TimerWheel(resolution=0.1, nb_slots=4)
+    wheel.advance(0)
+    wheel.schedule(0.25, 'a')
+    wheel.schedule(1.0, 'b')        # more than a turn away
+    assert wheel.advance(0.2) == []
+    assert wheel.advance(0.35) == ['a']
+    assert wheel.advance(0.9) == []
+    assert wheel.advance(5.0) == ['b']
+    assert wheel.pending == 0
+
+
+def test_chord():
+    fired = []
+    engine = ComboEngine()
+    engine.chord([Key.KEY_LEFTCTRL, Key.KEY_C], lambda c, e: fired.append(e.time))
+    engine.chord([Key.KEY_LEFTCTRL], lambda c, e: fired.append('ctrl'), exact=True)
+    engine.process(key(Key.KEY_C, 1, 0.0))
+    assert fired == []
+    engine.process(key(Key.KEY_LEFTCTRL, 1, 0.1))
+    assert fired == [0.1]
+    # autorepeat and other keys don't refire
+    engine.process(key(Key.KEY_LEFTCTRL, 2, 0.2))
+    engine.process(key(Key.KEY_A, 1, 0.3))
+    assert fired == [0.1]
+    # re-armed on release
+    engine.process(key(Key.KEY_C, 0, 0.4))
+    engine.process(key(Key.KEY_C, 1, 0.5))
+    assert fired == [0.1, 0.5]
+    engine.process(key(Key.KEY_C, 0, 0.6))
+    engine.process(key(Key.KEY_A, 0, 0.6))
+    engine.process(key(Key.KEY_LEFTCTRL, 0, 0.7))
+    engine.process(key(Key.KEY_LEFTCTRL, 1, 0.8))
+    assert fired == [0.1, 0.5, 'ctrl']
+
+
+def test_sequence():
+    fired = []
+    engine = ComboEngine(timeout=0.5)
+    up, down = Key.KEY_UP, Key.KEY_DOWN
+    engine.sequence([up, up, down], lambda s, e: fired.append(('uud', e.time)))
+    engine.sequence([up, down], lambda s, e: fired.append(('ud', e.time)))
+    press(engine, [up, up, down])
+    assert sorted(fired) == [('ud', 0.2), ('uud', 0.2)]
+    # other key breaks the sequence
+    fired.clear()
+    press(engine, [up, Key.KEY_A, down], start=10)
+    assert fired == []
+    # too slow
+    press(engine, [up, up, down], start=20, step=0.6)
+    assert fired == []
+    # overlapping: up up up down still matches
+    press(engine, [up, up, up, down], start=30)
+    assert ('uud', 30.3) in fired
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.drain` module."""
+
+import time
+import threading
+
+from enjoy.input import InputDevice, EventType, Absolute, Key
+from enjoy.fake import fake_gamepad, fake_keyboard
+from enjoy.drain import TimerDrain, drain
+
+
+def test_drain():
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad:
+        assert drain(pad.fileno()) == b''
+        for i in range(100):
+            fake.emit([(EventType.EV_ABS, Absolute.ABS_X, i)])
+        # more than one read worth of events
+        assert len(drain(pad.fileno(), max_events=16)) == 200 * 24
+
+
+def test_timer_drain():
+    pad, keyboard = fake_gamepad(), fake_keyboard()
+    duration = 0.2
+
+    def produce():
+        # a 1 kHz pad and a slow keyboard
+        for i in range(int(duration * 1000)):
+            pad.emit([(EventType.EV_ABS, Absolute.ABS_X, i % 256)])
+            if i % 50 == 0:
+                keyboard.emit([(EventType.EV_KEY, Key.KEY_A, 1)])
+            time.sleep(0.001)
+        pad.close_source()
+        keyboard.close_source()
+
+    with InputDevice(pad) as pad_device, InputDevice(keyboard) as kbd_device:
+        timer = TimerDrain()
+        timer.add(pad_device, interval=0.02)
+        timer.add(kbd_device, interval=0.05)
+        producer = threading.Thread(target=produce)
+        producer.start()
+        received = {pad_device: [], kbd_device: []}
+        start = time.monotonic()
+        for device, events in timer.batches():
+            received[device].extend(event.value for event in events
+                                    if event.type != EventType.EV_SYN)
+        elapsed = time.monotonic() - start
+        producer.join()
+    assert received[pad_device] == [i % 256 for i in range(200)]
+    assert len(received[kbd_device]) == 4
+    # far less wakeups than events
+    assert timer.wakeups <= elapsed / 0.02 + elapsed / 0.05 + 2
+    assert timer.events_per_wakeup > 10
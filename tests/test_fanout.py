@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.fanout` module."""
+
+import os
+import time
+import socket
+
+import pytest
+
+from enjoy.input import (
+    InputDevice, EventType, Key, Absolute, Synchronization, read_events
+)
+from enjoy.fake import fake_gamepad
+from enjoy.fanout import (
+    FanoutServer, FanoutClient, encode_frame, decode_frame, event_mask
+)
+
+
+@pytest.fixture
+def server(gamepad, tmp_path):
+    fake, pad = gamepad
+    with FanoutServer([pad], str(tmp_path / 'enjoy.sock')) as server:
+        server.start()
+        yield fake, server
+
+
+def wait_subscribed(server, nb):
+    start = time.monotonic()
+    while time.monotonic() - start < 5:
+        subscribers = list(server.subscribers)
+        if len(subscribers) == nb and all(s.device is not None for s in subscribers):
+            return
+        time.sleep(0.001)
+    raise TimeoutError('subscribers not ready')
+
+
+def test_codec():
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad:
+        fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1)], timestamp=1000000000)
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 3)], timestamp=1000002000)
+        events = read_events(pad.fileno())
+    message, _ = encode_frame(3, events)
+    assert len(message) < 24 * len(events)
+    device, decoded = decode_frame(message)
+    assert device == 3
+    assert decoded == [
+        (1000000, EventType.EV_KEY, Key.BTN_SOUTH, 1),
+        (1000000, EventType.EV_SYN, Synchronization.SYN_REPORT, 0),
+        (1000002, EventType.EV_ABS, Absolute.ABS_X, 3),
+        (1000002, EventType.EV_SYN, Synchronization.SYN_REPORT, 0),
+    ]
+    # filtered: the frame without key events disappears
+    message, pending = encode_frame(0, events, event_mask({EventType.EV_KEY: None}))
+    assert [e[1:] for e in decode_frame(message)[1]] == [
+        (EventType.EV_KEY, Key.BTN_SOUTH, 1),
+        (EventType.EV_SYN, Synchronization.SYN_REPORT, 0),
+    ]
+    assert pending == 0
+    with pytest.raises(ValueError):
+        event_mask({EventType.EV_KEY: [1 << 10]})
+
+
+def test_fanout(server):
+    fake, server = server
+    everything = FanoutClient(server.path)
+    south = FanoutClient(server.path, events={EventType.EV_KEY: [Key.BTN_SOUTH]})
+    with everything, south:
+        assert everything.metadata['name'] == 'enjoy fake gamepad'
+        wait_subscribed(server, 2)
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 10)])
+        fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+                   (EventType.EV_KEY, Key.BTN_EAST, 1)])
+        fake.close_source()
+        events = list(everything.event_stream(timeout=1))
+        assert [(e.code, e.value) for e in events if e.type != EventType.EV_SYN] == \
+            [(Absolute.ABS_X, 10), (Key.BTN_SOUTH, 1), (Key.BTN_EAST, 1)]
+        events = list(south.event_stream(timeout=1))
+        assert [(e.type, e.code, e.value) for e in events] == [
+            (EventType.EV_KEY, Key.BTN_SOUTH, 1),
+            (EventType.EV_SYN, Synchronization.SYN_REPORT, 0),
+        ]
+        assert isinstance(events[0].time, float)
+
+
+def test_unknown_device(server):
+    _, server = server
+    with pytest.raises(ValueError):
+        FanoutClient(server.path, device=1)
+
+
+def test_socket_path_safety(pad, tmp_path):
+    path = tmp_path / 'important.txt'
+    path.write_text('data')
+    with pytest.raises(FileExistsError):
+        FanoutServer([pad], str(path)).open()
+    assert path.read_text() == 'data'
+    # a stale socket is replaced
+    path = str(tmp_path / 'enjoy.sock')
+    with FanoutServer([pad], path):
+        pass
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+    stale.bind(path)
+    stale.close()
+    with FanoutServer([pad], path):
+        assert os.path.exists(path)
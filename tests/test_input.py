@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.input` module (on top of the fake backend)."""
+
+import os
+import time
+import asyncio
+
+import pytest
+
+from enjoy.input import (
+    InputDevice, EventType, Key, Absolute, Synchronization, Bus, Led,
+    event_stream, async_event_stream, find_gamepads, find_keyboards,
+    get_input_mask, set_input_mask, rumble_effect, periodic_effect, KeyState,
+    InputFile, event_from_us
+)
+from enjoy.fake import fake_gamepad, fake_keyboard, fake_touchscreen
+from enjoy.multitouch import MultiTouchState
+from enjoy.stats import LatencyStats
+
+
+def test_identification(gamepad):
+    fake, device = gamepad
+    assert device.name == 'enjoy fake gamepad'
+    assert device.version == 0x010001
+    assert device.device_id.bustype == Bus.BUS_USB
+    assert device.device_id.vendor == 0x054c
+
+
+def test_capabilities(gamepad):
+    _, device = gamepad
+    caps = device.capabilities
+    assert set(caps) == {EventType.EV_SYN, EventType.EV_KEY,
+                         EventType.EV_ABS, EventType.EV_FF}
+    assert Key.BTN_SOUTH in caps[EventType.EV_KEY]
+    assert Absolute.ABS_HAT0X in caps[EventType.EV_ABS]
+
+
+def test_state_follows_events(gamepad):
+    fake, device = gamepad
+    assert device.x == 128
+    assert not device.keys.btn_south
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+               (EventType.EV_ABS, Absolute.ABS_X, 3)])
+    assert device.absolute.x == 3
+    assert device.keys.btn_south
+    assert Key.BTN_SOUTH in device.active_keys
+    with pytest.raises(ValueError):
+        device.absolute[Absolute.ABS_THROTTLE]
+
+
+def test_key_state(gamepad):
+    fake, device = gamepad
+    before = device.active_keys
+    assert isinstance(before, KeyState)
+    assert not before and len(before) == 0
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+               (EventType.EV_KEY, Key.BTN_EAST, 1)])
+    after = device.active_keys
+    assert len(after) == 2
+    assert after == {Key.BTN_SOUTH, Key.BTN_EAST}
+    assert list(after) == [Key.BTN_SOUTH, Key.BTN_EAST]
+    assert KeyState.from_buffer(after.to_bytes()) == after
+    pressed, released = after.diff(before)
+    assert pressed == after and not released
+    assert (after ^ before) == after
+    after.set(Key.BTN_SOUTH, 0)
+    assert Key.BTN_SOUTH not in after and Key.BTN_EAST in after
+    assert after - {Key.BTN_EAST} == set()
+    # 84 has no name in the Key enum
+    unnamed = KeyState([84, Key.KEY_A])
+    assert list(unnamed) == [Key.KEY_A, 84]
+    assert repr(unnamed) == 'KeyState(KEY_A, 84)'
+
+
+def test_clock(gamepad):
+    fake, device = gamepad
+    device.latency = LatencyStats()
+    device.set_clock(time.CLOCK_MONOTONIC)
+    assert fake.clock_id == time.CLOCK_MONOTONIC
+    before = time.monotonic_ns()
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1)])
+    event = device.read_event()
+    assert before <= event.time_ns <= time.monotonic_ns()
+    assert event.time == pytest.approx(event.time_ns * 1e-9)
+    assert 0 <= device.latency.delivery.max < 1000000000
+    # reopening keeps the clock
+    device.close()
+    fake.clock_id = time.CLOCK_REALTIME
+    device.open()
+    assert fake.clock_id == time.CLOCK_MONOTONIC
+    with pytest.raises(OSError):
+        device.set_clock(12345)
+
+
+def test_clock_before_open():
+    fake = fake_gamepad()
+    device = InputDevice(fake)
+    device.set_clock(time.CLOCK_MONOTONIC)
+    assert fake.clock_id == time.CLOCK_REALTIME
+    with device:
+        assert fake.clock_id == time.CLOCK_MONOTONIC
+
+
+def test_path(tmp_path):
+    device = InputDevice(tmp_path / 'event99')
+    assert isinstance(device._fileobj, InputFile)
+    with pytest.raises(FileNotFoundError):
+        device.open()
+
+
+def test_read_event(gamepad):
+    fake, device = gamepad
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_Y, 12)], timestamp=1500000000)
+    event = device.read_event()
+    assert event.type == EventType.EV_ABS
+    assert event.code == Absolute.ABS_Y
+    assert event.value == 12
+    assert event.time == pytest.approx(1.5)
+    assert device.read_event().code == Synchronization.SYN_REPORT
+
+
+def test_event_from_us():
+    event = event_from_us(12500001, 1, Key.BTN_START, 1)
+    assert event.type is EventType.EV_KEY
+    assert event.code is Key.BTN_START
+    assert event.time == pytest.approx(12.500001)
+    assert event.time_ns == 12500001000
+
+
+def test_event_stream(gamepad):
+    fake, device = gamepad
+    for i in range(10):
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_X, i)])
+    fake.close_source()
+    events = [event for event in event_stream(device.fileno())
+              if event.type == EventType.EV_ABS]
+    assert [event.value for event in events] == list(range(10))
+
+
+@pytest.mark.parametrize('wait', ['select', 'blocking', 'epoll', 'spin'])
+def test_event_stream_wait(gamepad, wait):
+    fake, device = gamepad
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1)])
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 3)])
+    fake.close_source()
+    events = list(event_stream(device.fileno(), wait=wait))
+    assert [(e.code, e.value) for e in events] == [
+        (Key.BTN_SOUTH, 1), (Synchronization.SYN_REPORT, 0),
+        (Absolute.ABS_X, 3), (Synchronization.SYN_REPORT, 0),
+    ]
+    # the file is back to non blocking mode
+    assert not os.get_blocking(device.fileno())
+
+
+def test_wait_timeout(gamepad):
+    _, device = gamepad
+    fd = device.fileno()
+    assert list(event_stream(fd, wait='epoll', timeout=0.01)) == []
+    start = time.monotonic()
+    assert list(event_stream(fd, wait='spin', timeout=0.05, spin_budget=1000000)) == []
+    assert time.monotonic() - start >= 0.05
+    with pytest.raises(ValueError):
+        list(event_stream(fd, wait='blocking', timeout=0.01))
+
+
+def test_dispatch(gamepad):
+    fake, device = gamepad
+    calls = []
+    handler = device.on(EventType.EV_KEY, Key.BTN_SOUTH,
+                        lambda code, value, time_ns: calls.append((code, value, time_ns)))
+    device.on(EventType.EV_ABS, Absolute.ABS_X, lambda *args: calls.append(args))
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1), (EventType.EV_ABS, Absolute.ABS_Y, 5)],
+              timestamp=1500000000)
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 7)], timestamp=1600000000)
+    assert device.dispatch() == 5
+    # raw ints, not enums
+    assert calls == [(Key.BTN_SOUTH, 1, 1500000000), (Absolute.ABS_X, 7, 1600000000)]
+    assert type(calls[0][0]) is int
+    device.off(EventType.EV_KEY, Key.BTN_SOUTH, handler)
+    del calls[:]
+    fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 0)])
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 8)])
+    fake.close_source()
+    device.dispatch_forever(timeout=1)
+    assert [args[:2] for args in calls] == [(Absolute.ABS_X, 8)]
+    with pytest.raises(ValueError):
+        device.on(EventType.EV_KEY, 1 << 10, handler)
+    with pytest.raises(ValueError):
+        device.off(EventType.EV_MAX + 1, 0)
+
+
+def test_async_event_stream(gamepad):
+    fake, device = gamepad
+
+    async def consume():
+        fake.emit([(EventType.EV_KEY, Key.BTN_EAST, 1)])
+        fake.close_source()
+        return [event async for event in async_event_stream(device.fileno())]
+
+    events = asyncio.run(consume())
+    assert [(e.type, e.code, e.value) for e in events] == [
+        (EventType.EV_KEY, Key.BTN_EAST, 1),
+        (EventType.EV_SYN, Synchronization.SYN_REPORT, 0)]
+
+
+def test_input_mask(gamepad):
+    fake, device = gamepad
+    set_input_mask(device, EventType.EV_ABS, [Absolute.ABS_Y])
+    mask, bits = get_input_mask(device, EventType.EV_ABS)
+    assert mask.codes_size == len(bits)
+    assert bits.raw[0] == 1 << Absolute.ABS_Y
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 1),
+               (EventType.EV_ABS, Absolute.ABS_Y, 2)])
+    assert device.read_event().code == Absolute.ABS_Y
+
+
+def test_find_devices():
+    devices = [fake_keyboard(), fake_gamepad(), fake_touchscreen()]
+    assert [dev.name for dev in find_gamepads(devices)] == ['enjoy fake gamepad']
+    assert [dev.name for dev in find_keyboards(devices)] == ['enjoy fake keyboard']
+
+
+def test_keyboard_leds():
+    fake = fake_keyboard()
+    with InputDevice(fake) as device:
+        fake.emit([(EventType.EV_LED, Led.LED_CAPSL, 1)])
+        assert Led.LED_CAPSL in device.capabilities[EventType.EV_LED]
+
+
+def test_multi_touch_sync():
+    fake = fake_touchscreen(nb_slots=4)
+    with InputDevice(fake) as device:
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_MT_SLOT, 2),
+                   (EventType.EV_ABS, Absolute.ABS_MT_TRACKING_ID, 5),
+                   (EventType.EV_ABS, Absolute.ABS_MT_POSITION_X, 40)])
+        state = MultiTouchState.from_device(device)
+    assert state.nb_slots == 4
+    assert state.slot == 2
+    assert state.contacts() == [2]
+    assert state.values(Absolute.ABS_MT_POSITION_X) == [0, 0, 40, 0]
+
+
+def test_force_feedback():
+    fake = fake_gamepad(ff_effects_max=2)
+    with InputDevice(fake) as device:
+        ff = device.force_feedback
+        assert ff.max_effects == 2
+        effect_id = ff.upload(rumble_effect(0x8000, 0x4000))
+        assert fake.effects[effect_id].u.rumble.strong_magnitude == 0x8000
+        ff.play(effect_id, 3)
+        assert fake.playing[effect_id] == 3
+        ff.stop(effect_id)
+        assert fake.playing[effect_id] == 0
+        ff.set_gain(0x1000)
+        assert fake.gain == 0x1000
+        ff.erase(effect_id)
+        assert not fake.effects
+
+
+def test_force_feedback_cache():
+    fake = fake_gamepad(ff_effects_max=2)
+    with InputDevice(fake) as device:
+        ff = device.force_feedback
+        weak, strong, other = (rumble_effect(0, 0x1000), rumble_effect(0xFFFF, 0),
+                               periodic_effect())
+        weak_id = ff.play_effect(weak)
+        strong_id = ff.play_effect(strong)
+        uploads = dict(fake.effects)
+        # already uploaded: play only
+        assert ff.play_effect(rumble_effect(0, 0x1000)) == weak_id
+        assert fake.effects == uploads
+        # device full: least recently used (strong) is erased
+        other_id = ff.play_effect(other)
+        assert other_id == strong_id
+        assert set(fake.effects) == {weak_id, other_id}
+        assert len(ff.cached_effects) == 2
+        ff.clear()
+        assert not fake.effects
+
+
+def test_force_feedback_cache_shares_slots(gamepad):
+    fake, device = gamepad
+    fake.ff_effects_max = 2
+    ff = device.force_feedback
+    # uploaded outside of the cache
+    manual_id = ff.upload(periodic_effect())
+    weak_id = ff.play_effect(rumble_effect(0, 0x1000))
+    # device full: the cache evicts its own least recently used effect
+    strong_id = ff.play_effect(rumble_effect(0xFFFF, 0))
+    assert strong_id == weak_id
+    assert set(fake.effects) == {manual_id, strong_id}
+
+
+def test_force_feedback_reopen():
+    fake = fake_gamepad(ff_effects_max=2)
+    device = InputDevice(fake)
+    with device:
+        device.force_feedback.play_effect(rumble_effect(0, 0x1000))
+        assert device.force_feedback.cached_effects
+    assert not fake.effects
+    with device:
+        ff = device.force_feedback
+        # the cache is gone with the erased effects: uploaded again
+        assert not ff.cached_effects
+        effect_id = ff.play_effect(rumble_effect(0, 0x1000))
+        assert fake.playing[effect_id] == 1
+        assert len(fake.effects) == 1
+
+
+def test_no_force_feedback():
+    with InputDevice(fake_keyboard()) as device:
+        with pytest.raises(ValueError):
+            device.force_feedback
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.multitouch` module."""
+
+import pytest
+
+from enjoy.input import Absolute, EventType, Synchronization
+from enjoy.multitouch import MultiTouchState
+from enjoy.input import InputEvent
+
+
+def abs_event(code, value):
+    return InputEvent(0.0, EventType.EV_ABS, code, value)
+
+
+SYN = InputEvent(0.0, EventType.EV_SYN, Synchronization.SYN_REPORT, 0)
+
+
+def test_initial_state():
+    state = MultiTouchState(4)
+    assert state.contacts() == []
+    assert state.values(Absolute.ABS_MT_TRACKING_ID) == [-1] * 4
+    assert state.values(Absolute.ABS_MT_POSITION_X) == [0] * 4
+
+
+def test_frame_updates_in_place():
+    state = MultiTouchState(4)
+    buff = state[Absolute.ABS_MT_POSITION_X]
+    events = [
+        abs_event(Absolute.ABS_MT_SLOT, 1),
+        abs_event(Absolute.ABS_MT_TRACKING_ID, 7),
+        abs_event(Absolute.ABS_MT_POSITION_X, 100),
+        abs_event(Absolute.ABS_MT_POSITION_Y, 200),
+        SYN,
+    ]
+    frames = [state.process(event) for event in events]
+    assert frames == [False, False, False, False, True]
+    assert state.frame == 1
+    assert state.contacts() == [1]
+    assert buff is state[Absolute.ABS_MT_POSITION_X]
+    assert buff[2] == 100
+    assert state.contact(1, (Absolute.ABS_MT_POSITION_X,
+                             Absolute.ABS_MT_POSITION_Y)) == (100, 200)
+
+    state.process(abs_event(Absolute.ABS_MT_TRACKING_ID, -1))
+    state.process(SYN)
+    assert state.contacts() == []
+
+
+def test_out_of_range_slot_is_ignored():
+    state = MultiTouchState(2)
+    state.process(abs_event(Absolute.ABS_MT_SLOT, 5))
+    state.process(abs_event(Absolute.ABS_MT_POSITION_X, 1))
+    assert state.values(Absolute.ABS_MT_POSITION_X) == [0, 0]
+
+
+def test_syn_dropped():
+    state = MultiTouchState(2)
+    event = InputEvent(0.0, EventType.EV_SYN, Synchronization.SYN_DROPPED, 0)
+    assert not state.process(event)
+    assert state.dropped
+
+
+def test_numpy_view():
+    pytest.importorskip('numpy')
+    state = MultiTouchState(3)
+    view = state.view(Absolute.ABS_MT_POSITION_X)
+    assert view.tolist() == [0, 0, 0]
+    state.process(abs_event(Absolute.ABS_MT_SLOT, 2))
+    state.process(abs_event(Absolute.ABS_MT_POSITION_X, 42))
+    state.process(SYN)
+    # zero-copy: the view follows the state
+    assert view.tolist() == [0, 0, 42]
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.pipeline` module."""
+
+import pytest
+
+from enjoy.input import InputEvent, EventType, Absolute, Key, Synchronization
+from enjoy.calibration import AxisCalibration
+from enjoy.pipeline import Pipeline
+
+
+ABS, KEY, SYN = EventType.EV_ABS, EventType.EV_KEY, EventType.EV_SYN
+
+
+def event(event_type, code, value):
+    return InputEvent(0.0, event_type, code, value)
+
+
+def syn():
+    return event(SYN, Synchronization.SYN_REPORT, 0)
+
+
+def test_filter():
+    pipeline = Pipeline().filter({ABS: [Absolute.ABS_X], KEY: None})
+    batch = [
+        event(ABS, Absolute.ABS_X, 1), event(ABS, Absolute.ABS_Y, 2), syn(),
+        # whole frame filtered out: its SYN_REPORT goes too
+        event(ABS, Absolute.ABS_Y, 3), syn(),
+        event(KEY, Key.BTN_SOUTH, 1), syn(),
+    ]
+    assert [(e.type, e.code, e.value) for e in pipeline.process(batch)] == [
+        (ABS, Absolute.ABS_X, 1), (SYN, Synchronization.SYN_REPORT, 0),
+        (KEY, Key.BTN_SOUTH, 1), (SYN, Synchronization.SYN_REPORT, 0),
+    ]
+
+
+def test_remap_scale_dedupe():
+    pipeline = (Pipeline()
+                .remap({(KEY, Key.BTN_SOUTH): (KEY, Key.KEY_ENTER),
+                        (ABS, Absolute.ABS_Y): (ABS, Absolute.ABS_RY)})
+                .scale({(ABS, Absolute.ABS_RY): (2, -1)})
+                .scale({(ABS, Absolute.ABS_RY): 10})
+                .dedupe([(ABS, Absolute.ABS_RY)]))
+    batch = [
+        event(KEY, Key.BTN_SOUTH, 1), event(ABS, Absolute.ABS_Y, 1), syn(),
+        event(ABS, Absolute.ABS_Y, 1), syn(),
+        event(KEY, Key.BTN_SOUTH, 1), event(ABS, Absolute.ABS_Y, 2), syn(),
+    ]
+    result = pipeline(batch)
+    assert [(e.type, e.code, e.value) for e in result] == [
+        (KEY, Key.KEY_ENTER, 1), (ABS, Absolute.ABS_RY, 10), (SYN, Synchronization.SYN_REPORT, 0),
+        (KEY, Key.KEY_ENTER, 1), (ABS, Absolute.ABS_RY, 30), (SYN, Synchronization.SYN_REPORT, 0),
+    ]
+    assert result[0].code is Key.KEY_ENTER
+    # dedupe state is kept across batches
+    assert pipeline([event(ABS, Absolute.ABS_Y, 2), syn()]) == []
+
+
+def test_invalid_codes():
+    pipeline = Pipeline()
+    # codes must fit the (type, code) dispatch table
+    with pytest.raises(ValueError):
+        pipeline.remap({(KEY, Key.BTN_SOUTH): (KEY, 1024)})
+    with pytest.raises(ValueError):
+        pipeline.remap({(KEY, -1): (KEY, Key.KEY_ENTER)})
+    with pytest.raises(ValueError):
+        pipeline.filter({KEY: [1024]})
+    with pytest.raises(ValueError):
+        pipeline.filter({EventType.EV_MAX + 1: None})
+    with pytest.raises(ValueError):
+        pipeline.scale({(ABS, 1024): 2})
+    with pytest.raises(ValueError):
+        pipeline.dedupe([(ABS, 1024)])
+    assert pipeline.steps == []
+
+
+def test_stage_and_stream(pad):
+    calibration = AxisCalibration.from_device(pad, [Absolute.ABS_X])
+    pipeline = (Pipeline()
+                .filter({ABS: [Absolute.ABS_X]})
+                .stage(calibration)
+                .scale({(ABS, Absolute.ABS_X): 100}))
+    events = [event(ABS, Absolute.ABS_X, 255), syn(), event(KEY, Key.BTN_SOUTH, 1), syn(),
+              event(ABS, Absolute.ABS_X, 0)]
+    assert [(e.code, e.value) for e in pipeline.stream(events)] == [
+        (Absolute.ABS_X, 100.0), (Synchronization.SYN_REPORT, 0), (Absolute.ABS_X, -100.0),
+    ]
+    # steps added after use are taken into account
+    pipeline.filter({KEY: None})
+    assert pipeline.process([event(ABS, Absolute.ABS_X, 255), syn()]) == []
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.record` module."""
+
+import pytest
+
+from enjoy.input import EventType, Absolute
+from enjoy.record import EVENT, Recorder, Recording
+
+
+def make_events(n, start_us=0, step_us=1000):
+    data = b''
+    for i in range(n):
+        t = start_us + i * step_us
+        data += EVENT.pack(t // 1000000, t % 1000000,
+                           EventType.EV_ABS, Absolute.ABS_X, i)
+    return data
+
+
+@pytest.fixture(params=[True, False], ids=['closed', 'unclosed'])
+def recording(request, tmp_path):
+    filename = str(tmp_path / 'session.rec')
+    recorder = Recorder(filename, dict(name='pad'), index_stride=16)
+    data = make_events(100)
+    # odd sized batches to exercise the index bookkeeping
+    for i in range(0, 100, 7):
+        recorder.write(data[i * EVENT.size:(i + 7) * EVENT.size])
+    if request.param:
+        recorder.close()
+    else:
+        recorder.flush()
+    with Recording(filename) as rec:
+        yield rec
+    recorder.close()
+
+
+def test_read(recording):
+    assert recording.metadata == dict(name='pad')
+    assert len(recording) == 100
+    assert recording[10] == (0, 10000, EventType.EV_ABS, Absolute.ABS_X, 10)
+    assert recording[-1][-1] == 99
+    with pytest.raises(IndexError):
+        recording[100]
+
+
+def test_index(recording):
+    if recording.index:
+        assert [record for _, record in recording.index] == list(range(0, 100, 16))
+
+
+def test_find_and_ranges(recording):
+    assert recording.find(0) == 0
+    assert recording.find(10 * 1000000) == 10
+    assert recording.find(10 * 1000000 + 1) == 11
+    assert recording.find(10 ** 12) == 100
+    values = [item[-1] for item in recording.raw(20 * 1000000, 25 * 1000000)]
+    assert values == [20, 21, 22, 23, 24]
+    events = list(recording.events(start=98 * 1000000))
+    assert [event.value for event in events] == [98, 99]
+    assert events[0].code == Absolute.ABS_X
+    assert events[0].time == pytest.approx(0.098)
+
+
+def test_invalid_batch(tmp_path):
+    with Recorder(str(tmp_path / 'x.rec')) as recorder:
+        with pytest.raises(ValueError):
+            recorder.write(b'123')
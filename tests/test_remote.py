@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.remote` module."""
+
+import pytest
+
+from enjoy.input import (
+    InputDevice, EventType, Key, Absolute, Relative, Synchronization,
+    read_events
+)
+from enjoy.fake import fake_gamepad
+from enjoy.remote import (
+    Forwarder, Receiver, TCP, UDP, coalesce, encode_frames, decode_frames,
+    write_varint, read_varint, zigzag, unzigzag
+)
+
+LOOPBACK = ('127.0.0.1', 0)
+
+ABS, REL, KEY = EventType.EV_ABS, EventType.EV_REL, EventType.EV_KEY
+
+
+def test_varint():
+    for value in (0, 1, 127, 128, 300, 2**40):
+        out = bytearray()
+        write_varint(out, value)
+        assert read_varint(out, 0) == (value, len(out))
+    for value in (0, -1, 1, -2**31, 2**31 - 1):
+        assert unzigzag(zigzag(value)) == value
+
+
+def test_codec_and_coalesce():
+    frames = [
+        (1000, [(ABS, Absolute.ABS_X, 10), (REL, Relative.REL_X, 1)]),
+        (2000, [(ABS, Absolute.ABS_X, 20), (REL, Relative.REL_X, 2)]),
+        (3000, [(KEY, Key.BTN_SOUTH, 1)]),
+        (4000, [(ABS, Absolute.ABS_Y, -5)]),
+    ]
+    data = encode_frames(frames, bytearray())
+    assert decode_frames(data) == (frames, len(data))
+    # axis event: type + code + value
+    assert len(data) < 24 * 6
+    merged = coalesce(frames)
+    assert merged == [
+        (2000, [(ABS, Absolute.ABS_X, 20), (REL, Relative.REL_X, 3)]),
+        (3000, [(KEY, Key.BTN_SOUTH, 1)]),
+        (4000, [(ABS, Absolute.ABS_Y, -5)]),
+    ]
+
+
+@pytest.mark.parametrize('protocol', [TCP, UDP])
+def test_loopback(protocol):
+    fake = fake_gamepad()
+    with Receiver(LOOPBACK, protocol=protocol) as receiver, InputDevice(fake) as pad:
+        with Forwarder(pad, receiver.address, protocol=protocol) as forwarder:
+            fake.emit([(KEY, Key.BTN_SOUTH, 1), (ABS, Absolute.ABS_X, 0)],
+                      timestamp=5000000000)
+            fake.emit([(ABS, Absolute.ABS_X, 255)], timestamp=5001000000)
+            forwarder.forward(read_events(pad.fileno()))
+            if protocol == UDP:
+                # a lost datagram
+                forwarder.seq += 1
+            fake.emit([(KEY, Key.BTN_SOUTH, 0)], timestamp=5002000000)
+            forwarder.forward(read_events(pad.fileno()))
+        events = [(e.time, e.type, e.code, e.value)
+                  for e in receiver.event_stream(timeout=0.5)]
+        assert receiver.metadata['name'] == 'enjoy fake gamepad'
+        virtual = receiver.virtual_device()
+        assert Key.BTN_SOUTH in virtual.capabilities[KEY]
+    SYN = EventType.EV_SYN
+    expected = [
+        (5.0, KEY, Key.BTN_SOUTH, 1), (5.0, ABS, Absolute.ABS_X, 0),
+        (5.0, SYN, Synchronization.SYN_REPORT, 0),
+        (5.001, ABS, Absolute.ABS_X, 255),
+        (5.001, SYN, Synchronization.SYN_REPORT, 0),
+    ]
+    if protocol == UDP:
+        expected.append((5.002, SYN, Synchronization.SYN_DROPPED, 0))
+        assert receiver.lost == 1
+    expected += [(5.002, KEY, Key.BTN_SOUTH, 0),
+                 (5.002, SYN, Synchronization.SYN_REPORT, 0)]
+    assert [(pytest.approx(t), *rest) for t, *rest in events] == expected
+
+
+def test_udp_forwarder_restart():
+    fake = fake_gamepad()
+    with Receiver(LOOPBACK, protocol=UDP) as receiver, InputDevice(fake) as pad:
+        with Forwarder(pad, receiver.address, protocol=UDP) as forwarder:
+            forwarder.seq = 5000
+            fake.emit([(KEY, Key.BTN_SOUTH, 1)])
+            forwarder.forward(read_events(pad.fileno()))
+            # restart without hello (ex: hello datagram lost)
+            forwarder.seq = 0
+            fake.emit([(KEY, Key.BTN_SOUTH, 0)])
+            forwarder.forward(read_events(pad.fileno()))
+            # restart with hello
+            forwarder.close()
+            forwarder.connect()
+            forwarder.seq = 0
+            fake.emit([(KEY, Key.BTN_EAST, 1)])
+            forwarder.forward(read_events(pad.fileno()))
+        events = [(e.code, e.value) for e in receiver.event_stream(timeout=0.5)
+                  if e.type == KEY]
+    assert events == [(Key.BTN_SOUTH, 1), (Key.BTN_SOUTH, 0), (Key.BTN_EAST, 1)]
+    assert receiver.late == 0
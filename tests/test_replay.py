@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.replay` module."""
+
+import time
+import asyncio
+
+import pytest
+
+from enjoy.input import (
+    EventType, Absolute, Synchronization, event_stream, async_event_stream
+)
+from enjoy.record import EVENT, Recorder, Recording
+from enjoy.replay import Replayer, frames, schedule
+
+
+@pytest.fixture
+def recording(tmp_path):
+    """10 frames of 2 events (ABS_X + SYN_REPORT) 10ms apart"""
+    filename = str(tmp_path / 'session.rec')
+    with Recorder(filename) as recorder:
+        for i in range(10):
+            usec = i * 10000
+            recorder.write(
+                EVENT.pack(1, usec, EventType.EV_ABS, Absolute.ABS_X, i) +
+                EVENT.pack(1, usec, EventType.EV_SYN, Synchronization.SYN_REPORT, 0))
+    with Recording(filename) as rec:
+        yield rec
+
+
+def test_frames(recording):
+    result = list(frames(recording))
+    assert len(result) == 10
+    assert result[1][0] == 1010000000
+    assert [item[-1] for item in result[3][1]] == [3, 0]
+
+
+def test_schedule_uses_absolute_deadlines(recording):
+    now = [0]
+
+    def sleep(seconds):
+        # oversleep by 1ms every time: must not accumulate
+        now[0] += int(seconds * 1e9) + 1000000
+
+    lags = [lag for lag, _ in schedule(recording, speed=1, clock=lambda: now[0],
+                                       sleep=sleep)]
+    assert lags == [0] + 9 * [1000000]
+    assert now[0] == 91000000
+
+
+def test_event_stream(recording):
+    with Replayer(recording, speed=None) as replayer:
+        events = list(event_stream(replayer.fileno()))
+    assert len(events) == 20
+    assert [e.value for e in events if e.type == EventType.EV_ABS] == list(range(10))
+    assert replayer.frames == 10
+
+
+def test_async_event_stream(recording):
+    async def consume(fd):
+        return [event async for event in async_event_stream(fd)]
+
+    with Replayer(recording, speed=10) as replayer:
+        start = time.monotonic()
+        events = asyncio.run(consume(replayer.fileno()))
+        elapsed = time.monotonic() - start
+    assert len(events) == 20
+    # 90ms of recording at 10x
+    assert 0.008 < elapsed < 0.5
+
+
+def test_close_during_gap(recording):
+    # 10ms frames at 1/1000 speed: 10s between frames
+    replayer = Replayer(recording, speed=0.001)
+    replayer.start()
+    time.sleep(0.01)
+    start = time.monotonic()
+    replayer.close()
+    assert time.monotonic() - start < 1
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.rumble` module."""
+
+import time
+import asyncio
+
+import pytest
+
+from enjoy.input import InputDevice
+from enjoy.fake import fake_gamepad
+from enjoy.rumble import RumbleScheduler
+
+
+@pytest.fixture
+def pads():
+    fakes = [fake_gamepad(), fake_gamepad()]
+    devices = [InputDevice(fake) for fake in fakes]
+    for device in devices:
+        device.open()
+    yield list(zip(fakes, devices))
+    for device in devices:
+        device.close()
+
+
+def magnitudes(fake):
+    (effect,) = fake.effects.values()
+    return effect.u.rumble.strong_magnitude, effect.u.rumble.weak_magnitude
+
+
+def test_merge_and_threshold(pads):
+    (fake, pad), _ = pads
+    scheduler = RumbleScheduler(threshold=0x100)
+    for value in range(0, 0x8000, 0x10):
+        scheduler.set(pad, value, value)
+    scheduler.tick(now=0)
+    # only the last request of the frame is uploaded
+    assert scheduler.uploads == 1
+    assert magnitudes(fake) == (0x7ff0, 0x7ff0)
+    (effect_id,) = fake.effects
+    assert fake.playing[effect_id] == 1
+
+    # below threshold: nothing
+    scheduler.set(pad, 0x7ff0 + 0x80, 0x7ff0)
+    scheduler.tick(now=0.01)
+    assert scheduler.uploads == 1
+
+    # above threshold: in place update of the same effect
+    scheduler.set(pad, 0x1000, 0x7ff0)
+    scheduler.tick(now=0.02)
+    assert scheduler.uploads == 2
+    assert list(fake.effects) == [effect_id]
+    assert magnitudes(fake) == (0x1000, 0x7ff0)
+
+    scheduler.stop(pad)
+    scheduler.tick(now=0.03)
+    assert fake.playing[effect_id] == 0
+    assert scheduler.plays == 1
+
+
+def test_keepalive(pads):
+    (fake, pad), _ = pads
+    scheduler = RumbleScheduler(length=100)
+    scheduler.set(pad, 0x8000, 0)
+    scheduler.tick(now=0)
+    scheduler.tick(now=0.01)
+    assert scheduler.plays == 1
+    scheduler.tick(now=0.06)
+    assert scheduler.plays == 2
+
+
+def test_thread_several_devices(pads):
+    scheduler = RumbleScheduler(rate=200)
+    scheduler.start()
+    try:
+        for i, (_, pad) in enumerate(pads):
+            scheduler.set(pad, 0x1000 * (i + 1), 0)
+        time.sleep(0.05)
+    finally:
+        scheduler.close()
+    for fake, _ in pads:
+        assert not fake.effects
+        assert set(fake.playing.values()) <= {0}
+    assert scheduler.uploads == 2
+
+
+def test_failing_device(pads, monkeypatch):
+    (gone, gone_pad), (fake, pad) = pads
+
+    def unplugged(request, arg=0):
+        raise OSError(19, 'No such device')
+
+    monkeypatch.setattr(gone, 'ioctl', unplugged)
+    scheduler = RumbleScheduler(rate=200)
+    scheduler.start()
+    try:
+        scheduler.set(gone_pad, 0x8000, 0)
+        scheduler.set(pad, 0x8000, 0)
+        time.sleep(0.02)
+        assert fake.effects and scheduler._thread.is_alive()
+        scheduler.set(pad, 0x1000, 0)
+        time.sleep(0.02)
+        assert magnitudes(fake) == (0x1000, 0)
+    finally:
+        scheduler.close()
+    assert scheduler.errors == 1
+    assert not fake.effects
+
+
+def test_asyncio(pads):
+    (fake, pad), _ = pads
+    scheduler = RumbleScheduler(rate=200)
+
+    async def main():
+        task = asyncio.ensure_future(scheduler.run())
+        scheduler.set(pad, 0xFFFF, 0xFFFF)
+        await asyncio.sleep(0.03)
+        task.cancel()
+
+    asyncio.run(main())
+    assert magnitudes(fake) == (0xFFFF, 0xFFFF)
+    scheduler.close()
+    assert not fake.effects
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.sampler` module."""
+
+import time
+
+import pytest
+
+from enjoy.input import EventType, Key, Absolute, read_events
+from enjoy.sampler import Sampler
+
+
+def test_sample_and_hold(gamepad):
+    fake, device = gamepad
+    sampler = Sampler(device, axes=[Absolute.ABS_X], keys=[Key.BTN_SOUTH])
+    assert sampler.values == [128, 0]
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 3),
+               (EventType.EV_KEY, Key.BTN_SOUTH, 1),
+               (EventType.EV_KEY, Key.BTN_EAST, 1)])
+    # incomplete frame: not applied yet
+    fake.emit_raw(fake.pack([(EventType.EV_ABS, Absolute.ABS_X, 7)])[:-24])
+    sampler.process(read_events(device.fileno()))
+    assert sampler.values == [3, 1]
+
+
+def test_fixed_rate(gamepad):
+    fake, device = gamepad
+    samples = []
+    sampler = Sampler(device, rate=1000, axes=[Absolute.ABS_X], keys=[],
+                      callback=lambda tick, t, values: samples.append((tick, t, values)))
+    sampler.start()
+    time.sleep(0.05)
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 42)])
+    time.sleep(0.05)
+    sampler.close()
+    ticks = [tick for tick, _, _ in samples]
+    assert len(samples) > 20
+    assert ticks == sorted(set(ticks))
+    assert samples[0][2] == (128,) and samples[-1][2] == (42,)
+    assert sampler.jitter.count == len(samples)
+    # absolute deadlines: no drift
+    assert samples[-1][1] - samples[0][1] == pytest.approx(
+        (ticks[-1] - ticks[0]) * sampler.period, abs=sampler.period * 5)
+
+
+def test_ring(gamepad):
+    pytest.importorskip('numpy')
+    fake, device = gamepad
+    sampler = Sampler(device, axes=[Absolute.ABS_X, Absolute.ABS_Y], keys=[],
+                      ring_size=4)
+    for tick in range(6):
+        sampler.values[0] = tick
+        sampler.sample(tick * 10)
+    times, samples = sampler.latest()
+    assert list(times) == [20, 30, 40, 50]
+    assert list(samples[:, 0]) == [2, 3, 4, 5]
+    times, samples = sampler.latest(2)
+    assert list(times) == [40, 50]
+    # more than the ring holds: no duplicated rows
+    times, samples = sampler.latest(8)
+    assert list(times) == [20, 30, 40, 50]
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.shared` module."""
+
+import time
+import multiprocessing
+
+import pytest
+
+from enjoy.input import (
+    InputDevice, EventType, Key, Absolute, Synchronization, read_events,
+    event_struct
+)
+from enjoy.fake import fake_gamepad, fake_touchscreen
+from enjoy.shared import StatePublisher, StateReader, _SEQ
+
+
+def test_publish_and_snapshot():
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad, StatePublisher(pad) as publisher, \
+         StateReader(publisher.name) as reader:
+        state = reader.snapshot()
+        assert state.seq == 1
+        assert state.abs[Absolute.ABS_X] == 128
+        assert not state.keys
+        assert state.mt == {}
+
+        fake.emit([(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+                   (EventType.EV_ABS, Absolute.ABS_X, 3)], timestamp=12500000000)
+        publisher.process(read_events(pad.fileno()))
+        assert reader.seq == 2
+        state = reader.snapshot()
+        assert state.frames == 1
+        assert state.time_ns == 12500000000
+        assert state.keys == {Key.BTN_SOUTH}
+        assert state.abs[Absolute.ABS_X] == 3
+
+
+def test_multi_touch_and_resync():
+    fake = fake_touchscreen(nb_slots=4)
+    with InputDevice(fake) as screen, StatePublisher(screen) as publisher, \
+         StateReader(publisher.name) as reader:
+        assert reader.layout.nb_slots == 4
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_MT_SLOT, 1),
+                   (EventType.EV_ABS, Absolute.ABS_MT_TRACKING_ID, 7),
+                   (EventType.EV_ABS, Absolute.ABS_MT_POSITION_X, 100)])
+        publisher.process(read_events(screen.fileno()))
+        state = reader.snapshot()
+        assert list(state.mt[Absolute.ABS_MT_TRACKING_ID]) == [-1, 7, -1, -1]
+        assert state.mt[Absolute.ABS_MT_POSITION_X][1] == 100
+
+        # after SYN_DROPPED the kernel state is read back
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_MT_POSITION_X, 200)])
+        read_events(screen.fileno())
+        fake.emit_raw(
+            event_struct.pack(0, 0, EventType.EV_SYN, Synchronization.SYN_DROPPED, 0) +
+            event_struct.pack(0, 0, EventType.EV_SYN, Synchronization.SYN_REPORT, 0))
+        publisher.process(read_events(screen.fileno()))
+        assert reader.snapshot().mt[Absolute.ABS_MT_POSITION_X][1] == 200
+
+
+def test_snapshot_stalled_publisher():
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad, StatePublisher(pad) as publisher, \
+         StateReader(publisher.name) as reader:
+        # publisher "died" in the middle of a write: odd sequence number
+        _SEQ.pack_into(publisher._buff, publisher.layout.seq_offset, 3)
+        start = time.monotonic()
+        with pytest.raises(TimeoutError):
+            reader.snapshot(timeout=0.01)
+        assert time.monotonic() - start < 1
+        _SEQ.pack_into(publisher._buff, publisher.layout.seq_offset, 4)
+        assert reader.snapshot().seq == 2
+
+
+def _read_in_child(name, queue):
+    with StateReader(name) as reader:
+        state = reader.snapshot()
+        queue.put((state.seq, state.abs[Absolute.ABS_Y], list(state.keys)))
+
+
+def test_reader_in_other_process():
+    fake = fake_gamepad()
+    with InputDevice(fake) as pad, StatePublisher(pad) as publisher:
+        publisher.start()
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_Y, 42),
+                   (EventType.EV_KEY, Key.BTN_EAST, 1)])
+        start = time.monotonic()
+        while publisher.seq < 2 and time.monotonic() - start < 5:
+            time.sleep(0.001)
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=_read_in_child,
+                                        args=(publisher.name, queue))
+        child.start()
+        assert queue.get(timeout=10) == (2, 42, [Key.BTN_EAST])
+        child.join()
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.stats` module."""
+
+import time
+import asyncio
+
+import pytest
+
+from enjoy.input import (
+    EventType, Absolute, Synchronization, event_size,
+    event_stream, async_event_stream
+)
+from enjoy.stats import Histogram, LatencyStats, StreamStats
+
+
+def test_histogram_empty():
+    histogram = Histogram()
+    assert histogram.percentile(50) is None
+    assert histogram.summary()['count'] == 0
+
+
+def test_histogram_precision():
+    histogram = Histogram()
+    for value in range(1, 100001):
+        histogram.record(value * 1000)
+    assert histogram.count == 100000
+    assert histogram.min == 1000
+    assert histogram.max == 100000000
+    assert histogram.percentile(50) == pytest.approx(50000000, rel=0.02)
+    assert histogram.percentile(99) == pytest.approx(99000000, rel=0.02)
+    assert histogram.percentile(100) == histogram.max
+
+
+def test_histogram_fixed_memory_and_overflow():
+    histogram = Histogram(max_value=1000)
+    size = len(histogram.counts)
+    histogram.record(10 ** 12)
+    histogram.record(-5)
+    assert len(histogram.counts) == size
+    assert histogram.max == 10 ** 12
+    assert histogram.min == 0
+    assert histogram.percentile(100) == 10 ** 12
+
+
+def test_histogram_merge():
+    a, b = Histogram(), Histogram()
+    a.record(10)
+    b.record(1000)
+    a.merge(b)
+    assert (a.count, a.min, a.max) == (2, 10, 1000)
+
+
+@pytest.fixture
+def primed_pad(gamepad):
+    """gamepad device with 5 frames 5ms in the past, then EOF"""
+    fake, device = gamepad
+    for i in range(5):
+        fake.emit([(EventType.EV_ABS, Absolute.ABS_X, i)],
+                  timestamp=time.time_ns() - 5000000)
+    fake.close_source()
+    return device
+
+
+def check_latency(latency, nb_events=10):
+    for histogram in (latency.delivery, latency.handoff):
+        assert histogram.count == nb_events
+        assert 5000000 <= histogram.percentile(50) < 1000000000
+
+
+def test_event_stream_latency(primed_pad):
+    latency = LatencyStats()
+    assert len(list(event_stream(primed_pad.fileno(), latency=latency))) == 10
+    check_latency(latency)
+    assert latency.handoff.min >= latency.delivery.min
+
+
+def test_async_event_stream_latency(primed_pad):
+    latency = LatencyStats()
+
+    async def consume():
+        stream = async_event_stream(primed_pad.fileno(), latency=latency)
+        return [event async for event in stream]
+
+    assert len(asyncio.run(consume())) == 10
+    check_latency(latency)
+
+
+def test_device_latency(primed_pad):
+    primed_pad.latency = LatencyStats()
+    primed_pad.read_event()
+    check_latency(primed_pad.latency, 1)
+
+
+def test_event_stream_stats(primed_pad):
+    stats = StreamStats()
+    assert len(list(event_stream(primed_pad.fileno(), stats=stats))) == 10
+    assert stats.events == 10
+    assert stats.bytes == 10 * event_size
+    assert stats.reads == 1
+    assert stats.events_per_read == 10
+    assert stats.dropped == 0
+
+
+def test_stats_hooks(gamepad):
+    fake, device = gamepad
+    dropped, reads = [], []
+    stats = StreamStats(on_read=lambda s, events: reads.append(len(events)),
+                        on_dropped=dropped.append)
+    device.stats = stats
+    fake.emit([(EventType.EV_SYN, Synchronization.SYN_DROPPED, 0)])
+    fake.emit([(EventType.EV_ABS, Absolute.ABS_X, 1)])
+    device.read_event()
+    assert len(device.read_events()) == 3
+    assert reads == [1, 3]
+    assert dropped == [stats]
+    assert stats.dropped == 1
+
+
+def test_async_event_stream_backpressure(primed_pad):
+    stats = StreamStats()
+
+    async def consume():
+        events = []
+        stream = async_event_stream(primed_pad.fileno(), maxsize=4, stats=stats,
+                                    max_events=2)
+        async for event in stream:
+            events.append(event)
+            await asyncio.sleep(0.001)
+        return events
+
+    assert len(asyncio.run(consume())) == 10
+    assert stats.events == 10
+    assert stats.queue_high_water == 4
+    assert stats.stall_ns > 0
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the enjoy project
+#
+# Copyright (c) 2021 Tiago Coutinho
+# Distributed under the GPLv3 license. See LICENSE for more info.
+
+"""Tests for `enjoy.uinput` module."""
+
+from enjoy.input import InputDevice, EventType, Key, Synchronization, event_struct
+from enjoy.fake import fake_gamepad
+from enjoy.record import device_metadata
+from enjoy.uinput import VirtualDevice, pack_events
+
+
+def unpack(data):
+    return [item[2:] for item in event_struct.iter_unpack(data)]
+
+
+def test_pack_appends_syn_report():
+    data = pack_events([(EventType.EV_KEY, Key.BTN_SOUTH, 1)])
+    assert unpack(data) == [(EventType.EV_KEY, Key.BTN_SOUTH, 1),
+                            (EventType.EV_SYN, Synchronization.SYN_REPORT, 0)]
+
+
+def test_pack_keeps_syn_report():
+    batch = [(EventType.EV_KEY, Key.BTN_SOUTH, 0),
+             (EventType.EV_SYN, Synchronization.SYN_REPORT, 0)]
+    assert unpack(pack_events(batch)) == batch
+
+
+def test_pack_reuses_buffer():
+    buff = bytearray(10 * event_struct.size)
+    data = pack_events([(EventType.EV_KEY, Key.BTN_EAST, 1)], buff)
+    assert data.obj is buff
+    assert len(data) == 2 * event_struct.size
+    data = pack_events(20 * [(EventType.EV_KEY, Key.BTN_EAST, 1)], buff)
+    assert data.obj is not buff
+    assert len(data) == 21 * event_struct.size
+
+
+def test_clone_force_feedback():
+    with InputDevice(fake_gamepad(ff_effects_max=4)) as pad:
+        virtual = VirtualDevice.clone(pad)
+        metadata = device_metadata(pad)
+    assert EventType.EV_FF in virtual.capabilities
+    assert virtual.setup().ff_effects_max == 4
+    virtual = VirtualDevice.from_metadata(metadata)
+    assert virtual.setup().ff_effects_max == 4
+    # no effect slots: EV_FF is dropped (the kernel would refuse the device)
+    del metadata['ff_effects_max']
+    virtual = VirtualDevice.from_metadata(metadata)
+    assert EventType.EV_FF not in virtual.capabilities
+    assert virtual.setup().ff_effects_max == 0
+
+
+def test_no_force_feedback_slots():
+    virtual = VirtualDevice(fake_gamepad().capabilities)
+    assert EventType.EV_FF not in virtual.capabilities